@@ -5,27 +5,261 @@ import os
 import click
 db = SQLAlchemy()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', 'instance', 'database.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TRENDING_TTL_SECONDS'] = int(os.environ.get('TRENDING_TTL_SECONDS', 600))
+    app.config['TRENDING_MIN_NEW_REVIEWS'] = int(os.environ.get('TRENDING_MIN_NEW_REVIEWS', 5))
+    # trending = term counts decayed by age: half-life and how far back buckets count at all
+    app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+    app.config['TRENDING_WINDOW_DAYS'] = int(os.environ.get('TRENDING_WINDOW_DAYS', 30))
+    # set POSTPROCESS_ASYNC=0 to embed/tag reviews inline (e.g. when debugging)
+    app.config['POSTPROCESS_ASYNC'] = os.environ.get('POSTPROCESS_ASYNC', '1') != '0'
+    # trending topic model: LdaMulticore workers for full retrains, and how often to retrain regardless
+    app.config['TOPIC_MODEL_WORKERS'] = int(os.environ.get('TOPIC_MODEL_WORKERS', 1))
+    app.config['TOPIC_MODEL_RETRAIN_SECONDS'] = int(os.environ.get('TOPIC_MODEL_RETRAIN_SECONDS', 24 * 3600))
+    # trending topic terms from the LDA model (default) or from k-means themes over the review embeddings
+    app.config['TRENDING_TOPICS'] = os.environ.get('TRENDING_TOPICS', 'lda')  # lda | themes
+    app.config['THEMES_K'] = int(os.environ.get('THEMES_K', 12))
+    app.config['THEMES_K_PER_COLLEGE'] = int(os.environ.get('THEMES_K_PER_COLLEGE', 5))
+    app.config['THEMES_REFRESH_SECONDS'] = int(os.environ.get('THEMES_REFRESH_SECONDS', 60))
+    # how review vectors are stored: f32 (default) | f16 (half the size) | int8 (~quarter, per-vector scale)
+    app.config['EMBEDDING_CODEC'] = os.environ.get('EMBEDDING_CODEC', 'f32')
+    app.config['ANCHOR_CACHE_DIR'] = os.environ.get('ANCHOR_CACHE_DIR')  # default instance/anchor_cache
+    app.config['ANCHOR_SCORING'] = os.environ.get('ANCHOR_SCORING', 'centroid')  # centroid | segment
+    app.config['TAG_STORE_PATH'] = os.environ.get('TAG_STORE_PATH')  # default instance/tag_embeddings.npz
+    app.config['MODEL_LOADING'] = os.environ.get('MODEL_LOADING', 'lazy')  # lazy | warm | prefork
+    # sentence encoder: torch (default) | onnx | onnx-int8 (needs `flask export-onnx` first)
+    app.config['ENCODER_BACKEND'] = os.environ.get('ENCODER_BACKEND', 'torch')
+    app.config['ONNX_MODEL_DIR'] = os.environ.get('ONNX_MODEL_DIR')  # default <instance>/onnx/<model>
+    app.config['ENCODER_THREADS'] = int(os.environ.get('ENCODER_THREADS', 0)) or None  # onnxruntime intra-op
+    # micro-batch concurrent encode calls: off | batch (per process) | socket (`flask encoder-server`)
+    app.config['ENCODE_SERVICE'] = os.environ.get('ENCODE_SERVICE', 'off')
+    app.config['ENCODE_MAX_BATCH'] = int(os.environ.get('ENCODE_MAX_BATCH', 64))
+    app.config['ENCODE_MAX_WAIT_MS'] = float(os.environ.get('ENCODE_MAX_WAIT_MS', 2.0))
+    app.config['ENCODER_SOCKET'] = os.environ.get('ENCODER_SOCKET')  # default <instance>/encoder.sock
+    # SQLite: WAL + synchronous=NORMAL + mmap + busy timeout (see schema.configure_sqlite)
+    app.config['SQLITE_TUNING'] = os.environ.get('SQLITE_TUNING', '1') != '0'
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    # rendered-page cache for /, /colleges and profiles: memory (per worker) | sqlite (shared) | off
+    app.config['PAGE_CACHE'] = os.environ.get('PAGE_CACHE', 'memory')
+    app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+    # /metrics counters + timings (METRICS=0 turns them off); PROFILING=1 allows ?profile=<PROFILING_TOKEN>
+    app.config['METRICS'] = os.environ.get('METRICS', '1') != '0'
+    app.config['PROFILING'] = os.environ.get('PROFILING', '0') == '1'
+    app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN', '')  # required for PROFILING
+    if config:
+        app.config.update(config)  # overrides (e.g. a temp database for benchmarks)
 
     db.init_app(app)
 
+    from .metrics import metrics
+    metrics.init_app(app)
+
     # Make `json.loads` available as a filter called 'fromjson'
     app.jinja_env.filters['fromjson'] = json.loads
 
     from .routes import main
     app.register_blueprint(main)
 
+    from . import recommender_utils
+    recommender_utils.init_app(app)
+
+    from .tag_embedding_store import tag_store
+    tag_store.init_app(app)
+
+    from .topic_model import topic_model
+    topic_model.init_app(app)
+
+    from .theme_engine import theme_engine
+    theme_engine.init_app(app)
+
+    from .trending import trending
+    trending.init_app(app)
+
+    from .embedding_index import embedding_index
+    embedding_index.init_app(app)
+
+    from .page_cache import page_cache
+    page_cache.init_app(app)
+
+    from .jobs import postprocess_queue
+    postprocess_queue.init_app(app)
+
+    from . import model_registry
+    model_registry.init_app(app)
+
     with app.app_context():
-        db.create_all()
+        from .schema import configure_sqlite, migrate_schema
+        configure_sqlite(app, db.engine)
+        migrate_schema(db)  # create_all + columns/indexes added since the db file was created
+        from .aggregate_utils import backfill_aggregates_if_empty
+        backfill_aggregates_if_empty()  # databases created before college_aggregate existed
+        from .tag_index import backfill_if_empty
+        backfill_if_empty()  # ... or before review_tag existed
     @app.cli.command("embed-all")
-    def embed_all_cmd():
+    @click.option("--batch-size", default=64, show_default=True, help="Texts per model.encode batch.")
+    @click.option("--chunk-size", default=512, show_default=True, help="Reviews per transaction/checkpoint.")
+    @click.option("--force", is_flag=True, help="Re-embed even rows that are already current.")
+    @click.option("--restart", is_flag=True, help="Ignore the saved checkpoint and start from the first review.")
+    def embed_all_cmd(batch_size, chunk_size, force, restart):
         """Embed all reviews and store vectors."""
         from .embedding_utils import batch_embed_all
         click.echo("⏳ Embedding all reviews...")
-        batch_embed_all()
-        click.echo("✅ Done embedding.")
+        stats = batch_embed_all(batch_size=batch_size, chunk_size=chunk_size,
+                                force=force, restart=restart, log=click.echo)
+        click.echo(f"✅ Done embedding: {stats['embedded']} embedded, {stats['skipped']} already current, "
+                   f"{stats['seen']} reviews in {stats['seconds']}s ({stats['per_sec']} reviews/sec).")
+
+    @app.cli.command("export-embeddings")
+    @click.argument("path", type=click.Path(dir_okay=False))
+    @click.option("--codec", type=click.Choice(["f32", "f16", "int8"]), help="Defaults to EMBEDDING_CODEC.")
+    def export_embeddings_cmd(path, codec):
+        """Dump all review vectors to one .npz file."""
+        from .embedding_utils import export_embeddings
+        n = export_embeddings(path, codec=codec)
+        click.echo(f"✅ Exported {n} vectors to {path} ({os.path.getsize(path) / 1e6:.1f} MB).")
+
+    @app.cli.command("import-embeddings")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def import_embeddings_cmd(path):
+        """Load vectors from an export-embeddings file instead of re-running the model."""
+        from .embedding_utils import import_embeddings
+        stats = import_embeddings(path)
+        click.echo(f"✅ Imported {stats['imported']} vectors ({stats['skipped']} stale or orphaned, skipped).")
+
+    @app.cli.command("export-onnx")
+    @click.option("--quantize", is_flag=True, help="Also write a dynamically quantized int8 model.")
+    @click.option("--min-cosine", type=float,
+                  help="Fail if any parity text scores below this (default 0.99 onnx, 0.98 onnx-int8).")
+    def export_onnx_cmd(quantize, min_cosine):
+        """Export the sentence encoder to ONNX for ENCODER_BACKEND=onnx / onnx-int8."""
+        from . import model_registry
+        from .onnx_encoder import MIN_COSINE, MODEL_FILES, OnnxSentenceEncoder, export, parity
+        click.echo(f"⏳ Exporting {model_registry.SENTENCE_MODEL_NAME} to ONNX...")
+        directory = export(model_registry.SENTENCE_MODEL_NAME, model_registry.onnx_model_dir(app), quantize=quantize)
+        model_registry.configure_encoder("torch")
+        reference = model_registry.get_sentence_model()
+        sentences = ["great dorms and friendly people", "the parking situation is terrible",
+                     "strong computer science program but tough grading", "campus food is okay"]
+        failed = False
+        for backend in (["onnx", "onnx-int8"] if quantize else ["onnx"]):
+            lo, mean = parity(reference, OnnxSentenceEncoder(directory, backend=backend), sentences)
+            size = os.path.getsize(os.path.join(directory, MODEL_FILES[backend])) / 1e6
+            threshold = MIN_COSINE[backend] if min_cosine is None else min_cosine
+            ok = lo >= threshold
+            failed |= not ok
+            click.echo(f"{'✅' if ok else '❌'} {backend}: {size:.1f} MB, cosine vs torch min {lo:.4f} / "
+                       f"mean {mean:.4f} (need >= {threshold})")
+        if failed:
+            raise SystemExit(1)
+        click.echo(f"Set ENCODER_BACKEND={'onnx-int8' if quantize else 'onnx'} to use it ({directory}).")
+
+    @app.cli.command("encoder-server")
+    def encoder_server_cmd():
+        """Serve the sentence encoder over a Unix socket for ENCODE_SERVICE=socket workers."""
+        from . import model_registry
+        from .encode_service import EncodeBatcher, serve
+        path = model_registry.encoder_socket(app)
+        model_registry.set_encode_service(None)  # this process is the service
+        model_registry.warm_up(("sentence",))
+        batcher = EncodeBatcher(model_registry.encode_direct, max_batch=app.config['ENCODE_MAX_BATCH'],
+                                max_wait_ms=app.config['ENCODE_MAX_WAIT_MS'])
+        click.echo(f"⏳ Encoder ({app.config['ENCODER_BACKEND']}) starting on {path}")
+        try:
+            serve(batcher, path)
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc))
+
+    @app.cli.command("migrate-db")
+    def migrate_db_cmd():
+        """Add tables, columns and indexes that an older instance/database.db is missing."""
+        from .schema import migrate_schema
+        migrate_schema(db)
+        mode = db.session.execute(db.text("PRAGMA journal_mode")).scalar()
+        click.echo(f"✅ Schema up to date (journal_mode={mode}).")
+
+    @app.cli.command("rebuild-aggregates")
+    @click.option("--check", is_flag=True, help="Compare against a full scan of the review table afterwards.")
+    def rebuild_aggregates_cmd(check):
+        """Recompute per-college aggregates from scratch (backfills / repairs)."""
+        from .aggregate_utils import rebuild_aggregates, check_aggregates
+        click.echo("⏳ Rebuilding college aggregates...")
+        n = rebuild_aggregates()
+        click.echo(f"✅ Rebuilt aggregates for {n} colleges.")
+        if check:
+            mismatches = check_aggregates()
+            for name, expected, actual in mismatches:
+                click.echo(f"❌ {name}: expected {expected}, got {actual}")
+            if mismatches:
+                raise SystemExit(1)
+            click.echo("✅ Aggregates match a full recomputation.")
+
+    @app.cli.command("rebuild-index")
+    def rebuild_index_cmd():
+        """Rewrite the memory-mapped review vector index from review_embedding."""
+        from .embedding_index import embedding_index
+        n = embedding_index.rebuild()
+        click.echo(f"✅ Indexed {n} review vectors.")
+
+    @app.cli.command("backfill-tags")
+    @click.option("--chunk-size", default=1000, show_default=True, help="Reviews read per query.")
+    def backfill_tags_cmd(chunk_size):
+        """Rebuild the review_tag index and per-college tag counts from the JSON tags column."""
+        from .tag_index import rebuild
+        click.echo("⏳ Indexing review tags...")
+        n = rebuild(chunk_size=chunk_size)
+        click.echo(f"✅ Indexed tags of {n} reviews.")
+
+    @app.cli.command("tokenize-all")
+    @click.option("--batch-size", default=256, show_default=True, help="Texts per nlp.pipe batch.")
+    @click.option("--n-process", default=1, show_default=True, help="spaCy worker processes.")
+    def tokenize_all_cmd(batch_size, n_process):
+        """Parse reviews with spaCy once and cache their tokens (missing/stale rows only)."""
+        from .nlp_utils import backfill_review_tokens
+        click.echo("⏳ Tokenizing reviews...")
+        n = backfill_review_tokens(batch_size=batch_size, n_process=n_process)
+        click.echo(f"✅ Parsed {n} reviews.")
+
+    @app.cli.command("ingest")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--chunk-size", default=1000, show_default=True, help="Records per transaction.")
+    @click.option("--batch-size", default=64, show_default=True, help="Texts per nlp.pipe / model.encode batch.")
+    @click.option("--no-embed", is_flag=True, help="Skip the embedding pass (run embed-all later).")
+    def ingest_cmd(path, chunk_size, batch_size, no_embed):
+        """Bulk-load scraped posts from a JSONL dump into reviews (deduped, tagged, embedded)."""
+        from .ingest import ingest_jsonl
+        click.echo(f"⏳ Ingesting {path}...")
+        result = ingest_jsonl(path, chunk_size=chunk_size, batch_size=batch_size, embed=not no_embed, log=click.echo)
+        click.echo(f"✅ Inserted {result['inserted']} reviews ({result['duplicates']} duplicates, "
+                   f"{result['unmapped']} without a college, {result['malformed']} malformed lines).")
+        for name, stage in result["stages"].items():
+            click.echo(f"   {name:>7}: {stage['items']} in {stage['seconds']}s ({stage['per_sec']}/sec)")
+
+    @app.cli.command("process-jobs")
+    def process_jobs_cmd():
+        """Run queued review post-processing (tags, tokens, embeddings) in the foreground."""
+        from .jobs import postprocess_queue
+        n = postprocess_queue.drain()
+        click.echo(f"✅ Processed {n} jobs. Queue: {postprocess_queue.status_counts()}")
+
+    @app.cli.command("retrain-topics")
+    def retrain_topics_cmd():
+        """Retrain the trending topic model from scratch (otherwise it's updated incrementally)."""
+        from .topic_model import topic_model
+        if not topic_model.available:
+            raise click.ClickException("gensim is not installed")
+        click.echo("⏳ Training topic model...")
+        n = topic_model.retrain()
+        click.echo(f"✅ Trained on {n} reviews.")
+
+    @app.cli.command("refresh-trending")
+    def refresh_trending_cmd():
+        """Recompute trending hashtags once in the foreground (sanity check / debugging)."""
+        from .trending import trending
+        trending.refresh_now()
+        click.echo("🔥 " + " ".join(trending.get_global()))
     return app
\ No newline at end of file
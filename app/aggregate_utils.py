@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from .models import Review, CollegeAggregate, RatingBucket
+from .metrics import metrics
+
+RATING_CATEGORIES = ['food', 'social', 'clubs', 'study', 'opportunities']
+
+
+def calculate_avg_ratings(reviews):
+    avg_ratings = {}
+    for category in RATING_CATEGORIES:
+        values = [getattr(r, category) for r in reviews if getattr(r, category) not in (None, 0)]
+        if values:
+            avg_ratings[category] = round(sum(values) / len(values), 1)
+        else:
+            avg_ratings[category] = None  # None means not rated yet
+    return avg_ratings
+
+
+def _review_deltas(review):
+    """Column increments one review contributes to its college's aggregate row."""
+    deltas = {"review_count": 1}
+    for category in RATING_CATEGORIES:
+        value = getattr(review, category)
+        if value not in (None, 0):
+            deltas[f"{category}_sum"] = value
+            deltas[f"{category}_count"] = 1
+
+    # per-review average only skips None (0 still counts), like the old get_college_stats loop
+    valid_scores = [getattr(review, c) for c in RATING_CATEGORIES if getattr(review, c) is not None]
+    if valid_scores:
+        deltas["review_avg_sum"] = sum(valid_scores) / len(valid_scores)
+        deltas["review_avg_count"] = 1
+    return deltas
+
+
+def _merge_deltas(total, deltas):
+    for col, value in deltas.items():
+        total[col] = total.get(col, 0) + value
+    return total
+
+
+def _increment(college_name, deltas, day=None):
+    """
+    Atomic `col = col + delta` upsert into the college's aggregate row, or into its
+    rating_bucket row for `day` when given; runs inside the caller's transaction.
+    """
+    model, key = (CollegeAggregate, {"college_name": college_name}) if day is None else \
+        (RatingBucket, {"college_name": college_name, "day": day})
+    db.session.execute(
+        sqlite_insert(model).values(**key).on_conflict_do_nothing(index_elements=list(key))
+    )
+    table = model.__table__
+    db.session.execute(
+        table.update()
+        .where(*(table.c[col] == value for col, value in key.items()))
+        .values({col: table.c[col] + value for col, value in deltas.items()})
+    )
+
+
+def _review_day(review):
+    return (getattr(review, "created_at", None) or datetime.utcnow()).date()
+
+
+def apply_review(review):
+    """
+    Fold a new review into its college's aggregate and its day's rating bucket.
+    Does NOT commit: call it before the commit that inserts the review so both land together.
+    """
+    deltas = _review_deltas(review)
+    _increment(review.college_name, deltas)
+    _increment(review.college_name, deltas, day=_review_day(review))
+
+
+def apply_reviews(reviews):
+    """Same as apply_review, but merges a whole batch into one UPDATE per college (and day)."""
+    per_college, per_day = {}, {}
+    for r in reviews:
+        deltas = _review_deltas(r)
+        _merge_deltas(per_college.setdefault(r.college_name, {}), deltas)
+        _merge_deltas(per_day.setdefault((r.college_name, _review_day(r)), {}), deltas)
+    for college_name, deltas in per_college.items():
+        _increment(college_name, deltas)
+    for (college_name, day), deltas in per_day.items():
+        _increment(college_name, deltas, day=day)
+
+
+def reset_aggregates():
+    """Drop all aggregate and rating-bucket rows (does NOT commit)."""
+    CollegeAggregate.query.delete()
+    RatingBucket.query.delete()
+
+
+def rebuild_aggregates(chunk_size=1000):
+    """Recompute every aggregate and rating bucket from the review table, streaming reviews in chunks."""
+    reset_aggregates()
+    columns = [Review.college_name, Review.created_at] + [getattr(Review, c) for c in RATING_CATEGORIES]
+    totals, per_day = {}, {}
+    for row in db.session.query(*columns).yield_per(chunk_size):
+        deltas = _review_deltas(row)
+        _merge_deltas(totals.setdefault(row.college_name, {}), deltas)
+        if row.created_at is not None:  # reviews from before timestamps existed have no day to chart
+            _merge_deltas(per_day.setdefault((row.college_name, row.created_at.date()), {}), deltas)
+    for college_name, deltas in totals.items():
+        _increment(college_name, deltas)
+    for (college_name, day), deltas in per_day.items():
+        _increment(college_name, deltas, day=day)
+    db.session.commit()
+    return len(totals)
+
+
+def rating_trend(college_name, days=90):
+    """
+    Daily category averages for one college over the last `days` days, oldest first:
+    [{"day": "2026-10-01", "reviews": 3, "averages": {...}}], read from rating_bucket only.
+    """
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    buckets = (RatingBucket.query.filter(RatingBucket.college_name == college_name, RatingBucket.day >= since)
+               .order_by(RatingBucket.day))
+    return [{"day": b.day.isoformat(), "reviews": b.review_count, "averages": category_averages(b)}
+            for b in buckets]
+
+
+def backfill_aggregates_if_empty():
+    """One-off rebuild for databases that have reviews but no aggregate rows yet."""
+    if CollegeAggregate.query.first() is None and Review.query.first() is not None:
+        rebuild_aggregates()
+
+
+def get_aggregates():
+    """All aggregate rows keyed by college name (one query)."""
+    with metrics.span("sql_aggregates"):
+        return {a.college_name: a for a in CollegeAggregate.query.all()}
+
+
+def category_averages(agg):
+    """Same shape as calculate_avg_ratings(), read from an aggregate row (or None)."""
+    averages = {}
+    for category in RATING_CATEGORIES:
+        count = getattr(agg, f"{category}_count") if agg else 0
+        if count:
+            averages[category] = round(getattr(agg, f"{category}_sum") / count, 1)
+        else:
+            averages[category] = None
+    return averages
+
+
+def summarize(agg):
+    """
+    Returns (avg_score, category_ratings, has_few_ratings) for one college,
+    matching what get_college_stats used to compute from the full review list.
+    """
+    category_ratings = category_averages(agg)
+    num_valid_categories = sum(1 for score in category_ratings.values() if score is not None)
+
+    # Require at least 3 categories to be rated to include in Top-Rated
+    if agg and agg.review_avg_count and num_valid_categories >= 3:
+        avg_score = round(agg.review_avg_sum / agg.review_avg_count, 2)
+    else:
+        avg_score = None
+    review_count = agg.review_count if agg else 0
+    has_few_ratings = review_count < 3 or num_valid_categories < 3
+    return avg_score, category_ratings, has_few_ratings
+
+
+def _legacy_summary(reviews):
+    per_review_avgs = []
+    for r in reviews:
+        valid_scores = [s for s in (r.food, r.social, r.clubs, r.study, r.opportunities) if s is not None]
+        if valid_scores:
+            per_review_avgs.append(sum(valid_scores) / len(valid_scores))
+    category_ratings = calculate_avg_ratings(reviews)
+    num_valid_categories = sum(1 for score in category_ratings.values() if score is not None)
+    if per_review_avgs and num_valid_categories >= 3:
+        avg_score = round(sum(per_review_avgs) / len(per_review_avgs), 2)
+    else:
+        avg_score = None
+    has_few_ratings = len(reviews) < 3 or num_valid_categories < 3
+    return avg_score, category_ratings, has_few_ratings
+
+
+def check_aggregates():
+    """
+    Compare stored aggregates against the full-scan computation.
+    Returns a list of (college_name, expected, actual) for every mismatch.
+    """
+    aggregates = get_aggregates()
+    names = {name for (name,) in db.session.query(Review.college_name).distinct()}
+    mismatches = []
+    for name in sorted(names | set(aggregates)):
+        expected = _legacy_summary(Review.query.filter_by(college_name=name).all())
+        actual = summarize(aggregates.get(name))
+        if expected != actual:
+            mismatches.append((name, expected, actual))
+    return mismatches
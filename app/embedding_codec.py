@@ -0,0 +1,97 @@
+"""
+How review vectors are stored in review_embedding.vector.
+
+  - "f32":  raw float32 (4 bytes/dim, what every row written before codecs existed uses)
+  - "f16":  float16 (2 bytes/dim); plenty for normalized vectors
+  - "int8": a float32 scale followed by int8 codes (1 byte/dim + 4); v ≈ codes * scale,
+            with scale = max|v| / 127 chosen per vector
+
+Every row also records the codec, FORMAT_VERSION and the model that produced it, and
+decode() refuses rows that don't match what the caller expects instead of trusting `dim`.
+"""
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class EmbeddingFormatError(ValueError):
+    """A stored vector can't be used: wrong model, unknown codec/version or a malformed blob."""
+
+
+class Float32Codec:
+    name = "f32"
+    dtype = np.float32
+
+    def size(self, dim):
+        return dim * np.dtype(self.dtype).itemsize
+
+    def encode(self, vec):
+        return np.asarray(vec, dtype=self.dtype).tobytes()
+
+    def decode(self, blob, dim):
+        return np.frombuffer(blob, dtype=self.dtype, count=dim).astype(np.float32)
+
+    def encode_matrix(self, matrix):
+        """(n, d) float32 -> {name: array} for a bulk .npz export."""
+        return {"vectors": np.asarray(matrix, dtype=self.dtype)}
+
+    def decode_matrix(self, arrays):
+        return np.asarray(arrays["vectors"], dtype=np.float32)
+
+
+class Float16Codec(Float32Codec):
+    name = "f16"
+    dtype = np.float16
+
+
+class Int8Codec:
+    name = "int8"
+
+    def size(self, dim):
+        return 4 + dim
+
+    @staticmethod
+    def _quantize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        scales = np.abs(matrix).max(axis=-1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0  # all-zero vector: any scale decodes to zeros
+        codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def encode(self, vec):
+        codes, scale = self._quantize(np.asarray(vec, dtype=np.float32).ravel())
+        return scale.tobytes() + codes.tobytes()
+
+    def decode(self, blob, dim):
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, count=dim, offset=4).astype(np.float32) * scale
+
+    def encode_matrix(self, matrix):
+        codes, scales = self._quantize(matrix)
+        return {"vectors": codes, "scales": scales[:, 0]}
+
+    def decode_matrix(self, arrays):
+        return arrays["vectors"].astype(np.float32) * arrays["scales"][:, None].astype(np.float32)
+
+
+CODECS = {codec.name: codec for codec in (Float32Codec(), Float16Codec(), Int8Codec())}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise EmbeddingFormatError(f"unknown embedding codec {name!r} (expected one of {sorted(CODECS)})")
+
+
+def decode(blob, dim, codec="f32", version=FORMAT_VERSION, model=None, expected_model=None):
+    """One stored vector as float32, after checking it was written by `expected_model` in a known format."""
+    if expected_model is not None and model != expected_model:
+        raise EmbeddingFormatError(f"vector was made by {model!r}, expected {expected_model!r}")
+    if version != FORMAT_VERSION:
+        raise EmbeddingFormatError(f"unsupported embedding format version {version!r}")
+    codec = get_codec(codec)
+    if not dim or blob is None or len(blob) != codec.size(dim):
+        raise EmbeddingFormatError(f"{codec.name} blob of {0 if blob is None else len(blob)} bytes "
+                                   f"doesn't hold {dim} dims")
+    return codec.decode(blob, dim)
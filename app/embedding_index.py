@@ -0,0 +1,292 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import numpy as np
+from app import db
+from .models import Review, ReviewEmbedding
+from .embedding_codec import CODECS, FORMAT_VERSION, EmbeddingFormatError, decode
+from .model_registry import SENTENCE_MODEL_NAME
+
+_GENERATION = re.compile(r"^\d+-\d+-[0-9a-f]{8}$")
+
+
+class EmbeddingIndex:
+    """
+    All review vectors in one contiguous (n, d) float32 matrix for fast cosine search.
+
+    On disk each save is one generation: `review_vectors.<gen>.npy` (memory-mapped on load)
+    with `review_vectors.<gen>.ids.npy` / `.colleges.npy`, and a small JSON manifest
+    (`review_vectors.json`) that points at the current generation. New embeddings go into an
+    in-memory delta and are folded into a new generation once the delta grows past
+    `flush_every` rows. Vectors are stored normalized, so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, path=None, flush_every=256, keep_seconds=600):
+        self.path = path
+        self.flush_every = flush_every
+        self.keep_seconds = keep_seconds  # old generations stay this long for workers still mapping them
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._manifest_mtime = None
+        self._reset()
+
+    def init_app(self, app):
+        self.path = app.config.get(
+            "EMBEDDING_INDEX_PATH", os.path.join(app.instance_path, "review_vectors.npy")
+        )
+
+    def _reset(self):
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._colleges = np.zeros(0, dtype="U100")
+        self._dead = np.zeros(0, dtype=bool)  # rows superseded by a newer vector
+        self._delta_vecs, self._delta_ids, self._delta_colleges = [], [], []
+        self._delta_times = []  # time.time() each delta row was added (see _open_current_locked)
+        self._row_of = {}  # review_id -> ("base"|"delta", row)
+
+    # ---- files ----
+    def _sidecar(self, suffix):
+        base, _ = os.path.splitext(self.path)
+        return f"{base}.{suffix}"
+
+    def _manifest_path(self):
+        return self._sidecar("json")
+
+    def _manifest_changed(self):
+        try:
+            return os.path.getmtime(self._manifest_path()) != self._manifest_mtime
+        except OSError:
+            return True
+
+    def _save(self, matrix, ids, colleges, built_at=None):
+        """
+        Write a new generation under a name no other process uses, then swap the manifest in
+        last: readers see the whole old set of files or the whole new one, never a mix.
+        Returns (manifest, its mtime).
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        generation = f"{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        for suffix, arr in (("npy", matrix), ("ids.npy", ids), ("colleges.npy", colleges)):
+            with open(self._sidecar(f"{generation}.{suffix}"), "wb") as f:
+                np.save(f, arr)
+        manifest = {"generation": generation, "count": int(len(ids)),
+                    "dim": int(matrix.shape[1]) if matrix.size else 0, "built_at": built_at}
+        tmp = self._sidecar(f"{generation}.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path())
+        mtime = os.path.getmtime(self._manifest_path())
+        self._prune(generation)
+        return manifest, mtime
+
+    def _prune(self, current):
+        """Delete generations (and pre-generation files) that haven't been current for keep_seconds."""
+        directory = os.path.dirname(self.path)
+        stem = os.path.splitext(os.path.basename(self.path))[0] + "."
+        cutoff = time.time() - self.keep_seconds
+        for name in os.listdir(directory):
+            if not name.startswith(stem):
+                continue
+            generation = name[len(stem):].split(".", 1)[0]
+            legacy = name[len(stem):] in ("ids.npy", "colleges.npy") or name == os.path.basename(self.path)
+            if not legacy and (not _GENERATION.match(generation) or generation == current):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)  # a worker that still maps it keeps its pages (POSIX)
+            except OSError:
+                pass
+
+    def _load_files(self, manifest, mtime):
+        """Map the generation `manifest` points at. Raises (OSError/ValueError/KeyError) if it's unusable."""
+        generation = manifest["generation"]
+        matrix = np.load(self._sidecar(f"{generation}.npy"), mmap_mode="r")
+        ids = np.load(self._sidecar(f"{generation}.ids.npy"))
+        colleges = np.load(self._sidecar(f"{generation}.colleges.npy"))
+        if not (matrix.shape[0] == len(ids) == len(colleges) == manifest["count"]):
+            raise ValueError(f"index generation {generation} doesn't match its manifest")
+        self._reset()
+        self._matrix, self._ids, self._colleges = matrix, ids, colleges
+        self._dead = np.zeros(len(ids), dtype=bool)
+        self._row_of = {int(rid): ("base", i) for i, rid in enumerate(ids)}
+        self._manifest_mtime = mtime
+        self._loaded = True
+
+    def _open_current_locked(self, check_db):
+        """
+        Load whatever generation the manifest points at and re-apply this worker's unflushed
+        delta on top. After a rebuild only delta rows added since it read the database are
+        kept (earlier ones are in it, or their reviews were deleted). `check_db` also requires
+        the files to hold as many vectors as rebuild() would index now. False if unusable.
+        """
+        try:
+            mtime = os.path.getmtime(self._manifest_path())
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+            if check_db and manifest.get("count") != _usable(db.session.query(ReviewEmbedding.id)).count():
+                return False
+            delta = list(zip(self._delta_ids, self._delta_colleges, self._delta_vecs, self._delta_times))
+            self._load_files(manifest, mtime)
+        except (OSError, ValueError, KeyError):
+            return False
+        built_at = manifest.get("built_at")
+        for review_id, college_name, vec, added in delta:
+            if built_at is None or added > built_at:
+                self._add_locked(review_id, college_name, vec, added)
+        return True
+
+    # ---- building ----
+    def rebuild(self, chunk_size=5000):
+        """
+        Re-read every stored vector from the database and write a new generation.
+        Rows from another model or in an unreadable format are left out (embed-all redoes them).
+        """
+        built_at = time.time()
+        rows = (_usable(db.session.query(ReviewEmbedding.review_id, Review.college_name, ReviewEmbedding.dim,
+                                         ReviewEmbedding.vector, ReviewEmbedding.codec,
+                                         ReviewEmbedding.format_version, ReviewEmbedding.model))
+                .order_by(ReviewEmbedding.review_id)
+                .yield_per(chunk_size))
+        ids, colleges, vecs = [], [], []
+        for review_id, college_name, dim, blob, codec, version, model in rows:
+            try:
+                vec = decode(blob, dim, codec=codec or "f32", version=version or 1,
+                             model=model, expected_model=SENTENCE_MODEL_NAME)
+            except EmbeddingFormatError:  # _usable() already filters these; decode() has the last word
+                continue
+            ids.append(review_id)
+            colleges.append(college_name)
+            vecs.append(vec)
+        matrix = np.vstack(vecs).astype(np.float32) if vecs else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._load_files(*self._save(matrix, np.asarray(ids, dtype=np.int64),
+                                         np.asarray(colleges, dtype="U100"), built_at=built_at))
+        return len(ids)
+
+    def ensure_loaded(self):
+        """
+        Load from disk on first use (rebuilding if the files are missing, damaged or behind the
+        database), and switch to the new generation when another worker saved one.
+        """
+        if self._loaded and not self._manifest_changed():
+            return
+        with self._lock:
+            if self._loaded and not self._manifest_changed():
+                return
+            # first load: only trust files that match the database; later, another worker's
+            # generation is just newer than ours, so it is reloaded rather than rebuilt
+            if self._open_current_locked(check_db=not self._loaded):
+                return
+        self.rebuild()
+
+    # ---- incremental updates ----
+    def _add_locked(self, review_id, college_name, vec, added=None):
+        added = time.time() if added is None else added
+        where = self._row_of.get(review_id)
+        if where is not None and where[0] == "base":
+            self._dead[where[1]] = True
+        vec = np.asarray(vec, dtype=np.float32)
+        if where is not None and where[0] == "delta":
+            self._delta_vecs[where[1]] = vec
+            self._delta_colleges[where[1]] = college_name
+            self._delta_times[where[1]] = added
+            return
+        self._row_of[review_id] = ("delta", len(self._delta_ids))
+        self._delta_ids.append(review_id)
+        self._delta_colleges.append(college_name)
+        self._delta_vecs.append(vec)
+        self._delta_times.append(added)
+
+    def add(self, review_id, college_name, vec):
+        """Insert or replace one review's vector (called after upsert_review_embedding commits)."""
+        if not self._loaded:
+            return  # nothing loaded yet; the next search loads from disk/database anyway
+        with self._lock:
+            self._add_locked(review_id, college_name, vec)
+            if len(self._delta_ids) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._manifest_changed():
+            self._open_current_locked(check_db=False)  # build on another worker's newer flush, don't drop it
+        matrix, ids, colleges = self._snapshot_locked()
+        self._load_files(*self._save(matrix, ids, colleges))
+
+    def _snapshot_locked(self):
+        keep = ~self._dead
+        parts = [np.asarray(self._matrix)[keep]] if self._matrix.size else []
+        if self._delta_vecs:
+            parts.append(np.vstack(self._delta_vecs))
+        matrix = np.vstack(parts).astype(np.float32) if parts else np.zeros((0, 0), dtype=np.float32)
+        ids = np.concatenate([self._ids[keep], np.asarray(self._delta_ids, dtype=np.int64)])
+        colleges = np.concatenate([self._colleges[keep], np.asarray(self._delta_colleges, dtype="U100")])
+        return matrix, ids, colleges
+
+    def snapshot(self):
+        """(matrix, review ids, colleges) of every live vector, base and delta, as one copy."""
+        self.ensure_loaded()
+        with self._lock:
+            return self._snapshot_locked()
+
+    # ---- search ----
+    def search(self, query_vec, k=10, college=None):
+        """
+        Top-k cosine neighbours of a normalized query vector.
+        Returns [(review_id, score)] best first, optionally restricted to one college.
+        """
+        self.ensure_loaded()
+        q = np.asarray(query_vec, dtype=np.float32).ravel()
+        with self._lock:
+            candidates = []  # (matrix, ids, mask)
+            if self._ids.size:
+                mask = ~self._dead
+                if college is not None:
+                    mask &= self._colleges == college
+                candidates.append((self._matrix, self._ids, mask))
+            if self._delta_ids:
+                d_ids = np.asarray(self._delta_ids, dtype=np.int64)
+                d_mask = np.ones(len(d_ids), dtype=bool)
+                if college is not None:
+                    d_mask = np.asarray(self._delta_colleges) == college
+                candidates.append((np.vstack(self._delta_vecs), d_ids, d_mask))
+
+        all_scores, all_ids = [], []
+        for matrix, ids, mask in candidates:
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                continue
+            sub = matrix if rows.size == len(ids) else matrix[rows]
+            all_scores.append(sub @ q)  # one matrix-vector product
+            all_ids.append(ids[rows])
+        if not all_scores:
+            return []
+
+        scores = np.concatenate(all_scores)
+        ids = np.concatenate(all_ids)
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def _usable(query):
+    """
+    `query` joined to Review and limited to rows decode() accepts for the current model (same
+    model, format version, a known codec and a blob of the right size), so counting it gives
+    exactly what rebuild() indexes: orphaned or stale rows don't make the files look out of date.
+    """
+    codec = db.func.coalesce(ReviewEmbedding.codec, "f32")
+    size = db.func.length(ReviewEmbedding.vector)
+    return (query.join(Review, Review.id == ReviewEmbedding.review_id)
+            .filter(ReviewEmbedding.model == SENTENCE_MODEL_NAME,
+                    db.func.coalesce(ReviewEmbedding.format_version, 1) == FORMAT_VERSION,
+                    ReviewEmbedding.dim > 0,
+                    db.or_(*(db.and_(codec == name, size == c.size(ReviewEmbedding.dim))
+                             for name, c in CODECS.items()))))
+
+
+embedding_index = EmbeddingIndex()
@@ -1,32 +1,27 @@
+import time
+from datetime import datetime
 import numpy as np
-import threading
-from sentence_transformers import SentenceTransformer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from flask import current_app
 from app import db
-from .models import Review, ReviewEmbedding
+from .models import Review, ReviewEmbedding, PipelineCheckpoint
+from .embedding_index import embedding_index
+from . import embedding_codec
+from .nlp_utils import text_hash
 
-_MODEL_NAME = "all-MiniLM-L6-v2"
-_model_lock = threading.Lock()
-_model_singleton = None
+from .model_registry import SENTENCE_MODEL_NAME as _MODEL_NAME, encode  # shared model, loaded on first use
 
-def _get_model():
-    global _model_singleton
-    with _model_lock:
-        if _model_singleton is None:
-            _model_singleton = SentenceTransformer(_MODEL_NAME)
-        return _model_singleton
+def _codec():
+    """The codec new vectors are written with (EMBEDDING_CODEC: f32 | f16 | int8)."""
+    return embedding_codec.get_codec(current_app.config.get("EMBEDDING_CODEC", "f32"))
 
-def _to_bytes(vec: np.ndarray) -> bytes:
-    # ensure float32 for space
-    if vec.dtype != np.float32:
-        vec = vec.astype(np.float32)
-    return vec.tobytes()
-
-def _from_bytes(b: bytes, dim: int) -> np.ndarray:
-    return np.frombuffer(b, dtype=np.float32).reshape(dim)
+def _from_bytes(b: bytes, dim: int, codec: str = "f32", version: int = embedding_codec.FORMAT_VERSION,
+                model: str = _MODEL_NAME) -> np.ndarray:
+    """Decode a stored vector; raises EmbeddingFormatError if it isn't from the current model/format."""
+    return embedding_codec.decode(b, dim, codec=codec, version=version, model=model, expected_model=_MODEL_NAME)
 
 def embed_text(text: str) -> np.ndarray:
-    model = _get_model()
-    emb = model.encode([text], normalize_embeddings=True)  # (1, d)
+    emb = encode([text], caller="embed_text", normalize_embeddings=True)  # (1, d)
     return emb[0].astype(np.float32)
 
 def upsert_review_embedding(review_id: int):
@@ -36,26 +31,169 @@ def upsert_review_embedding(review_id: int):
         return
 
     vec = embed_text(review.text)
-    dim = vec.shape[0]
-    blob = _to_bytes(vec)
-
-    existing = ReviewEmbedding.query.filter_by(review_id=review_id).first()
-    if existing:
-        existing.model = _MODEL_NAME
-        existing.dim = dim
-        existing.vector = blob
-    else:
-        rec = ReviewEmbedding(
-            review_id=review_id,
-            model=_MODEL_NAME,
-            dim=dim,
-            vector=blob,
-        )
-        db.session.add(rec)
+    _bulk_upsert([_embedding_row(review, vec, _codec())])
     db.session.commit()
+    embedding_index.add(review.id, review.college_name, vec)
+
+_CHECKPOINT = "embed-all"
+
+def _bulk_upsert(rows):
+    """One INSERT ... ON CONFLICT(review_id) DO UPDATE for the whole chunk (executemany)."""
+    stmt = sqlite_insert(ReviewEmbedding)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["review_id"],
+        set_={col: stmt.excluded[col]
+              for col in ("model", "dim", "vector", "codec", "format_version", "text_hash")},
+    )
+    db.session.execute(stmt, rows)
+
+def _embedding_row(review, vec, codec, known_hash=None):
+    return {"review_id": review.id, "model": _MODEL_NAME, "dim": int(vec.shape[0]),
+            "vector": codec.encode(vec), "codec": codec.name,
+            "format_version": embedding_codec.FORMAT_VERSION,
+            "text_hash": known_hash or text_hash(review.text)}
+
+def embed_reviews(reviews, batch_size=64):
+    """
+    Encode a list of reviews (anything with .id/.text) in one model.encode call and
+    bulk-upsert their vectors. Does NOT commit. Returns the (n, d) float32 matrix.
+    """
+    reviews = [r for r in reviews if r.text]
+    if not reviews:
+        return np.zeros((0, 0), dtype=np.float32)
+    vecs = encode([r.text for r in reviews], caller="embed_reviews", batch_size=batch_size,
+                  normalize_embeddings=True).astype(np.float32)
+    codec = _codec()
+    _bulk_upsert([_embedding_row(r, vec, codec) for r, vec in zip(reviews, vecs)])
+    return vecs
+
+def batch_embed_all(batch_size=64, chunk_size=512, force=False, restart=False, log=None):
+    """
+    Embed every review whose stored vector is missing or out of date.
+
+    Pages through reviews by id in chunks of `chunk_size`, encodes each chunk with one
+    `model.encode(..., batch_size=batch_size)` call and upserts it in a single transaction
+    together with a checkpoint, so an interrupted run resumes after the last finished chunk.
+    Rows whose stored model and text hash are already current are skipped unless `force`.
+    Returns a stats dict (seen / embedded / skipped / seconds / per_sec).
+    """
+    started = time.perf_counter()
+    stats = {"seen": 0, "embedded": 0, "skipped": 0}
+
+    checkpoint = db.session.get(PipelineCheckpoint, _CHECKPOINT)
+    if checkpoint is None:
+        checkpoint = PipelineCheckpoint(name=_CHECKPOINT, last_id=0)
+        db.session.add(checkpoint)
+    if restart or force:
+        checkpoint.last_id = 0
+    last_id = checkpoint.last_id
+    if last_id and log:
+        log(f"↪ Resuming after review id {last_id}")
+
+    while True:
+        chunk = (db.session.query(Review.id, Review.college_name, Review.text)
+                 .filter(Review.id > last_id)
+                 .order_by(Review.id)
+                 .limit(chunk_size)
+                 .all())
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        stats["seen"] += len(chunk)
+
+        current = {
+            review_id: (stored_model, stored_hash)
+            for review_id, stored_model, stored_hash in db.session.query(
+                ReviewEmbedding.review_id, ReviewEmbedding.model, ReviewEmbedding.text_hash
+            ).filter(ReviewEmbedding.review_id.in_([r.id for r in chunk]))
+        }
+        todo = [
+            r for r in chunk
+            if r.text and (force or current.get(r.id) != (_MODEL_NAME, text_hash(r.text)))
+        ]
+        stats["skipped"] += len(chunk) - len(todo)
+
+        if todo:
+            embed_reviews(todo, batch_size=batch_size)
+            stats["embedded"] += len(todo)
+
+        checkpoint.last_id = last_id
+        checkpoint.updated_at = datetime.utcnow()
+        db.session.commit()  # vectors + checkpoint land together
+
+    # finished cleanly: next run starts from the top again (and skips everything current)
+    checkpoint.last_id = 0
+    checkpoint.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    if stats["embedded"]:
+        embedding_index.rebuild()  # rewrite the sidecar files so running workers pick the vectors up
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["per_sec"] = round(stats["seen"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+def export_embeddings(path, codec=None, chunk_size=5000):
+    """
+    Write every current-model vector to one .npz (review ids, text hashes, the vectors in
+    `codec`, model name and format version), e.g. to seed another database without running
+    the model. Returns how many vectors were written.
+    """
+    codec = embedding_codec.get_codec(codec) if codec else _codec()
+    rows = (db.session.query(ReviewEmbedding.review_id, ReviewEmbedding.text_hash, ReviewEmbedding.dim,
+                             ReviewEmbedding.vector, ReviewEmbedding.codec, ReviewEmbedding.format_version)
+            .filter(ReviewEmbedding.model == _MODEL_NAME)
+            .order_by(ReviewEmbedding.review_id)
+            .yield_per(chunk_size))
+    ids, hashes, vecs = [], [], []
+    for review_id, stored_hash, dim, blob, stored_codec, version in rows:
+        try:
+            vecs.append(_from_bytes(blob, dim, codec=stored_codec or "f32", version=version or 1))
+        except embedding_codec.EmbeddingFormatError:
+            continue
+        ids.append(review_id)
+        hashes.append(stored_hash or "")
+    matrix = np.vstack(vecs) if vecs else np.zeros((0, 0), dtype=np.float32)
+    arrays = codec.encode_matrix(matrix) if vecs else {"vectors": matrix}
+    with open(path, "wb") as f:  # a file object, so np.savez doesn't append ".npz" to the name
+        np.savez(f, review_ids=np.asarray(ids, dtype=np.int64), text_hashes=np.asarray(hashes),
+                 model=np.asarray(_MODEL_NAME), codec=np.asarray(codec.name),
+                 format_version=np.asarray(embedding_codec.FORMAT_VERSION), **arrays)
+    return len(ids)
+
+def import_embeddings(path, chunk_size=2000):
+    """
+    Load an export_embeddings() file into review_embedding (re-encoded with the configured codec).
+    Vectors whose review is gone or whose text changed since the export are skipped.
+    Returns {"imported", "skipped"}.
+    """
+    with np.load(path) as data:
+        model, version = str(data["model"]), int(data["format_version"])
+        if model != _MODEL_NAME:
+            raise embedding_codec.EmbeddingFormatError(f"file holds {model!r} vectors, expected {_MODEL_NAME!r}")
+        if version != embedding_codec.FORMAT_VERSION:
+            raise embedding_codec.EmbeddingFormatError(f"unsupported embedding format version {version}")
+        ids, hashes = data["review_ids"], data["text_hashes"]
+        matrix = embedding_codec.get_codec(str(data["codec"])).decode_matrix(data) if len(ids) else None
+
+    codec = _codec()
+    stats = {"imported": 0, "skipped": 0}
+    for start in range(0, len(ids), chunk_size):
+        chunk_ids = [int(i) for i in ids[start:start + chunk_size]]
+        reviews = {r.id: r for r in db.session.query(Review.id, Review.text).filter(Review.id.in_(chunk_ids))}
+        rows = []
+        for offset, review_id in enumerate(chunk_ids):
+            review = reviews.get(review_id)
+            stored_hash = str(hashes[start + offset])
+            if review is None or not review.text or stored_hash != text_hash(review.text):
+                stats["skipped"] += 1
+                continue
+            rows.append(_embedding_row(review, matrix[start + offset], codec, known_hash=stored_hash))
+        if rows:
+            _bulk_upsert(rows)
+        db.session.commit()
+        stats["imported"] += len(rows)
 
-def batch_embed_all():
-    """Embed every review that doesn’t have an embedding yet (or re-embed all if you like)."""
-    q = Review.query.all()
-    for r in q:
-        upsert_review_embedding(r.id)
+    if stats["imported"]:
+        embedding_index.rebuild()
+    return stats
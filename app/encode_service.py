@@ -0,0 +1,259 @@
+"""
+Dynamic micro-batching for the sentence encoder.
+
+Request threads each encode one or two short strings (/recommend, /search, /generate_tags...);
+run one by one, N concurrent requests cost N tiny forward passes. EncodeBatcher queues them
+instead: one worker thread takes whatever arrived within `max_wait_ms` (up to `max_batch`
+texts), runs it as a single model.encode call and resolves each caller's future with its rows.
+
+ENCODE_SERVICE (env var / app config):
+  - "off"    (default) every caller runs model.encode itself
+  - "batch"  one batcher per process; calls of up to `max_batch` texts go through it
+  - "socket" `flask encoder-server` owns the model and the batcher in a separate process and
+             every gunicorn worker sends its texts over a Unix socket (ENCODER_SOCKET): one model
+             copy per machine and batches that span workers. While the server can't be reached
+             the worker encodes with its own model and retries the socket with exponential
+             backoff (1s doubling up to 60s), so a restarted server is picked up again.
+
+Wire format (socket mode), both directions: !II header/body lengths, a JSON header, raw body.
+Requests are {"texts": [...], "normalize": bool} with no body; replies are {"n", "dim"} with
+the float32 rows as the body, or {"error": "..."}.
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from .metrics import metrics
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class _Request:
+    __slots__ = ("texts", "normalize", "future", "queued_at")
+
+    def __init__(self, texts, normalize):
+        self.texts = texts
+        self.normalize = normalize
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class EncodeBatcher:
+    """Coalesces concurrent encode calls into batched `encode_fn(texts, normalize)` calls."""
+
+    def __init__(self, encode_fn, max_batch=64, max_wait_ms=2.0):
+        self._encode = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._carry = None  # request that didn't fit in the previous batch
+
+    def accepts(self, n):
+        return n <= self.max_batch  # bulk jobs already batch; queueing them would only delay requests
+
+    def _ensure_started(self):
+        # threads don't survive fork: a --preload'ed gunicorn worker starts its own
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._carry = None
+                self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, texts, normalize=False):
+        """Queue `texts` (a list); the future resolves to their (n, d) float32 rows."""
+        self._ensure_started()
+        request = _Request(list(texts), bool(normalize))
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, sentences, normalize_embeddings=False, **_):
+        single = isinstance(sentences, str)
+        vecs = self.submit([sentences] if single else sentences, normalize_embeddings).result()
+        return vecs[0] if single else vecs
+
+    # ---- worker ----
+    def _collect(self):
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        batch, n = [first], len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while n < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if n + len(request.texts) > self.max_batch:
+                self._carry = request  # first in line for the next batch
+                break
+            batch.append(request)
+            n += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            self._run_batch(self._collect())
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        for normalize in (False, True):
+            group = [r for r in batch if r.normalize == normalize]
+            if not group:
+                continue
+            texts = [t for r in group for t in r.texts]
+            metrics.inc("encode_batches_total")
+            metrics.observe("encode_batch_texts", len(texts), buckets=BATCH_BUCKETS)
+            for r in group:
+                metrics.observe("encode_queue_seconds", started - r.queued_at)
+            try:
+                vecs = np.asarray(self._encode(texts, normalize), dtype=np.float32)
+            except Exception as exc:  # hand the failure to every caller instead of killing the worker
+                for r in group:
+                    r.future.set_exception(exc)
+                continue
+            start = 0
+            for r in group:
+                r.future.set_result(vecs[start:start + len(r.texts)])
+                start += len(r.texts)
+
+
+# ---- Unix socket transport ----
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("encoder socket closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _send(sock, header, body=b""):
+    head = json.dumps(header).encode("utf-8")
+    sock.sendall(struct.pack("!II", len(head), len(body)) + head + body)
+
+
+def _recv(sock):
+    head_len, body_len = struct.unpack("!II", _recv_exact(sock, 8))
+    header = json.loads(_recv_exact(sock, head_len))
+    return header, _recv_exact(sock, body_len)
+
+
+class SocketEncoder:
+    """Client side of socket mode: one connection per thread to `flask encoder-server`."""
+
+    def __init__(self, path, timeout=30.0, retry_min=1.0, retry_max=60.0):
+        self.path = path
+        self.timeout = timeout
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self._local = threading.local()
+        self._backoff = 0.0
+        self._retry_at = 0.0  # monotonic time before which callers encode locally
+
+    def accepts(self, n):
+        # the server owns the only model copy, so bulk calls go there too -- unless it's down
+        return time.monotonic() >= self._retry_at
+
+    def _failed(self):
+        self._backoff = min(self.retry_max, self._backoff * 2 or self.retry_min)
+        self._retry_at = time.monotonic() + self._backoff
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._local.sock = sock
+        self._local.pid = os.getpid()
+        return sock
+
+    def _roundtrip(self, texts, normalize):
+        sock = getattr(self._local, "sock", None)
+        if sock is None or self._local.pid != os.getpid():
+            sock = self._connect()
+        _send(sock, {"texts": texts, "normalize": normalize})
+        return _recv(sock)
+
+    def encode(self, sentences, normalize_embeddings=False, **_):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        try:
+            try:
+                header, body = self._roundtrip(texts, bool(normalize_embeddings))
+            except OSError:
+                self.close()  # stale connection (server restarted): retry once on a fresh one
+                header, body = self._roundtrip(texts, bool(normalize_embeddings))
+        except OSError:
+            self.close()
+            self._failed()
+            raise
+        self._backoff = 0.0
+        if "error" in header:
+            raise RuntimeError(f"encoder server: {header['error']}")
+        vecs = np.frombuffer(body, dtype=np.float32).reshape(header["n"], header["dim"])
+        return vecs[0] if single else vecs
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, _ = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                vecs = self.server.batcher.submit(header["texts"], header.get("normalize", False)).result()
+                vecs = np.ascontiguousarray(vecs, dtype=np.float32).reshape(len(header["texts"]), -1)
+                _send(self.request, {"n": vecs.shape[0], "dim": vecs.shape[1]}, vecs.tobytes())
+            except Exception as exc:
+                _send(self.request, {"error": str(exc)})
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(batcher, path):
+    """
+    Run the encoder server in the foreground: every connection's texts go through `batcher`.
+    Raises RuntimeError if another server already answers on `path`.
+    """
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left over from a previous run
+        else:
+            raise RuntimeError(f"an encoder server is already listening on {path}")
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = _Server(path, _Handler)
+    server.batcher = batcher
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
@@ -0,0 +1,217 @@
+"""
+Bulk ingestion of scraped posts (e.g. `python scrape_reddit.py --out posts.jsonl`) into Review.
+
+Records stream through a chain of generators, so memory stays flat no matter how big the dump is:
+
+    read_jsonl -> normalize -> map_college -> chunked -> (per chunk) dedupe -> tag -> insert
+
+Each chunk is one transaction: duplicates (same normalized text, within the chunk or already in
+the table) are dropped, tags/tokens come from one nlp.pipe pass, rows go in with one executemany
+INSERT and the college aggregates are bumped alongside. Embeddings are computed at the end by the
+resumable embed-all pass. Accepted record fields: `text` or `title` + `selftext`/`body`, and
+optionally `college` (a key or name), `search_term`, `author`/`user`, `created_utc` (the post's
+timestamp, used for trending and rating trends) and the five rating categories.
+"""
+import json
+import re
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import insert
+from app import db
+from .models import Review
+from .aggregate_utils import RATING_CATEGORIES, apply_reviews
+from .nlp_utils import parse_texts, save_tokens, text_hash
+from .page_cache import page_cache
+from . import tag_index
+
+# first match wins; checked against the college/search_term fields, then the text itself
+COLLEGE_PATTERNS = [
+    ("stmikes", re.compile(r"\bst\.?\s*mike'?s\b|\bst\.?\s*michael'?s\b|\busmc\b|\bstmikes\b")),
+    ("trinity", re.compile(r"\btrin(ity)?\b")),
+    ("victoria", re.compile(r"\bvic(toria)?\b")),
+    ("woods", re.compile(r"\bwoods(worth)?\b")),
+    ("innis", re.compile(r"\binnis\b")),
+    ("new", re.compile(r"\bnew\s+college\b|^new$")),
+    ("uc", re.compile(r"\buc\b|\buniversity\s+college\b")),
+]
+
+
+class StageStats:
+    """Items and wall time per pipeline stage, for the throughput report."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, items, seconds):
+        stage = self.stages.setdefault(name, {"items": 0, "seconds": 0.0})
+        stage["items"] += items
+        stage["seconds"] += seconds
+
+    def report(self):
+        return {
+            name: {"items": s["items"], "seconds": round(s["seconds"], 2),
+                   "per_sec": round(s["items"] / s["seconds"], 1) if s["seconds"] else 0.0}
+            for name, s in self.stages.items()
+        }
+
+
+def read_jsonl(path, stats=None):
+    """Yield one dict per non-empty line; malformed lines are counted and skipped."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if stats:
+                    stats.add("malformed", 1, 0.0)
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def normalize(records):
+    """Collapse whitespace, join title + body and drop records without any text."""
+    for record in records:
+        text = record.get("text")
+        if text is None:
+            text = " ".join(p for p in (record.get("title"), record.get("selftext") or record.get("body")) if p)
+        text = re.sub(r"\s+", " ", str(text or "")).strip()
+        if not text:
+            continue
+        created_at = None
+        if isinstance(record.get("created_utc"), (int, float)):
+            created_at = datetime.utcfromtimestamp(record["created_utc"])
+        ratings = {}
+        for category in RATING_CATEGORIES:
+            value = record.get(category)
+            if isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 10:
+                ratings[category] = value
+        yield {
+            "text": text,
+            "user": str(record.get("user") or record.get("author") or "reddit")[:100],
+            "college_hint": " ".join(str(record.get(k) or "") for k in ("college", "search_term")),
+            "ratings": ratings,
+            "created_at": created_at,
+        }
+
+
+def _match_college(value):
+    value = value.lower().replace("’", "'").strip()
+    for key, pattern in COLLEGE_PATTERNS:
+        if value == key or pattern.search(value):
+            return key
+    return None
+
+
+def map_college(records, stats=None):
+    """Attach a college key; records that can't be mapped are dropped (and counted)."""
+    for record in records:
+        key = _match_college(record["college_hint"]) or _match_college(record["text"])
+        if key is None:
+            if stats:
+                stats.add("unmapped", 1, 0.0)
+            continue
+        record["college_name"] = key
+        yield record
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _timed(name, iterable, stats):
+    """Re-yield `iterable`, billing the time spent producing each item to `name`."""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.add(name, 0, time.perf_counter() - started)
+            return
+        stats.add(name, len(item), time.perf_counter() - started)
+        yield item
+
+
+def dedupe(chunk):
+    """Drop records whose normalized text is repeated in the chunk or already stored."""
+    for record in chunk:
+        record["content_hash"] = text_hash(record["text"])
+    hashes = {r["content_hash"] for r in chunk}
+    existing = {h for (h,) in db.session.query(Review.content_hash).filter(Review.content_hash.in_(hashes))}
+    fresh = []
+    for record in chunk:
+        if record["content_hash"] in existing:
+            continue
+        existing.add(record["content_hash"])
+        fresh.append(record)
+    return fresh
+
+
+def insert_reviews(chunk, parsed):
+    """One executemany INSERT (ids come back in parameter order) + aggregates + tokens. Does NOT commit."""
+    rows = []
+    for record in chunk:
+        tags, _, _ = parsed[record["text"].lower()]
+        row = {"college_name": record["college_name"], "user": record["user"], "text": record["text"],
+               "tags": json.dumps(tags), "rated_categories": json.dumps(sorted(record["ratings"])),
+               "content_hash": record["content_hash"], "created_at": record["created_at"] or datetime.utcnow()}
+        row.update({c: record["ratings"].get(c) for c in RATING_CATEGORIES})
+        rows.append(row)
+    ids = db.session.scalars(insert(Review).returning(Review.id, sort_by_parameter_order=True), rows).all()
+
+    stored = [SimpleNamespace(id=review_id, **row) for review_id, row in zip(ids, rows)]
+    apply_reviews(stored)
+    tag_index.sync_reviews(stored, new=True)
+    page_cache.bump("listing", *(f"college:{r.college_name}" for r in stored))
+    save_tokens([(r, *parsed[r.text.lower()][1:]) for r in stored])
+    return len(stored)
+
+
+def ingest_jsonl(path, chunk_size=1000, batch_size=64, embed=True, log=None):
+    """
+    Stream a JSONL dump into the review table in chunked transactions (see module docstring).
+    Returns {"inserted", "duplicates", "unmapped", "malformed", "stages": {...}}.
+    """
+    stats = StageStats()
+    inserted = duplicates = 0
+
+    records = map_college(normalize(read_jsonl(path, stats)), stats)
+    for chunk in _timed("read", chunked(records, chunk_size), stats):
+        started = time.perf_counter()
+        fresh = dedupe(chunk)
+        stats.add("dedupe", len(chunk), time.perf_counter() - started)
+        duplicates += len(chunk) - len(fresh)
+        if not fresh:
+            continue
+
+        started = time.perf_counter()
+        parsed = parse_texts([r["text"] for r in fresh], batch_size=batch_size)
+        stats.add("tag", len(fresh), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        inserted += insert_reviews(fresh, parsed)
+        db.session.commit()
+        stats.add("insert", len(fresh), time.perf_counter() - started)
+        if log:
+            log(f"… {inserted} reviews inserted")
+
+    if embed and inserted:
+        from .embedding_utils import batch_embed_all
+        started = time.perf_counter()
+        embedded = batch_embed_all(batch_size=batch_size)["embedded"]
+        stats.add("embed", embedded, time.perf_counter() - started)
+
+    skipped = {name: stats.stages.pop(name, {}).get("items", 0) for name in ("unmapped", "malformed")}
+    return {"inserted": inserted, "duplicates": duplicates, **skipped, "stages": stats.report()}
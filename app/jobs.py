@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_, and_
+from app import db
+from .models import Review, PostprocessJob
+from .page_cache import page_cache
+from . import tag_index
+
+
+class PostprocessQueue:
+    """
+    SQLite-backed queue for the slow part of a review submission (spaCy tags/tokens + embedding).
+
+    The request only inserts a `postprocess_job` row in the same transaction as the review;
+    a daemon worker thread per process claims pending jobs in batches, runs them through one
+    nlp.pipe pass and one model.encode call, and marks them done. The worker starts with the
+    first request a process serves (after any gunicorn fork), so jobs left over from a previous
+    run are picked up without waiting for a new submission. Failures are retried with
+    exponential backoff up to `max_attempts`, then left as `failed` with the error message.
+    Because the queue lives in the database, jobs survive restarts and any worker can take them.
+    """
+
+    def __init__(self, batch_size=32, poll_interval=2.0, max_attempts=3, retry_backoff=5.0,
+                 stale_after=600):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff    # seconds, doubled per attempt
+        self.stale_after = stale_after        # seconds before a 'running' job is presumed orphaned
+        self.run_async = True
+        self._app = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.run_async = app.config.get("POSTPROCESS_ASYNC", self.run_async)
+        self.batch_size = app.config.get("POSTPROCESS_BATCH_SIZE", self.batch_size)
+        if self.run_async:
+            # not in create_app itself: a thread (and its SQLite connection) must not cross a fork
+            app.before_request(self._ensure_worker)
+
+    # ---- producer side ----
+    def enqueue(self, review_id):
+        """Add a job row (does NOT commit: call before the commit that inserts the review)."""
+        now = datetime.utcnow()
+        db.session.add(PostprocessJob(review_id=review_id, status="pending",
+                                      created_at=now, updated_at=now))
+
+    def notify(self):
+        """Call after the enqueuing transaction commits."""
+        if not self.run_async:
+            self.drain()
+            return
+        self._ensure_worker()
+        self._wake.set()
+
+    # ---- worker ----
+    def _ensure_worker(self):
+        # threads don't survive fork, so (re)start per process on first use
+        if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="postprocess-worker", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.poll_interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self.drain()
+            except Exception:
+                self._app.logger.exception("Post-processing worker crashed; retrying")
+
+    def drain(self):
+        """Process claimable jobs until none are left. Needs an app context. Returns jobs handled."""
+        handled = 0
+        while True:
+            jobs = self._claim()
+            if not jobs:
+                return handled
+            self._process(jobs)
+            handled += len(jobs)
+
+    def _reap_stale(self, now):
+        """
+        Count an orphaned 'running' job (its worker died, maybe because of the job itself) as a
+        failed attempt: back to pending, or failed once it hits max_attempts, so a job that kills
+        the process can't be retried forever.
+        """
+        stale = PostprocessJob.query.filter(
+            PostprocessJob.status == "running",
+            PostprocessJob.updated_at < now - timedelta(seconds=self.stale_after),
+        )
+        if stale.first() is None:  # the usual case: no write transaction
+            return
+        attempts = PostprocessJob.attempts + 1
+        stale.update({
+            "attempts": attempts,
+            "status": case((attempts >= self.max_attempts, "failed"), else_="pending"),
+            "last_error": f"worker stopped without finishing the job (no update in {self.stale_after}s)",
+            "claimed_by": None,
+            "updated_at": now,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def _claim(self):
+        claim_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # unique per claim, so drains never share one
+        now = datetime.utcnow()
+        self._reap_stale(now)
+        claimable = and_(PostprocessJob.status == "pending",
+                         or_(PostprocessJob.run_after.is_(None), PostprocessJob.run_after <= now))
+        ids = [job_id for (job_id,) in db.session.query(PostprocessJob.id)
+               .filter(claimable).order_by(PostprocessJob.id).limit(self.batch_size)]
+        if not ids:
+            return []
+        # the claimable filter is re-checked in the UPDATE, so two workers can't take the same job
+        PostprocessJob.query.filter(PostprocessJob.id.in_(ids), claimable).update(
+            {"status": "running", "claimed_by": claim_id, "updated_at": now},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return PostprocessJob.query.filter(PostprocessJob.id.in_(ids), PostprocessJob.claimed_by == claim_id).all()
+
+    def _process(self, jobs):
+        try:
+            self._run_batch(jobs)
+        except Exception as e:
+            db.session.rollback()
+            if len(jobs) > 1:
+                for job in jobs:  # isolate the bad review so the rest of the batch still lands
+                    self._process([job])
+                return
+            self._fail(jobs[0], e)
+
+    def _run_batch(self, jobs):
+        from .nlp_utils import analyze_reviews
+        from .embedding_utils import embed_reviews
+        from .embedding_index import embedding_index
+
+        reviews = Review.query.filter(Review.id.in_([j.review_id for j in jobs])).all()
+        need_tags = {r.id for r in reviews if not json.loads(r.tags or "[]")}
+        tags = analyze_reviews(reviews, tag_ids=need_tags)
+        for r in reviews:
+            if r.id in tags:
+                r.tags = json.dumps(tags[r.id])
+        tag_index.sync_reviews([r for r in reviews if r.id in tags])
+        vecs = embed_reviews(reviews)
+        if tags:
+            page_cache.bump(*{f"college:{r.college_name}" for r in reviews if r.id in tags})
+
+        now = datetime.utcnow()
+        for job in jobs:
+            job.status = "done"
+            job.attempts += 1
+            job.last_error = None
+            job.updated_at = now
+        db.session.commit()
+
+        for r, vec in zip([r for r in reviews if r.text], vecs):
+            embedding_index.add(r.id, r.college_name, vec)
+
+    def _fail(self, job, error):
+        job = db.session.get(PostprocessJob, job.id)
+        job.attempts += 1
+        job.last_error = f"{type(error).__name__}: {error}"[:1000]
+        job.updated_at = datetime.utcnow()
+        if job.attempts >= self.max_attempts:
+            job.status = "failed"
+        else:
+            job.status = "pending"
+            job.run_after = job.updated_at + timedelta(seconds=self.retry_backoff * 2 ** (job.attempts - 1))
+        db.session.commit()
+
+    # ---- introspection ----
+    def status_counts(self):
+        rows = db.session.query(PostprocessJob.status, db.func.count()).group_by(PostprocessJob.status)
+        return {status: count for status, count in rows}
+
+
+postprocess_queue = PostprocessQueue()
@@ -0,0 +1,212 @@
+"""
+Lightweight in-process instrumentation, exposed as Prometheus text at /metrics.
+
+  metrics.inc("page_cache_total", result="hit")          counter
+  metrics.observe("http_request_seconds", dt, route=...)  histogram
+  with metrics.span("spacy_parse", items=len(texts)):     stage timing -> stage_seconds{stage=...}
+      ...                                                  (+ stage_items_total when items is given)
+
+Every call is a lock and a dict update, so it's cheap enough for the hot paths; METRICS=0
+turns all of it into no-ops. Numbers are per process: under gunicorn each worker answers
+/metrics with its own counts (scrape them with per-worker labels or run a single worker).
+
+Request profiling: with PROFILING=1 and a PROFILING_TOKEN set, any request with
+?profile=<token> runs under cProfile and returns the top of the profile (text/plain) instead
+of the page. Without the token profiling stays off (anyone could otherwise make the server
+profile itself). One profiled request at a time: Python 3.12+ allows a single active profiler,
+so a second one gets a 409. Off by default, and when off the only cost is one dict lookup per
+request.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import threading
+import time
+from flask import g, request, Response
+
+# seconds; covers a cached 304 up to a cold LDA retrain
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+log = logging.getLogger(__name__)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "items", "start")
+
+    def __init__(self, metrics, stage, items):
+        self.metrics = metrics
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe("stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+        if self.items:
+            self.metrics.inc("stage_items_total", self.items, stage=self.stage)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self.profiling = False
+        self._profiling_token = ""
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> float
+        self._histograms = {}  # (name, labels) -> _Histogram
+        self._help = {}
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS", True)
+        self._profiling_token = app.config.get("PROFILING_TOKEN") or ""
+        self.profiling = bool(app.config.get("PROFILING", False))
+        if self.profiling and not self._profiling_token:
+            log.warning("PROFILING=1 without PROFILING_TOKEN; request profiling stays off")
+            self.profiling = False
+        if not (self.enabled or self.profiling):
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    # ---- recording ----
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    def span(self, stage, items=None):
+        """Context manager timing one stage of a hot path (stage_seconds{stage=...})."""
+        return _Span(self, stage, items) if self.enabled else _NO_SPAN
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ---- request hooks ----
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        token = request.args.get("profile") if self.profiling else None
+        if token and hmac.compare_digest(token.encode("utf-8"), self._profiling_token.encode("utf-8")):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # 3.12+: another request is already being profiled
+                return Response("another request is being profiled; try again\n", status=409,
+                                mimetype="text/plain")
+            g._profiler = profiler
+
+    def _after_request(self, response):
+        profiler = g.pop("_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            return Response(out.getvalue(), mimetype="text/plain")
+        start = g.pop("_metrics_start", None)
+        if start is not None and self.enabled:
+            self.observe("http_request_seconds", time.perf_counter() - start,
+                         route=request.endpoint or "unmatched", method=request.method,
+                         status=str(response.status_code))
+        return response
+
+    # ---- exposition ----
+    def render(self):
+        """Everything recorded so far in the Prometheus text format (0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(((k, (list(h.counts), h.total, h.count, h.buckets))
+                                 for k, h in self._histograms.items()), key=lambda item: item[0])
+        lines = []
+        declared = set()
+
+        def header(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for upper, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{upper:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("http_request_seconds", "Request latency by route, method and status.")
+metrics.describe("stage_seconds", "Time spent in one hot-path stage (SQL, spaCy, LDA, encode...).")
+metrics.describe("stage_items_total", "Items (texts, reviews) processed by a stage.")
+metrics.describe("model_encode_calls_total", "Sentence encoder calls, by caller.")
+metrics.describe("model_encode_texts_total", "Texts passed to the sentence encoder, by caller.")
+metrics.describe("cache_requests_total", "Cache lookups by cache and result (hit / miss / not_modified).")
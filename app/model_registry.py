@@ -0,0 +1,194 @@
+"""
+One place that owns the heavy models (MiniLM sentence encoder, spaCy pipeline).
+
+Everything is loaded lazily on first use and shared by every module in the process,
+so importing the app (or running a `flask` CLI command that never touches NLP) costs
+nothing, and there is only ever one copy of each model per process.
+
+Loading modes (MODEL_LOADING env var / app config):
+  - "lazy"    (default) load on first use
+  - "warm"    start loading on a background thread at startup so the first request doesn't pay
+  - "prefork" load synchronously in create_app() and gc.freeze() afterwards; run gunicorn with
+              --preload so forked workers share the model pages copy-on-write
+
+Sentence encoder backends (ENCODER_BACKEND env var / app config):
+  - "torch"     (default) SentenceTransformer on PyTorch
+  - "onnx"      the same model exported to ONNX, run with onnxruntime (see app/onnx_encoder.py)
+  - "onnx-int8" the export with dynamically quantized int8 weights; smallest and fastest on CPU
+The ONNX backends need `flask export-onnx [--quantize]` first; without the files (or without
+onnxruntime / tokenizers installed) the torch model is loaded instead, with a warning.
+
+encode() is the entry point for every caller; with ENCODE_SERVICE=batch|socket it hands
+small calls to the micro-batching service in app/encode_service.py.
+"""
+import gc
+import logging
+import os
+import threading
+
+SENTENCE_MODEL_NAME = "all-MiniLM-L6-v2"
+SPACY_MODEL_NAME = "en_core_web_sm"
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+log = logging.getLogger(__name__)
+_lock = threading.Lock()
+_models = {}
+_encoder = {"backend": "torch", "onnx_dir": None, "threads": None}
+_service = None  # EncodeBatcher / SocketEncoder, or None to call the model directly
+_SERVICE_KWARGS = {"normalize_embeddings", "batch_size"}
+
+
+def configure_encoder(backend="torch", onnx_dir=None, threads=None):
+    """Pick the sentence encoder backend. Drops a loaded encoder if the choice changed."""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"unknown encoder backend {backend!r} (expected one of {ENCODER_BACKENDS})")
+    settings = {"backend": backend, "onnx_dir": onnx_dir, "threads": threads}
+    with _lock:
+        if settings != _encoder:
+            _encoder.update(settings)
+            _models.pop("sentence", None)
+
+
+def encoder_backend():
+    """The configured sentence encoder backend ("torch", "onnx" or "onnx-int8")."""
+    return _encoder["backend"]
+
+
+def _load_onnx_model(backend):
+    from .onnx_encoder import MODEL_FILES, OnnxSentenceEncoder
+    directory = _encoder["onnx_dir"]
+    if directory is None or not os.path.exists(os.path.join(directory, MODEL_FILES[backend])):
+        log.warning("no %s export in %s (run `flask export-onnx%s`); using the torch encoder",
+                    backend, directory, " --quantize" if backend == "onnx-int8" else "")
+        return None
+    try:
+        return OnnxSentenceEncoder(directory, backend=backend, threads=_encoder["threads"])
+    except ImportError as exc:
+        log.warning("%s needs onnxruntime and tokenizers (%s); using the torch encoder", backend, exc)
+        return None
+
+
+def _load_sentence_model():
+    if _encoder["backend"] != "torch":
+        model = _load_onnx_model(_encoder["backend"])
+        if model is not None:
+            return model
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(SENTENCE_MODEL_NAME)
+    model.max_seq_length = 256
+    return model
+
+
+def _load_spacy():
+    import spacy
+    return spacy.load(SPACY_MODEL_NAME, disable=["ner", "textcat"])  # leaner model, no NER or text categorization
+
+
+_factories = {
+    "sentence": _load_sentence_model,
+    "spacy": _load_spacy,
+}
+
+
+def register_factory(name, factory):
+    """Swap how a model is built (e.g. a stub for offline benchmarks). Drops any loaded copy."""
+    with _lock:
+        _factories[name] = factory
+        _models.pop(name, None)
+
+
+def get(name):
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            _models[name] = _factories[name]()
+        return _models[name]
+
+
+def get_sentence_model():
+    return get("sentence")
+
+
+def get_nlp():
+    return get("spacy")
+
+
+def encode_direct(texts, normalize=False):
+    """One model.encode call in this process (what the batcher runs per batch)."""
+    return get("sentence").encode(texts, normalize_embeddings=normalize)
+
+
+def set_encode_service(service):
+    """Route encode() through `service` (an EncodeBatcher or SocketEncoder); None = direct calls."""
+    global _service
+    _service = service
+
+
+def encode(sentences, caller="other", **kwargs):
+    """get_sentence_model().encode(...), counted and timed per caller for /metrics."""
+    from .metrics import metrics
+    n = 1 if isinstance(sentences, str) else len(sentences)
+    metrics.inc("model_encode_calls_total", caller=caller)
+    metrics.inc("model_encode_texts_total", n, caller=caller)
+    with metrics.span("encode", items=n):
+        service = _service
+        if service is not None and n and service.accepts(n) and set(kwargs) <= _SERVICE_KWARGS:
+            try:
+                return service.encode(sentences, normalize_embeddings=kwargs.get("normalize_embeddings", False))
+            except OSError as exc:  # encoder server down: encode locally until its retry backoff ends
+                log.warning("encoder service unavailable (%s); encoding in-process", exc)
+        return get("sentence").encode(sentences, **kwargs)
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def warm_up(names=("sentence", "spacy")):
+    """Load models and run one tiny forward pass so lazy init inside the libraries happens too."""
+    for name in names:
+        model = get(name)
+        if name == "sentence":
+            model.encode(["warm up"])
+        elif name == "spacy":
+            model("warm up")
+
+
+def onnx_model_dir(app):
+    """ONNX_MODEL_DIR, or <instance>/onnx/<model> where `flask export-onnx` writes by default."""
+    return app.config.get("ONNX_MODEL_DIR") or os.path.join(app.instance_path, "onnx", SENTENCE_MODEL_NAME)
+
+
+def encoder_socket(app):
+    """ENCODER_SOCKET, or <instance>/encoder.sock."""
+    return app.config.get("ENCODER_SOCKET") or os.path.join(app.instance_path, "encoder.sock")
+
+
+def init_app(app):
+    configure_encoder(app.config.get("ENCODER_BACKEND", "torch"),
+                      onnx_dir=onnx_model_dir(app), threads=app.config.get("ENCODER_THREADS"))
+    service = app.config.get("ENCODE_SERVICE", "off")
+    warm = ("sentence", "spacy")
+    if service == "batch":
+        from .encode_service import EncodeBatcher
+        set_encode_service(EncodeBatcher(encode_direct, max_batch=app.config.get("ENCODE_MAX_BATCH", 64),
+                                         max_wait_ms=app.config.get("ENCODE_MAX_WAIT_MS", 2.0)))
+    elif service == "socket":
+        from .encode_service import SocketEncoder
+        set_encode_service(SocketEncoder(encoder_socket(app)))
+        warm = ("spacy",)  # the server holds the encoder; workers only load one if it goes away
+    else:
+        set_encode_service(None)
+
+    mode = app.config.get("MODEL_LOADING", "lazy")
+    if mode == "warm":
+        threading.Thread(target=warm_up, args=(warm,), name="model-warmup", daemon=True).start()
+    elif mode == "prefork":
+        warm_up(warm)
+        # move everything allocated so far out of the GC's reach: collections in the
+        # workers then don't touch (and un-share) the model's pages
+        gc.collect()
+        gc.freeze()
@@ -1,7 +1,14 @@
+from datetime import datetime
 from app import db # Importing db from app package to use SQLAlchemy ORM for database operations.
 
 
 class Review(db.Model):
+    __table_args__ = (
+        # every profile page / per-college query filters on college_name and walks ids in order
+        db.Index("ix_review_college_id", "college_name", "id"),
+        db.Index("ix_review_content_hash", "content_hash"),  # bulk-ingest dedupe lookups
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     college_name = db.Column(db.String(100), nullable=False)
     user = db.Column(db.String(100), nullable=False)
@@ -13,6 +20,8 @@ class Review(db.Model):
     opportunities = db.Column(db.Integer)
     tags = db.Column(db.Text)  # <-- NEW: store tags as a JSON-encoded list
     rated_categories = db.Column(db.Text) # <-- NEW: store rated categories as a JSON-encoded list
+    content_hash = db.Column(db.String(64))  # nlp_utils.text_hash of the whitespace-collapsed text (ingest dedupe)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # older reviews get the migration time (schema.py)
 
 class ReviewEmbedding(db.Model):
     __tablename__ = "review_embedding"
@@ -21,9 +30,144 @@ class ReviewEmbedding(db.Model):
     review_id = db.Column(db.Integer, db.ForeignKey('review.id'), unique=True, nullable=False)
     model = db.Column(db.String(64), nullable=False, default='all-MiniLM-L6-v2')
     dim = db.Column(db.Integer, nullable=False)
-    vector = db.Column(db.LargeBinary, nullable=False)  # raw bytes of the float32 array
+    vector = db.Column(db.LargeBinary, nullable=False)  # bytes in `codec` (see embedding_codec)
+    codec = db.Column(db.String(16), nullable=False, default='f32')  # f32 | f16 | int8
+    format_version = db.Column(db.Integer, nullable=False, default=1)
+    text_hash = db.Column(db.String(64))  # nlp_utils.text_hash of what was embedded (skip re-embedding if unchanged)
 
     # optional, handy relationship
     review = db.relationship("Review", backref=db.backref("embedding", uselist=False)) # one-to-one relationship
 
 
+
+class CollegeAggregate(db.Model):
+    """Running per-college sums so listing pages don't have to reload every review."""
+    __tablename__ = "college_aggregate"
+
+    college_name = db.Column(db.String(100), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # per category: sum and count of non-zero ratings (same rule as calculate_avg_ratings)
+    food_sum = db.Column(db.Integer, nullable=False, default=0)
+    food_count = db.Column(db.Integer, nullable=False, default=0)
+    social_sum = db.Column(db.Integer, nullable=False, default=0)
+    social_count = db.Column(db.Integer, nullable=False, default=0)
+    clubs_sum = db.Column(db.Integer, nullable=False, default=0)
+    clubs_count = db.Column(db.Integer, nullable=False, default=0)
+    study_sum = db.Column(db.Integer, nullable=False, default=0)
+    study_count = db.Column(db.Integer, nullable=False, default=0)
+    opportunities_sum = db.Column(db.Integer, nullable=False, default=0)
+    opportunities_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # sum of each review's own average (over its non-null categories) + how many reviews had one
+    review_avg_sum = db.Column(db.Float, nullable=False, default=0.0)
+    review_avg_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ReviewTokens(db.Model):
+    """spaCy output for a review, stored once so trending never re-parses old text."""
+    __tablename__ = "review_tokens"
+
+    review_id = db.Column(db.Integer, db.ForeignKey('review.id'), primary_key=True)
+    text_hash = db.Column(db.String(64), nullable=False)    # nlp_utils.text_hash (sha256, case-insensitive)
+    nlp_version = db.Column(db.String(64), nullable=False)  # e.g. "core_web_sm-3.7.1"
+    lemmas = db.Column(db.Text, nullable=False)   # JSON list of good-token lemmas
+    bigrams = db.Column(db.Text, nullable=False)  # JSON list of "a b" bigrams over those lemmas
+
+    review = db.relationship("Review", backref=db.backref("token_cache", uselist=False))
+
+class PipelineCheckpoint(db.Model):
+    """Where a long-running batch job (embed-all, ingestion, ...) stopped, so it can resume."""
+    __tablename__ = "pipeline_checkpoint"
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+class PostprocessJob(db.Model):
+    """Queued embedding/tagging work for a review, processed off the request path."""
+    __tablename__ = "postprocess_job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    review_id = db.Column(db.Integer, db.ForeignKey('review.id'), unique=True, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default="pending")  # pending/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    claimed_by = db.Column(db.String(64))
+    run_after = db.Column(db.DateTime)  # retry backoff: not picked up before this time
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_postprocess_job_status_id", "status", "id"),  # the worker's claim query
+    )
+
+class CacheGeneration(db.Model):
+    """Version counter per page-cache scope; write paths bump it to invalidate cached pages."""
+    __tablename__ = "cache_generation"
+
+    scope = db.Column(db.String(128), primary_key=True)  # "listing", "college:<key>", "reset"
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+class TermBucket(db.Model):
+    """How often a trending term (lemma or bigram) appeared in one college's reviews in one hour/day."""
+    __tablename__ = "term_bucket"
+
+    granularity = db.Column(db.String(8), primary_key=True)   # "hour" | "day"
+    bucket_start = db.Column(db.DateTime, primary_key=True)   # UTC, truncated to the granularity
+    college_name = db.Column(db.String(100), primary_key=True)
+    term = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class RatingBucket(db.Model):
+    """Per-college, per-day rating sums (same columns as CollegeAggregate) for rating-over-time charts."""
+    __tablename__ = "rating_bucket"
+
+    college_name = db.Column(db.String(100), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    food_sum = db.Column(db.Integer, nullable=False, default=0)
+    food_count = db.Column(db.Integer, nullable=False, default=0)
+    social_sum = db.Column(db.Integer, nullable=False, default=0)
+    social_count = db.Column(db.Integer, nullable=False, default=0)
+    clubs_sum = db.Column(db.Integer, nullable=False, default=0)
+    clubs_count = db.Column(db.Integer, nullable=False, default=0)
+    study_sum = db.Column(db.Integer, nullable=False, default=0)
+    study_count = db.Column(db.Integer, nullable=False, default=0)
+    opportunities_sum = db.Column(db.Integer, nullable=False, default=0)
+    opportunities_count = db.Column(db.Integer, nullable=False, default=0)
+    review_avg_sum = db.Column(db.Float, nullable=False, default=0.0)
+    review_avg_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ReviewTag(db.Model):
+    """One normalized tag of one review: the inverted index behind tag filters (see tag_index)."""
+    __tablename__ = "review_tag"
+    __table_args__ = (
+        db.Index("ix_review_tag_tag_id", "tag", "review_id"),                        # "tagged X", newest first
+        db.Index("ix_review_tag_tag_college_id", "tag", "college_name", "review_id"),  # ... at one college
+    )
+
+    review_id = db.Column(db.Integer, db.ForeignKey('review.id'), primary_key=True)
+    tag = db.Column(db.String(200), primary_key=True)
+    college_name = db.Column(db.String(100), nullable=False)
+
+class CollegeTagCount(db.Model):
+    """How many of a college's reviews carry a tag; kept in step with review_tag by the write paths."""
+    __tablename__ = "college_tag_count"
+    __table_args__ = (
+        db.Index("ix_college_tag_count_college_count", "college_name", "count"),  # top-N per college
+    )
+
+    college_name = db.Column(db.String(100), primary_key=True)
+    tag = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TagCount(db.Model):
+    """How many reviews carry a tag across all colleges (college_tag_count summed, kept in step with it)."""
+    __tablename__ = "tag_count"
+    __table_args__ = (
+        db.Index("ix_tag_count_count", "count"),  # top-N overall
+    )
+
+    tag = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -1,20 +1,26 @@
-import spacy
-from collections import Counter
-from gensim import corpora
-from gensim.models import LdaModel
 from collections import defaultdict, Counter 
 from typing import List
+from collections import OrderedDict
+import hashlib
+import importlib.util
+import json
 import re 
+import threading
+from .model_registry import get_nlp
+from .metrics import metrics
 
+# gensim is only imported when LDA actually runs (it's slow to import)
+HAS_GENSIM = importlib.util.find_spec("gensim") is not None
 
-try:
-    from gensim import corpora
-    from gensim.models import LdaModel
-    HAS_GENSIM = True
-except Exception:
-    HAS_GENSIM = False
+_nlp_version = None
 
-nlp = spacy.load("en_core_web_sm", disable=["ner", "textcat"])  # leaner model, no NER or text categorization
+def nlp_version() -> str:
+    """e.g. "core_web_sm-3.7.1"; stored with cached tokens so a model upgrade invalidates them."""
+    global _nlp_version
+    if _nlp_version is None:
+        meta = get_nlp().meta
+        _nlp_version = f"{meta.get('name', 'unknown')}-{meta.get('version', '0')}"
+    return _nlp_version
 
 # Common generic campus terms to downweight/ignore in tags/trends
 CONTEXT_STOP = set({
@@ -63,12 +69,35 @@ def extract_tags_from_text(text: str, top_n: int = 5) -> List[str]:
       - prefers multiword noun phrases and bigrams
       - falls back to unigram keywords
     """
-    doc = nlp(text.lower())
+    with metrics.span("spacy_parse", items=1):
+        doc = get_nlp()(text.lower())
+    toks, bi = _doc_tokens(doc)
+    _remember_tokens(text, toks, bi)  # the review POST usually follows with the same text
+    return _tags_from_doc(doc, toks, bi, top_n)
 
+def extract_tags_batch(texts: List[str], top_n: int = 5, batch_size: int = 64) -> List[List[str]]:
+    """
+    extract_tags_from_text for many comments at once (bulk imports): one nlp.pipe pass,
+    identical texts (case-insensitive, like the parse itself) are parsed once.
+    Returns one tag list per input text, in input order.
+    """
+    parsed = parse_texts(texts, top_n=top_n, batch_size=batch_size)
+    return [list(parsed[(t or "").lower()][0]) for t in texts]
+
+def parse_texts(texts, top_n: int = 5, batch_size: int = 64):
+    """{lowercased text: (tags, lemmas, bigrams)} for the distinct texts, from one nlp.pipe pass."""
+    unique = list(dict.fromkeys((t or "").lower() for t in texts))
+    parsed = {}
+    with metrics.span("spacy_parse", items=len(unique)):
+        for text, doc in zip(unique, get_nlp().pipe(unique, batch_size=batch_size)):
+            toks, bi = _doc_tokens(doc)
+            _remember_tokens(text, toks, bi)
+            parsed[text] = (_tags_from_doc(doc, toks, bi, top_n), toks, bi)
+    return parsed
+
+def _tags_from_doc(doc, toks, bi, top_n: int = 5) -> List[str]:
     # candidates: noun phrases > bigrams > unigrams
     phrases = list(_noun_phrases(doc))
-    toks = [t.lemma_.lower() for t in doc if _is_good_token(t)]
-    bi = list(_bigrams(toks))
     uni = [u for u in _unigrams(doc)]
 
     # score: frequency, with phrase multiplier
@@ -95,48 +124,229 @@ def extract_tags_from_text(text: str, top_n: int = 5) -> List[str]:
     # Final: plain strings (no # here; UI can add # if it wants)
     return ordered
 
-def preprocess_reviews(reviews):
+# ---- per-review token cache ----
+_RECENT_TOKENS = OrderedDict()  # text hash -> (lemmas, bigrams) from recent /generate_tags parses
+_RECENT_TOKENS_MAX = 512
+_recent_lock = threading.Lock()  # request threads and the post-processing worker share it
+
+
+def text_hash(text: str) -> str:
     """
-    For trending: return (keyword_lists, flat_keywords)
-    We include both unigrams and bigrams to make LDA/topic counts richer.
+    sha256 of the text, case-insensitive: spaCy parses text.lower() and MiniLM's tokenizer is
+    uncased, so a case-only edit changes neither the stored tokens nor the stored embedding.
+    The one hash for review_tokens, review_embedding and the recent-parse cache.
     """
-    all_keywords = []
-    flat_keywords = []
+    return hashlib.sha256((text or "").lower().encode("utf-8")).hexdigest()
+
+
+def _doc_tokens(doc):
+    toks = [t.lemma_.lower() for t in doc if _is_good_token(t)]
+    return toks, list(_bigrams(toks))
+
+
+def _remember_tokens(text, toks, bigrams):
+    key = text_hash(text)
+    with _recent_lock:
+        _RECENT_TOKENS[key] = (toks, bigrams)
+        _RECENT_TOKENS.move_to_end(key)
+        while len(_RECENT_TOKENS) > _RECENT_TOKENS_MAX:
+            _RECENT_TOKENS.popitem(last=False)
+
+
+def _recent_tokens(text):
+    with _recent_lock:
+        return _RECENT_TOKENS.get(text_hash(text))
+
+
+def _is_current(stored_hash, stored_version, review):
+    return stored_version == nlp_version() and stored_hash == text_hash(review.text)
+
+
+def save_tokens(token_rows):
+    """
+    Upsert [(review, lemmas, bigrams)] into review_tokens in one statement (does NOT commit).
+    An upsert rather than ORM adds, since the trending worker and the post-processing queue
+    may tokenize the same new review at the same time.
+    """
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    from .models import ReviewTokens
+    from app import db
+
+    if not token_rows:
+        return
+    stmt = sqlite_insert(ReviewTokens)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["review_id"],
+        set_={col: stmt.excluded[col] for col in ("text_hash", "nlp_version", "lemmas", "bigrams")},
+    )
+    db.session.execute(stmt, [
+        {"review_id": r.id, "text_hash": text_hash(r.text), "nlp_version": nlp_version(),
+         "lemmas": json.dumps(toks), "bigrams": json.dumps(bigrams)}
+        for r, toks, bigrams in token_rows
+    ])
+
+
+def tokenize_reviews(reviews, batch_size=256, n_process=1):
+    """
+    Parse a batch of reviews with nlp.pipe and store their tokens (does NOT commit).
+    Returns {review_id: (lemmas, bigrams)}.
+    """
+    reviews = [r for r in reviews if r.text]
+    with metrics.span("spacy_parse", items=len(reviews)):
+        docs = get_nlp().pipe((r.text.lower() for r in reviews), batch_size=batch_size, n_process=n_process)
+        token_rows = [(r, *_doc_tokens(doc)) for r, doc in zip(reviews, docs)]
+    save_tokens(token_rows)
+    return {r.id: (toks, bigrams) for r, toks, bigrams in token_rows}
+
+
+def analyze_reviews(reviews, tag_ids=(), batch_size=64, top_n=5):
+    """
+    Post-processing for freshly written reviews: stores every review's tokens and returns
+    {review_id: tags} for the ids in `tag_ids`, all from one nlp.pipe pass. Does NOT commit.
+    Reviews whose text was just parsed by /generate_tags (and need no tags) skip spaCy.
+    """
+    reviews = [r for r in reviews if r.text]
+    token_rows, to_parse = [], []
     for r in reviews:
-        if not r.text:
+        recent = _recent_tokens(r.text)
+        if recent is not None and r.id not in tag_ids:
+            token_rows.append((r, *recent))
+        else:
+            to_parse.append(r)
+
+    tags = {}
+    with metrics.span("spacy_parse", items=len(to_parse)):
+        for r, doc in zip(to_parse, get_nlp().pipe((r.text.lower() for r in to_parse), batch_size=batch_size)):
+            toks, bigrams = _doc_tokens(doc)
+            token_rows.append((r, toks, bigrams))
+            if r.id in tag_ids:
+                tags[r.id] = _tags_from_doc(doc, toks, bigrams, top_n)
+    save_tokens(token_rows)
+    return tags
+
+
+def _load_tokens(reviews, chunk_size=500):
+    """{review_id: (lemmas, bigrams)} for reviews whose stored tokens are current."""
+    from .models import ReviewTokens
+    from app import db
+
+    by_id = {r.id: r for r in reviews}
+    ids = list(by_id)
+    found = {}
+    for i in range(0, len(ids), chunk_size):
+        rows = db.session.query(ReviewTokens.review_id, ReviewTokens.text_hash, ReviewTokens.nlp_version,
+                                ReviewTokens.lemmas, ReviewTokens.bigrams
+                                ).filter(ReviewTokens.review_id.in_(ids[i:i + chunk_size]))
+        for review_id, stored_hash, stored_version, lemmas, bigrams in rows:
+            if _is_current(stored_hash, stored_version, by_id[review_id]):
+                found[review_id] = (json.loads(lemmas), json.loads(bigrams))
+    return found
+
+
+def _cached_tokens(reviews):
+    """{review_id: (lemmas, bigrams)}; parses + stores any review whose cache is missing or stale."""
+    from app import db
+
+    reviews = [r for r in reviews if r.text]
+    found = _load_tokens(reviews)
+    stale = [r for r in reviews if r.id not in found]
+    if stale:
+        found.update(tokenize_reviews(stale))
+        db.session.commit()
+    return found
+
+
+def backfill_review_tokens(batch_size=256, n_process=1, chunk_size=2000):
+    """
+    Fill/refresh review_tokens for every review whose cache is missing or stale.
+    Pages through reviews by id and commits once per chunk. Returns how many were parsed.
+    """
+    from .models import Review
+    from app import db
+
+    parsed = 0
+    last_id = 0
+    while True:
+        chunk = (db.session.query(Review.id, Review.text).filter(Review.id > last_id)
+                 .order_by(Review.id).limit(chunk_size).all())
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        chunk = [r for r in chunk if r.text]
+        current = _load_tokens(chunk)
+        stale = [r for r in chunk if r.id not in current]
+        if stale:
+            tokenize_reviews(stale, batch_size=batch_size, n_process=n_process)
+            parsed += len(stale)
+        db.session.commit()
+    return parsed
+
+
+def review_documents(reviews):
+    """
+    [(review, tokens)] for reviews with at least 2 good tokens, where tokens = lemmas + bigrams
+    (bigrams included to make LDA/topic counts richer). Tokens come from the review_tokens
+    cache; only new or edited reviews get parsed.
+    """
+    cached = _cached_tokens(reviews)
+    docs = []
+    for r in reviews:
+        if r.id not in cached:
             continue
-        doc = nlp(r.text.lower())
-        toks = [t.lemma_.lower() for t in doc if _is_good_token(t)]
+        toks, bigrams = cached[r.id]
         if len(toks) >= 2:
-            # include bigrams as tokens too
-            bigrams = list(_bigrams(toks))
-            tokens = toks + bigrams
-            all_keywords.append(tokens)
-            flat_keywords.extend(tokens)
+            docs.append((r, toks + bigrams))
+    return docs
+
+
+def preprocess_reviews(reviews):
+    """For trending: return (keyword_lists, flat_keywords)."""
+    all_keywords = []
+    flat_keywords = []
+    for _, tokens in review_documents(reviews):
+        all_keywords.append(tokens)
+        flat_keywords.extend(tokens)
     return all_keywords, flat_keywords
 
-def extract_trending_hashtags(reviews, num_topics=5, num_words=5, top_n=5):
+
+def topic_terms_from_model(lda_model, topic_ids, num_words=5):
+    """Clean display terms for the given topics of a trained gensim LDA model."""
+    terms = []
+    for topic_id in topic_ids:
+        for w, _ in lda_model.show_topic(topic_id, topn=num_words):
+            w_norm = _normalize(w)
+            if w_norm and w_norm not in CONTEXT_STOP:
+                terms.append(w_norm)
+    return terms
+
+def extract_trending_hashtags(reviews, num_topics=5, num_words=5, top_n=5, topic_terms=None):
     """
     Combine simple frequency with (optional) LDA topic terms.
     Gracefully fallback to frequency-only if gensim not available or data too small.
+    Pass `topic_terms` (e.g. from the persistent TopicModel) to skip training an LDA here.
     Returns tags WITH # for display convenience.
     """
-    keyword_lists, flat_keywords = preprocess_reviews(reviews)
+    with metrics.span("preprocess_reviews", items=len(reviews)):
+        keyword_lists, flat_keywords = preprocess_reviews(reviews)
     if not keyword_lists:
         return []
 
     base_counts = Counter(flat_keywords)
 
-    topic_terms = []
-    if HAS_GENSIM and len(keyword_lists) >= 3:
+    train_here = topic_terms is None
+    topic_terms = list(topic_terms or [])
+    if train_here and HAS_GENSIM and len(keyword_lists) >= 3:
         try:
+            from gensim import corpora
+            from gensim.models import LdaModel
             dictionary = corpora.Dictionary(keyword_lists)
             corpus = [dictionary.doc2bow(tokens) for tokens in keyword_lists]
-            lda_model = LdaModel(
-                corpus=corpus, id2word=dictionary,
-                num_topics=max(1, min(num_topics, len(keyword_lists))),
-                random_state=42, passes=8
-            )
+            with metrics.span("lda_train", items=len(corpus)):
+                lda_model = LdaModel(
+                    corpus=corpus, id2word=dictionary,
+                    num_topics=max(1, min(num_topics, len(keyword_lists))),
+                    random_state=42, passes=8
+                )
             for _, topic_str in lda_model.print_topics(num_words=num_words):
                 # topic_str example: '0.04*"food" + 0.03*"study spaces" + ...'
                 for part in topic_str.split('+'):
@@ -149,13 +359,17 @@ def extract_trending_hashtags(reviews, num_topics=5, num_words=5, top_n=5):
             pass
 
     combined = base_counts + Counter(topic_terms)
+    return rank_hashtags(combined, top_n)
+
 
+def rank_hashtags(scores, top_n=5):
+    """Top `top_n` terms of a {term: score} mapping as "#term" strings."""
     # prefer multiword > unigram in ties
     def sort_key(item):
         word, freq = item
         return (freq, 1 if " " in word else 0)
 
-    top = sorted(combined.items(), key=sort_key, reverse=True)
+    top = sorted(scores.items(), key=sort_key, reverse=True)
     final = []
     seen = set()
     for word, _ in top:
@@ -0,0 +1,120 @@
+"""
+CPU inference for the MiniLM sentence encoder through ONNX Runtime instead of PyTorch.
+
+`flask export-onnx [--quantize]` exports the transformer once (needs torch, onnx and
+sentence-transformers on the exporting machine) into ONNX_MODEL_DIR, by default
+<instance>/onnx/<model>/:
+
+  model.onnx        float32 graph: input_ids/attention_mask/token_type_ids -> last_hidden_state
+  model-int8.onnx   the same with dynamically quantized int8 weights (--quantize)
+  tokenizer.json    the model's fast tokenizer
+  meta.json         model name, max_seq_length, embedding dim
+
+At runtime only onnxruntime, tokenizers and numpy are needed. OnnxSentenceEncoder.encode
+matches SentenceTransformer.encode for this model: same tokenizer and truncation, mean pooling
+over the attention mask, optional L2 normalization.
+"""
+import json
+import os
+import numpy as np
+
+MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model-int8.onnx"}
+# lowest acceptable cosine vs. the torch encoder on any parity text (export-onnx, the benchmark)
+MIN_COSINE = {"onnx": 0.99, "onnx-int8": 0.98}
+
+
+class OnnxSentenceEncoder:
+    """Drop-in for the subset of SentenceTransformer the app uses (encode + max_seq_length)."""
+
+    def __init__(self, directory, backend="onnx", threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.max_seq_length = self.meta.get("max_seq_length", 256)
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")  # pad to the longest in the batch
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(directory, MODEL_FILES[backend]), options,
+                                            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]  # (b, t, d)
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)   # mean pooling
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **_):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.meta.get("dim", 0)), dtype=np.float32)
+
+        # like sentence-transformers: batch by length so padding stays small, then restore order
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.meta["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+def export(model_name, directory, quantize=False, max_seq_length=256, opset=14):
+    """Export the SentenceTransformer `model_name` to ONNX (and optionally int8). Returns the directory."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(directory, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    st_model.tokenizer.save_pretrained(directory)  # writes tokenizer.json for the fast tokenizer
+
+    dummy = st_model.tokenizer(["an example sentence"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic = {n: {0: "batch", 1: "tokens"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "tokens"}
+
+    class _Hidden(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(names, args))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(_Hidden(transformer), tuple(dummy[n] for n in names),
+                          os.path.join(directory, MODEL_FILES["onnx"]), input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=dynamic, opset_version=opset)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(directory, MODEL_FILES["onnx"]),
+                         os.path.join(directory, MODEL_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"model": model_name, "max_seq_length": max_seq_length,
+                   "dim": st_model.get_sentence_embedding_dimension()}, f)
+    return directory
+
+
+def parity(reference, candidate, sentences):
+    """Cosine between the two encoders' normalized embeddings of `sentences`: (min, mean)."""
+    a = reference.encode(sentences, normalize_embeddings=True)
+    b = candidate.encode(sentences, normalize_embeddings=True)
+    cos = np.sum(a * b, axis=1)
+    return float(cos.min()), float(cos.mean())
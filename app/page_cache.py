@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import request, make_response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from .models import CacheGeneration
+from .metrics import metrics
+
+
+class MemoryBackend:
+    """In-process LRU of rendered pages (one per worker)."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """
+    Rendered pages in a small side database (instance/page_cache.db) shared by every worker.
+    Kept apart from the main database so cache churn never competes with review writes.
+    Oldest entries are pruned past `maxsize`.
+    """
+
+    def __init__(self, path, maxsize=2000, prune_every=64):
+        self.path = path
+        self.maxsize = maxsize
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()  # guards _writes; the connections are per thread
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # it's a cache: losing it on a crash is fine
+            conn.execute("CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, body BLOB, stored_at REAL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT body FROM page WHERE key = ?", (key,)).fetchone()
+        return row[0].decode("utf-8") if row else None
+
+    def set(self, key, body):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO page (key, body, stored_at) VALUES (?, ?, ?)",
+                     (key, body.encode("utf-8"), time.time()))
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            conn.execute("DELETE FROM page WHERE key NOT IN "
+                         "(SELECT key FROM page ORDER BY stored_at DESC LIMIT ?)", (self.maxsize,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM page")
+
+
+class PageCache:
+    """
+    Rendered-page cache for the read-mostly GET routes (home, colleges, college profiles).
+
+    A page's key includes the current generation of every scope it depends on; write paths
+    bump those generations (`bump`) inside their own transaction, so a new review makes the
+    old entries unreachable instead of having to find and delete them. Generations live in
+    the main database, so every worker (and CLI commands like `ingest`) sees the same ones.
+    The key also doubles as the ETag: a repeat visitor whose If-None-Match still matches gets
+    a 304 before anything is looked up or rendered.
+
+    Scopes: "listing" (home + /colleges), "college:<key>" (one profile) and "reset"
+    (everything, bumped by /admin/clear_reviews).
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.backend = MemoryBackend()
+
+    def init_app(self, app):
+        mode = app.config.get("PAGE_CACHE", "memory")  # memory | sqlite | off
+        size = int(app.config.get("PAGE_CACHE_SIZE", 256))
+        self.enabled = mode != "off"
+        if mode == "sqlite":
+            path = app.config.get("PAGE_CACHE_PATH", os.path.join(app.instance_path, "page_cache.db"))
+            self.backend = SQLiteBackend(path, maxsize=size)
+        else:
+            self.backend = MemoryBackend(maxsize=size)
+
+    # ---- write side ----
+    def bump(self, *scopes):
+        """Invalidate every page depending on `scopes` (does NOT commit: call before the write's commit)."""
+        for scope in dict.fromkeys(scopes):
+            db.session.execute(
+                sqlite_insert(CacheGeneration).values(scope=scope, generation=1)
+                .on_conflict_do_update(index_elements=["scope"],
+                                       set_={"generation": CacheGeneration.generation + 1})
+            )
+
+    # ---- read side ----
+    def generations(self, scopes):
+        rows = db.session.query(CacheGeneration.scope, CacheGeneration.generation).filter(
+            CacheGeneration.scope.in_(scopes))
+        found = dict(rows)
+        return tuple(found.get(scope, 0) for scope in scopes)
+
+    def page(self, name, scopes, render, vary=()):
+        """
+        Response for page `name` (rendered by `render()` on a miss), cached under the
+        generations of `scopes` plus any `vary` values (query args, the trending fingerprint...).
+        """
+        if not self.enabled:
+            return make_response(render())
+        scopes = ("reset",) + tuple(scopes)
+        key = f"{name}|{vary!r}|{self.generations(scopes)!r}"
+        etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+        if etag in request.if_none_match:
+            metrics.inc("cache_requests_total", cache="page", result="not_modified")
+            response = make_response("", 304)
+        else:
+            body = self.backend.get(key)
+            metrics.inc("cache_requests_total", cache="page", result="hit" if body is not None else "miss")
+            if body is None:
+                body = render()
+                self.backend.set(key, body)
+            response = make_response(body)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"  # always revalidate; it's just a 304
+        return response
+
+
+page_cache = PageCache()
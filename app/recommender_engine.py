@@ -0,0 +1,101 @@
+import threading
+import numpy as np
+from .aggregate_utils import RATING_CATEGORIES
+from .page_cache import page_cache
+from .trending import trending
+
+
+class _Snapshot:
+    """Immutable feature matrices for every rankable college (swapped in whole on refresh)."""
+
+    def __init__(self, version, colleges):
+        self.version = version
+        self.colleges = colleges
+        self.ratings = np.array(
+            [[float(c['category_ratings'].get(cat) or 0.0) for cat in RATING_CATEGORIES] for c in colleges],
+            dtype=np.float64,
+        ).reshape(len(colleges), len(RATING_CATEGORIES))                   # (n, categories), 0..10
+
+        self.has_tags = np.array([c.get('tag_vec') is not None for c in colleges], dtype=bool)
+        dim = next((len(c['tag_vec']) for c in colleges if c.get('tag_vec') is not None), 0)
+        self.tag_vecs = np.zeros((len(colleges), dim), dtype=np.float32)   # (n, d), unit rows
+        for i, c in enumerate(colleges):
+            if self.has_tags[i]:
+                v = np.asarray(c['tag_vec'], dtype=np.float32).ravel()
+                n = np.linalg.norm(v)
+                self.tag_vecs[i] = v / n if n else v
+
+
+class RecommenderEngine:
+    """
+    Dense features for /recommend: a (colleges x categories) ratings matrix and a
+    (colleges x d) matrix of unit tag vectors, built from get_college_stats() and rebuilt
+    only when the page-cache "listing" generation (bumped by every review write) or the
+    trending hashtags change. rank() then scores all colleges with a couple of NumPy ops
+    instead of a Python loop per college and category.
+    """
+
+    def __init__(self, alpha=0.6):
+        self.alpha = alpha  # max tag-similarity bonus
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _version(self):
+        return page_cache.generations(("reset", "listing")) + (trending.fingerprint(),)
+
+    def snapshot(self):
+        version = self._version()
+        snap = self._snapshot
+        if snap is not None and snap.version == version:
+            return snap
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                from .routes import get_college_stats
+                colleges = [c for c in get_college_stats() if c.get('avg_rating') is not None]
+                self._snapshot = _Snapshot(version, colleges)
+            return self._snapshot
+
+    def rank(self, prefs, query_vec=None):
+        """
+        Score every college against [(category, weight)] preferences (+ a tag bonus when a
+        query vector is given). Returns copies of the college dicts, best first, with
+        match_score / cat_score / tag_bonus / contributions filled in, exactly as the old
+        per-college score_and_explain produced them.
+        """
+        snap = self.snapshot()
+        n = len(snap.colleges)
+        if not n:
+            return []
+
+        prefs = [(cat, weight) for cat, weight in (prefs or []) if cat in RATING_CATEGORIES]
+        cols = [RATING_CATEGORIES.index(cat) for cat, _ in prefs]
+        weights = np.array([w for _, w in prefs], dtype=np.float64)
+        values = snap.ratings[:, cols]                                       # (n, p)
+        points = values * weights                                           # (n, p)
+        den = weights.sum()
+        cat_scores = points.sum(axis=1) / den if den else np.zeros(n)
+
+        tag_bonus = np.zeros(n)
+        if query_vec is not None and snap.has_tags.any():
+            q = np.asarray(query_vec, dtype=np.float32).ravel()
+            q = q / (np.linalg.norm(q) or 1.0)
+            s01 = np.clip((snap.tag_vecs @ q + 1.0) / 2.0, 0.0, None)       # cosine -> [0, 1]
+            tag_bonus = np.where(snap.has_tags, np.round(self.alpha * s01, 2), 0.0)
+
+        final = np.round(np.minimum(10.0, cat_scores + tag_bonus), 2)
+
+        ranked = []
+        for i in np.argsort(-final, kind="stable"):  # ties keep get_college_stats order
+            college = dict(snap.colleges[i])
+            college['match_score'] = float(final[i])
+            college['cat_score'] = round(float(cat_scores[i]), 2)
+            college['tag_bonus'] = round(float(tag_bonus[i]), 2)
+            college['contributions'] = [
+                (cat, round(w, 4), round(float(values[i, j]), 2), round(float(points[i, j]), 2))
+                for j, (cat, w) in enumerate(prefs)
+            ]
+            ranked.append(college)
+        return ranked
+
+
+recommender = RecommenderEngine()
@@ -1,9 +1,16 @@
-from sentence_transformers import SentenceTransformer, util
-import torch
-model = SentenceTransformer('all-MiniLM-L6-v2')
-model.max_seq_length = 256
+import hashlib
+import json
+import os
 import numpy as np
 import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from .model_registry import SENTENCE_MODEL_NAME, encode, encoder_backend
+from .metrics import metrics
+from .tag_embedding_store import tag_store
+from .tag_index import normalize_tag
 
 category_anchors = {
     "study": ["academics", "grades", "homework", "GPA", "learning", "studying", "rigor", "coursework", "professors"],
@@ -28,24 +35,159 @@ def _explicit_boosts(user_input: str, boost=0.15):
             bumps[cat] = bumps.get(cat, 0.0) + boost
     return bumps
 
-anchor_embeddings = {
-    category: model.encode(words, convert_to_tensor=True) # Encode each category's anchor words
-    for category, words in category_anchors.items() # Create embeddings for each category's anchor words 
-}
+# ---- category anchors as one precomputed matrix ----
+# All anchor phrases are encoded once into a normalized (num_anchors x d) matrix, rows grouped by
+# category; _anchor_offsets[i] is where category i's rows start. The matrix is saved under
+# ANCHOR_CACHE_DIR (<instance>/anchor_cache/ once init_app ran), keyed by model name, encoder
+# backend and a hash of category_anchors, so restarts don't re-encode.
+ANCHOR_CACHE_DIR = None  # None = no cache file (outside an app), encode on every start
+ANCHOR_SCORING = "centroid"  # "centroid" | "segment", from app.config in init_app
+
+_anchor_lock = threading.Lock()
+_anchor_categories = None
+_anchor_matrix = None
+_anchor_offsets = None
+_anchor_centroids = None
+
+def init_app(app):
+    global ANCHOR_CACHE_DIR, ANCHOR_SCORING
+    ANCHOR_CACHE_DIR = app.config.get("ANCHOR_CACHE_DIR") or os.path.join(app.instance_path, "anchor_cache")
+    ANCHOR_SCORING = app.config.get("ANCHOR_SCORING", "centroid")
+
+def _anchor_cache_path():
+    if ANCHOR_CACHE_DIR is None:
+        return None
+    digest = hashlib.sha256(json.dumps(category_anchors, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    # onnx / onnx-int8 vectors differ slightly from torch ones, so each backend has its own file
+    return os.path.join(ANCHOR_CACHE_DIR, f"anchors-{SENTENCE_MODEL_NAME}-{encoder_backend()}-{digest}.npz")
+
+def _build_anchor_matrix():
+    categories = list(category_anchors)
+    phrases, offsets = [], []
+    for category in categories:
+        offsets.append(len(phrases))
+        phrases.extend(category_anchors[category])
+    matrix = encode(phrases, caller="anchors", normalize_embeddings=True).astype(np.float32)  # one batched call
+    return categories, matrix, np.asarray(offsets, dtype=np.int64)
+
+def _load_anchor_matrix():
+    global _anchor_categories, _anchor_matrix, _anchor_offsets, _anchor_centroids
+    path = _anchor_cache_path()
+    loaded = None
+    if path is not None:
+        try:
+            with np.load(path) as data:
+                loaded = [str(c) for c in data["categories"]], data["matrix"], data["offsets"]
+        except (OSError, KeyError, ValueError):
+            pass
+    if loaded is None:
+        loaded = _build_anchor_matrix()
+        if path is not None:
+            try:
+                os.makedirs(ANCHOR_CACHE_DIR, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=ANCHOR_CACHE_DIR, suffix=".tmp.npz")  # unique per writer
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        np.savez(f, categories=np.asarray(loaded[0]), matrix=loaded[1], offsets=loaded[2])
+                    os.replace(tmp, path)
+                except OSError:
+                    os.unlink(tmp)
+                    raise
+            except OSError:
+                pass  # read-only deploys just re-encode on the next start
+    categories, matrix, offsets = loaded
+
+    counts = np.diff(np.append(offsets, len(matrix)))
+    # mean of dot products == dot product with the (unnormalized) mean vector, so the
+    # (num_categories x d) centroid matrix gives exactly the same scores as the segment mean
+    centroids = np.add.reduceat(matrix, offsets, axis=0) / counts[:, None]
+    _anchor_categories, _anchor_matrix, _anchor_offsets = categories, matrix, offsets
+    _anchor_centroids = centroids.astype(np.float32)
+
+def _ensure_anchors():
+    if _anchor_matrix is None:
+        with _anchor_lock:
+            if _anchor_matrix is None:
+                _load_anchor_matrix()
+
+def anchor_scores(query_vec, mode=None):
+    """{category: mean cosine between the normalized query and that category's anchors}."""
+    _ensure_anchors()
+    if (mode or ANCHOR_SCORING) == "segment":
+        sims = _anchor_matrix @ query_vec                              # one (num_anchors,) matmul
+        counts = np.diff(np.append(_anchor_offsets, len(sims)))
+        means = np.add.reduceat(sims, _anchor_offsets) / counts        # segment mean per category
+    else:
+        means = _anchor_centroids @ query_vec                          # (num_categories,)
+    return {c: float(m) for c, m in zip(_anchor_categories, means)}
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU + TTL cache of query embeddings keyed on normalized text, so the same
+    search string is encoded once no matter how many scoring functions look at it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, vector)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+    def get(self, text: str):
+        key = self.key(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                metrics.inc("cache_requests_total", cache="query_embedding", result="hit")
+                return entry[1]
+            self.misses += 1
+        metrics.inc("cache_requests_total", cache="query_embedding", result="miss")
+
+        vec = encode(key, caller="query", normalize_embeddings=True).astype(np.float32)
+        vec.setflags(write=False)  # shared between requests
+        with self._lock:
+            self._data[key] = (now + self.ttl, vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return vec
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+query_cache = QueryEmbeddingCache()
+
+def encode_query(text: str) -> np.ndarray:
+    """Normalized float32 embedding of a user query (cached)."""
+    return query_cache.get(text)
 
 def softmax(x):
     e_x = np.exp(x - np.max(x))  # improves numerical stability
     return e_x / e_x.sum()
 
-def get_priorities_from_text(user_input, top_n=3, manual_weights=None, min_threshold=0.12):
-    input_embedding = model.encode(user_input, convert_to_tensor=True)
+def get_priorities_from_text(user_input, top_n=3, manual_weights=None, min_threshold=0.12, query_vec=None):
+    if query_vec is None:
+        query_vec = encode_query(user_input)
 
-    # 1) base similarity
-    scores = {}
-    for category, embeddings in anchor_embeddings.items():
-        sim = util.cos_sim(input_embedding, embeddings)
-        avg = float(sim.mean())
-        scores[category] = avg
+    # 1) base similarity (anchors and query are normalized, so dot product == cosine)
+    scores = anchor_scores(query_vec)
 
     # 2) explicit keyword bumps
     for cat, bump in _explicit_boosts(user_input, boost=0.15).items():
@@ -68,46 +210,35 @@ def get_priorities_from_text(user_input, top_n=3, manual_weights=None, min_thres
     w = softmax(raw)
     return [(cat, float(round(wi, 4))) for (cat, _), wi in zip(top, w)]
 
-_TAG_EMB_CACHE = {}
-
-def _normalize_tag(t: str) -> str:
-    """Lowercase, strip leading '#', remove odd punctuation/spaces."""
-    t = (t or "").strip().lower()
-    if t.startswith("#"):
-        t = t[1:]
-    # keep letters/numbers/spaces/dashes/underscores/slashes
-    t = re.sub(r"[^a-z0-9\-\_/ ]", "", t)
-    # collapse whitespace -> single space
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
-
 def _embed_tag(tag: str):
-    """Memoize individual tag embeddings for speed."""
-    key = _normalize_tag(tag)
+    """Single tag embedding from the shared tag store (None for tags that normalize to '')."""
+    key = normalize_tag(tag)
     if not key:
         return None
-    if key in _TAG_EMB_CACHE:
-        return _TAG_EMB_CACHE[key]
-    emb = model.encode(key, convert_to_tensor=True)
-    _TAG_EMB_CACHE[key] = emb
-    return emb
+    return tag_store.get(key)
 
-def _mean_pool_tensors(tensors):
-    return torch.stack(tensors, dim=0).mean(dim=0) if tensors else None
+def _embed_tags(raw_tags):
+    """(kept_tags, (n, d) matrix) for a tag list; all uncached tags are encoded in one batch."""
+    kept = [(t, normalize_tag(t)) for t in raw_tags or []]
+    kept = [(t, key) for t, key in kept if key]
+    if not kept:
+        return [], None
+    return [t for t, _ in kept], tag_store.get_many([key for _, key in kept])
 
 def build_college_tag_vector(raw_tags):
     """
     Build a single mean-pooled embedding for a college's tag list.
     Call this once when you assemble college data (e.g., in get_college_stats()).
     """
-    vecs = []
-    for t in raw_tags or []:
-        emb = _embed_tag(t)
-        if emb is not None:
-            vecs.append(emb)
-    return _mean_pool_tensors(vecs)
-
-def tag_similarity_boost_from_vec(query_text: str, tag_vec, alpha: float = 0.6) -> float:
+    _, vecs = _embed_tags(raw_tags)
+    return vecs.mean(axis=0) if vecs is not None else None
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32).ravel()
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+def tag_similarity_boost_from_vec(query_text: str, tag_vec, alpha: float = 0.6, query_vec=None) -> float:
     """
     Compute a small additive bonus from similarity between query and a precomputed tag vector.
     - cosine s in [-1, 1] -> [0, 1] via (s+1)/2
@@ -116,22 +247,35 @@ def tag_similarity_boost_from_vec(query_text: str, tag_vec, alpha: float = 0.6)
     """
     if not query_text or tag_vec is None:
         return 0.0
-    q = model.encode(query_text, convert_to_tensor=True)
-    s = float(util.cos_sim(q, tag_vec).item())        # [-1, 1]
-    s01 = max(0.0, (s + 1.0) / 2.0)                   # [0, 1]
-    return round(alpha * s01, 2)
+    if query_vec is None:
+        query_vec = encode_query(query_text)
+    return tag_similarity_boosts(query_vec, [tag_vec], alpha=alpha)[0]
+
+def tag_similarity_boosts(query_vec, tag_vecs, alpha: float = 0.6):
+    """
+    Same bonus as tag_similarity_boost_from_vec for many colleges at once:
+    one (n, d) @ (d,) product instead of one cos_sim per college. None entries get 0.0.
+    """
+    bonuses = [0.0] * len(tag_vecs)
+    present = [i for i, v in enumerate(tag_vecs) if v is not None]
+    if query_vec is None or not present:
+        return bonuses
+    matrix = np.stack([_unit(tag_vecs[i]) for i in present])
+    sims = matrix @ _unit(query_vec)                      # [-1, 1]
+    s01 = np.clip((sims + 1.0) / 2.0, 0.0, None)          # [0, 1]
+    for i, b in zip(present, alpha * s01):
+        bonuses[i] = round(float(b), 2)
+    return bonuses
 
 # Optional for “why” explanation:
-def top_similar_tags(query_text: str, tags, k=3):
+def top_similar_tags(query_text: str, tags, k=3, query_vec=None):
     if not query_text or not tags:
         return []
-    q = model.encode(query_text, convert_to_tensor=True)
-    scored = []
-    for t in tags:
-        emb = _embed_tag(t)
-        if emb is None:
-            continue
-        s = float(util.cos_sim(q, emb).item())
-        scored.append((t, s))
+    if query_vec is None:
+        query_vec = encode_query(query_text)
+    kept, vecs = _embed_tags(tags)
+    if vecs is None:
+        return []
+    scored = list(zip(kept, (vecs @ query_vec).tolist()))
     scored.sort(key=lambda x: x[1], reverse=True)
-    return [t for t, _ in scored[:k]]
\ No newline at end of file
+    return [t for t, _ in scored[:k]]
@@ -1,32 +1,39 @@
-from flask import Blueprint, render_template, request, redirect, url_for
-from .models import Review
+from flask import Blueprint, Response, render_template, request, redirect, url_for
+from .models import Review, ReviewEmbedding, ReviewTokens, PostprocessJob, CollegeAggregate
 import json
 from flask import jsonify
 import os
 from app import db
-from .nlp_utils import extract_trending_hashtags
+from .trending import trending
+from .theme_engine import theme_engine
+from . import tag_index, trend_buckets
+from .jobs import postprocess_queue
+from .page_cache import page_cache
+from .metrics import metrics
 from .recommender_utils import (
     get_priorities_from_text,
     build_college_tag_vector,
-    tag_similarity_boost_from_vec,
+    encode_query,
+    query_cache,
+    top_similar_tags,
+)
+from .recommender_engine import recommender
+from .embedding_utils import embed_text
+from .nlp_utils import text_hash
+from .embedding_index import embedding_index
+from .aggregate_utils import (
+    RATING_CATEGORIES, category_averages, get_aggregates, summarize, apply_review, reset_aggregates,
+    rating_trend,
 )
-from .embedding_utils import upsert_review_embedding
-
-def calculate_avg_ratings(reviews):
-    categories = ['food', 'social', 'clubs', 'study', 'opportunities']
-    avg_ratings = {}
-    for category in categories:
-        values = [getattr(r, category) for r in reviews if getattr(r, category) not in (None, 0)]
-        if values:
-            avg_ratings[category] = round(sum(values) / len(values), 1)
-        else:
-            avg_ratings[category] = None  # None means not rated yet
-    return avg_ratings
 
 
 COLLEGE_JSON_PATH = os.path.join(os.path.dirname(__file__), '../data/colleges.json')
 
 def get_college_stats():
+    with metrics.span("college_stats"):
+        return _college_stats()
+
+def _college_stats():
     college_display_names = {
         "uc": "University College",
         "trinity": "Trinity College",
@@ -37,30 +44,14 @@ def get_college_stats():
         "new": "New College"
     }
 
+    aggregates = get_aggregates()  # one query for all colleges
     college_data = []
     for college_key, display_name in college_display_names.items():
-        reviews = Review.query.filter_by(college_name=college_key).all()
-
-        if reviews:
-            # Compute the average rating per review (only over non-zero categories)
-            per_review_avgs = []
-            for r in reviews:
-                scores = [r.food, r.social, r.clubs, r.study, r.opportunities]
-                valid_scores = [s for s in scores if s is not None]
-                if valid_scores:
-                    per_review_avgs.append(sum(valid_scores) / len(valid_scores))
-
-            # Count how many categories across all reviews actually got rated
-            category_ratings = calculate_avg_ratings(reviews)
-            num_valid_categories = sum(1 for score in category_ratings.values() if score is not None)
-
-            # Require at least 3 categories to be rated to include in Top-Rated
-            if per_review_avgs and num_valid_categories >= 3:
-                avg_score = round(sum(per_review_avgs) / len(per_review_avgs), 2)
-            else:
-                avg_score = None  # Will be excluded from top-rated list
-            has_few_ratings = len(reviews) < 3 or num_valid_categories < 3
-            hashtags = extract_trending_hashtags(reviews, num_topics=3, num_words=4)[:3]
+        agg = aggregates.get(college_key)
+
+        if agg and agg.review_count:
+            avg_score, category_ratings, has_few_ratings = summarize(agg)
+            hashtags = trending.get_college(college_key)  # cached, refreshed in the background
             # NEW: normalize + vectorize once per college
             clean_tags = []
             for t in hashtags or []:
@@ -93,6 +84,46 @@ def get_college_stats():
 
     return sorted(college_data, key=lambda x: x['avg_rating'] or 0, reverse=True)
 
+REVIEW_PAGE_SIZE = 20
+GENERATE_TAGS_MAX_TEXTS = 5000  # per /generate_tags/batch request
+
+def get_review_page(college_key, after=None, limit=REVIEW_PAGE_SIZE):
+    """
+    One page of a college's reviews, newest first, using the (college_name, id) index:
+    `after` is the last id of the previous page. Only the displayed columns are selected and
+    tags/rated categories come back decoded. Returns (reviews, next_after or None).
+    """
+    q = _review_columns().filter(Review.college_name == college_key)
+    if after is not None:
+        q = q.filter(Review.id < after)
+    rows = q.order_by(Review.id.desc()).limit(limit + 1).all()  # one extra row tells us if there's a next page
+
+    page = [_review_dict(row) for row in rows[:limit]]
+    next_after = page[-1]["id"] if len(rows) > limit else None
+    return page, next_after
+
+def get_tagged_review_page(tag, college_key=None, after=None, limit=REVIEW_PAGE_SIZE):
+    """Like get_review_page, for reviews carrying `tag` (ids come from the review_tag index)."""
+    ids = tag_index.tagged_review_ids(tag, college=college_key, after=after, limit=limit + 1)
+    rows = _review_columns().filter(Review.id.in_(ids[:limit])).order_by(Review.id.desc()).all()
+    page = [_review_dict(row) for row in rows]
+    next_after = ids[limit - 1] if len(ids) > limit else None
+    return page, next_after
+
+def _review_columns():
+    return db.session.query(
+        Review.id, Review.college_name, Review.user, Review.text, Review.food, Review.social, Review.clubs,
+        Review.study, Review.opportunities, Review.tags, Review.rated_categories,
+    )
+
+def _review_dict(row):
+    review = row._asdict()
+    review["tags"] = json.loads(row.tags or "[]")
+    review["rated_categories"] = json.loads(row.rated_categories or "[]")
+    nonzero = [review[c] for c in RATING_CATEGORIES if review[c]]
+    review["avg"] = round(sum(nonzero) / len(nonzero), 1) if nonzero else None
+    return review
+
 with open(COLLEGE_JSON_PATH) as f:
     college_info = json.load(f)
 
@@ -102,24 +133,51 @@ main = Blueprint('main', __name__) # This creates a blueprint named 'main' for o
 
 @main.route('/')
 def home():
-    all_reviews = Review.query.all()
-    trending_hashtags = extract_trending_hashtags(all_reviews) 
+    def render():
+        trending_hashtags = trending.get_global()
+
+        all_college_stats = get_college_stats()
+        top_colleges = [c for c in all_college_stats if not c['has_few_ratings']][:3] # Get top 3 colleges with sufficient ratings
 
-    all_college_stats = get_college_stats()
-    top_colleges = [c for c in all_college_stats if not c['has_few_ratings']][:3] # Get top 3 colleges with sufficient ratings
+        return render_template('home.html', top_colleges=top_colleges, trending_tags=trending_hashtags)
 
-    return render_template('home.html', top_colleges=top_colleges, trending_tags=trending_hashtags)
+    return page_cache.page("home", ("listing",), render, vary=(trending.fingerprint(),))
 
 @main.route('/admin/clear_reviews')
 def clear_reviews():
+    ReviewTokens.query.delete()
+    trend_buckets.reset()
+    tag_index.reset()
+    PostprocessJob.query.delete()
+    ReviewEmbedding.query.delete()
     Review.query.delete()
+    reset_aggregates()
+    page_cache.bump("reset")
     db.session.commit()
+    embedding_index.rebuild()  # now empty; the rewritten files make other workers drop their vectors too
+    theme_engine.reset()
+    trending.invalidate()
     return "All reviews deleted."
 
+@main.route('/admin/cache_stats')
+def cache_stats():
+    return jsonify({"query_embeddings": query_cache.stats()})
+
+@main.route('/metrics')
+def metrics_endpoint():
+    """Counters and latency histograms for this worker, in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@main.route('/admin/jobs')
+def job_status():
+    return jsonify(postprocess_queue.status_counts())
+
 @main.route('/colleges')
 def colleges():
-    college_data = get_college_stats()
-    return render_template('colleges.html', colleges=college_data)
+    def render():
+        return render_template('colleges.html', colleges=get_college_stats())
+
+    return page_cache.page("colleges", ("listing",), render, vary=(trending.fingerprint(),))
 
 @main.route('/colleges/<college_name>', methods=["GET", "POST"])
 def college_profile(college_name):
@@ -141,25 +199,104 @@ def college_profile(college_name):
             study=val("study"),
             opportunities=val("opportunities"),
             tags=json.dumps(data.get("tags", [])),
-            rated_categories=json.dumps(list(rated))
+            rated_categories=json.dumps(list(rated)),
+            # same whitespace-collapsed hash as bulk ingestion, so an ingest run skips posted reviews too
+            content_hash=text_hash(" ".join((data.get("text") or "").split()))
         )
 
         db.session.add(review)
+        db.session.flush()
+        apply_review(review)  # same transaction as the insert
+        tag_index.sync_reviews([review], new=True)
+        page_cache.bump("listing", f"college:{review.college_name}")
+        postprocess_queue.enqueue(review.id)  # tags/tokens + embedding happen off the request path
         db.session.commit()
-        upsert_review_embedding(review.id)
-        return jsonify({"status": "success"}), 200
+        postprocess_queue.notify()
+        trending.note_new_review(review.college_name)
+        return jsonify({"status": "success", "review_id": review.id}), 200
+
+    college_key = college_name.lower()
+    after = request.args.get("after", type=int)
+
+    def render():
+        reviews, next_after = get_review_page(college_key, after=after)
+        avg_ratings = category_averages(db.session.get(CollegeAggregate, college_key))
+        college = college_info.get(college_key, {"name": college_name})
+
+        return render_template(
+        "college_profile.html",
+        college=college,
+        reviews=reviews,
+        avg_ratings=avg_ratings,
+        next_after=next_after,
+        )
 
-    reviews = Review.query.filter_by(college_name=college_name.lower()).all()
-    avg_ratings = calculate_avg_ratings(reviews)
-    college = college_info.get(college_name.lower(), {"name": college_name})
+    # college_name (not the key) varies too: unknown colleges echo it back as the heading
+    return page_cache.page("college", (f"college:{college_key}",), render, vary=(college_name, after))
+
+@main.route('/api/colleges/<college_name>/reviews')
+def college_reviews_api(college_name):
+    """Keyset-paginated reviews, newest first: ?after=<id from next_after>&limit=<1..100>"""
+    college_key = college_name.lower()
+    limit = max(1, min(request.args.get("limit", REVIEW_PAGE_SIZE, type=int), 100))
+    reviews, next_after = get_review_page(college_key, after=request.args.get("after", type=int), limit=limit)
+    agg = db.session.get(CollegeAggregate, college_key)
+    return jsonify({
+        "college": college_key,
+        "reviews": reviews,
+        "next_after": next_after,
+        "averages": category_averages(agg),
+        "review_count": agg.review_count if agg else 0,
+    })
+
+@main.route('/api/colleges/<college_name>/rating_trend')
+def college_rating_trend_api(college_name):
+    """Daily category averages for charting: ?days=<1..365> (default 90), oldest first."""
+    days = max(1, min(request.args.get("days", 90, type=int), 365))
+    return jsonify({"college": college_name.lower(), "days": rating_trend(college_name.lower(), days=days)})
+
+@main.route('/api/tags/<path:tag>/reviews')
+def tagged_reviews_api(tag):
+    """Reviews tagged `tag` (any spelling that normalizes the same), newest first: ?college=&after=&limit="""
+    college = request.args.get("college")
+    limit = max(1, min(request.args.get("limit", REVIEW_PAGE_SIZE, type=int), 100))
+    reviews, next_after = get_tagged_review_page(tag, college_key=college.lower() if college else None,
+                                                 after=request.args.get("after", type=int), limit=limit)
+    return jsonify({"tag": tag_index.normalize_tag(tag), "college": college.lower() if college else None,
+                    "reviews": reviews, "next_after": next_after})
+
+@main.route('/api/tags')
+def tag_distribution_api():
+    """Top tags across every college: ?n=<1..100> (default 10), with each tag's share of reviews."""
+    return jsonify(_tag_distribution(None, request.args.get("n", 10, type=int)))
+
+@main.route('/api/colleges/<college_name>/tags')
+def college_tag_distribution_api(college_name):
+    """Top tags of one college: ?n=<1..100> (default 10), with each tag's share of its reviews."""
+    return jsonify(_tag_distribution(college_name.lower(), request.args.get("n", 10, type=int)))
+
+def _tag_distribution(college_key, n):
+    n = max(1, min(n, 100))
+    if college_key is None:
+        review_count = sum(a.review_count for a in get_aggregates().values())
+    else:
+        agg = db.session.get(CollegeAggregate, college_key)
+        review_count = agg.review_count if agg else 0
+    return {
+        "college": college_key,
+        "review_count": review_count,
+        "tags": [{"tag": tag, "count": count, "share": round(count / review_count, 4) if review_count else 0.0}
+                 for tag, count in tag_index.top_tags(college_key, n=n)],
+    }
 
-    return render_template(
-    "college_profile.html",
-    college=college,
-    reviews=reviews,
-    avg_ratings=avg_ratings,
-    json=json  # ✅ allows use of json.loads in template
-    )
+@main.route('/api/themes')
+def themes_api():
+    """Review themes from embedding clusters: ?college=<key> (default: all reviews)&n=<1..50>"""
+    college = request.args.get("college")
+    n = max(1, min(request.args.get("n", 10, type=int), 50))
+    # read-only: fitting and refreshing happen on theme_engine's background thread
+    return jsonify({"college": college.lower() if college else None,
+                    "themes": theme_engine.themes(college.lower() if college else None)[:n]})
 
 @main.route('/generate_tags', methods=['POST'])
 def generate_tags():
@@ -170,6 +307,52 @@ def generate_tags():
     tags = extract_tags_from_text(text)
     return jsonify({"tags": tags})
 
+@main.route('/generate_tags/batch', methods=['POST'])
+def generate_tags_batch():
+    """{"texts": [...], "batch_size": 64, "top_n": 5} -> {"tags": [[...], ...]} in input order."""
+    from .nlp_utils import extract_tags_batch
+
+    data = request.get_json() or {}
+    texts = data.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "texts must be a list of strings"}), 400
+    if len(texts) > GENERATE_TAGS_MAX_TEXTS:
+        return jsonify({"error": f"at most {GENERATE_TAGS_MAX_TEXTS} texts per request"}), 413
+    options = {}
+    for name, default, most in (("batch_size", 64, 1000), ("top_n", 5, 20)):
+        try:
+            options[name] = max(1, min(int(data.get(name) or default), most))
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"error": f"{name} must be an integer"}), 400
+    return jsonify({"tags": extract_tags_batch(texts, **options)})
+
+@main.route('/search')
+def search():
+    """Semantic "find reviews like this": /search?q=quiet study spots&k=10&college=uc"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "missing q"}), 400
+    k = max(1, min(request.args.get("k", 10, type=int), 100))
+    college = request.args.get("college")
+
+    query_vec = embed_text(query)
+    with metrics.span("vector_search"):
+        hits = embedding_index.search(query_vec, k=k, college=college.lower() if college else None)
+    reviews = {r.id: r for r in Review.query.filter(Review.id.in_([rid for rid, _ in hits]))}
+    results = []
+    for review_id, score in hits:
+        r = reviews.get(review_id)
+        if r is None:
+            continue  # deleted since the index was built
+        results.append({
+            "review_id": r.id,
+            "college": r.college_name,
+            "user": r.user,
+            "text": r.text,
+            "score": round(score, 4),
+        })
+    return jsonify({"query": query, "results": results})
+
 @main.route('/recommend', methods=['POST'])
 def recommend():
     query = request.form.get("query", "").strip()
@@ -186,58 +369,23 @@ def recommend():
         if cat in ['food', 'social', 'clubs', 'study', 'opportunities']:
             manual_weights[cat] = manual_weights.get(cat, 0) + 0.25
 
+    # ✅ Encode the query once (cached across requests) and reuse the vector everywhere below
+    query_vec = encode_query(query)
+
     # ✅ Get weighted priorities
-    preferences = get_priorities_from_text(query, manual_weights=manual_weights)
-
-    all_colleges = get_college_stats()
-
-    # --- score & rank ---
-    def score_and_explain(college, query_text, prefs):
-        """
-        Returns (final_score, cat_score, tag_bonus, contributions)
-        where contributions = list of (category, weight, category_value, weighted_points)
-        """
-        contributions = []
-        cat_score_num, cat_score_den = 0.0, 0.0
-
-        for category, weight in (prefs or []):
-            cat_value = float(college.get('category_ratings', {}).get(category) or 0.0)  # 0..10
-            points = weight * cat_value
-            contributions.append((category, round(weight, 4), round(cat_value, 2), round(points, 2)))
-            cat_score_num += points
-            cat_score_den += weight
-
-        cat_score = (cat_score_num / cat_score_den) if cat_score_den else 0.0
-
-        # Tag similarity bonus
-        # NEW: use precomputed vector
-        tag_vec = college.get('tag_vec')
-        tag_bonus = tag_similarity_boost_from_vec(query_text or "", tag_vec, alpha=0.6)  # bonus ~0..0.6
-
-        final = min(10.0, cat_score + tag_bonus)
-        return round(final, 2), round(cat_score, 2), round(tag_bonus, 2), contributions
-
-    filtered_colleges = [c for c in all_colleges if c.get('avg_rating') is not None]
-
-    # If preferences ended up empty (e.g., blank query & no checkboxes), use a neutral default:
-    effective_prefs = preferences if preferences else []
-
-    for college in filtered_colleges:
-        match_score, cat_score, tag_bonus, contribs = score_and_explain(college, query, effective_prefs)
-        college['match_score'] = match_score
-        college['cat_score'] = cat_score
-        college['tag_bonus'] = tag_bonus
-        college['contributions'] = contribs  # e.g. [('study', 0.52, 7.8, 4.06), ...]
-
-    # ✅ Add "why this match?" explanation tags
-    why_tags = []
-    if college.get('clean_tags'):
-        from .recommender_utils import top_similar_tags
-        why_tags = top_similar_tags(query or "", college['clean_tags'], k=3)
-    college['why_tags'] = why_tags
-    
-    ranked = sorted(filtered_colleges, key=lambda c: c['match_score'], reverse=True)
-    
+    preferences = get_priorities_from_text(query, manual_weights=manual_weights, query_vec=query_vec)
+
+    # ✅ Score every college in one pass over the precomputed ratings / tag-vector matrices
+    with metrics.span("recommend_rank"):
+        ranked = recommender.rank(preferences, query_vec=query_vec if query else None)
+
+    for college in ranked:
+        # ✅ Add "why this match?" explanation tags
+        why_tags = []
+        if college.get('clean_tags'):
+            why_tags = top_similar_tags(query or "", college['clean_tags'], k=3, query_vec=query_vec)
+        college['why_tags'] = why_tags
+
     return render_template(
         'recommend_results.html',
         query=query,
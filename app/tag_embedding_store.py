@@ -0,0 +1,154 @@
+import atexit
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from .model_registry import SENTENCE_MODEL_NAME, encode
+from .metrics import metrics
+
+
+class TagEmbeddingStore:
+    """
+    Bounded cache of tag embeddings (replaces the old unbounded _TAG_EMB_CACHE dict).
+
+    Vectors live in one preallocated float32 (maxsize x d) array; an OrderedDict maps
+    tag -> row and doubles as the LRU order, so evicting a tag just frees its row for reuse.
+    The store is saved to an .npz file (tags + vectors + model name) after new tags are
+    encoded, and other workers merge that file in before encoding anything themselves.
+    Keys are expected to be already normalized (see tag_index.normalize_tag).
+    """
+
+    def __init__(self, maxsize=5000, path=None, save_every=32):
+        self.maxsize = maxsize
+        self.path = path              # None = memory only (set by init_app)
+        self.save_every = save_every  # persist after this many newly encoded tags
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()    # tag -> row in self._vectors (LRU order)
+        self._vectors = None          # (maxsize, d) float32, allocated once d is known
+        self._free = []
+        self._unsaved = 0
+        self._file_mtime = None
+        self._loaded = False
+
+    def init_app(self, app):
+        path = app.config.get("TAG_STORE_PATH") or os.path.join(app.instance_path, "tag_embeddings.npz")
+        with self._lock:
+            if path != self.path:
+                self.path = path
+                self._file_mtime = None
+                self._loaded = False
+
+    # ---- internal helpers (call with the lock held) ----
+    def _allocate(self, dim):
+        self._vectors = np.zeros((self.maxsize, dim), dtype=np.float32)
+        self._free = list(range(self.maxsize - 1, -1, -1))
+
+    def _put(self, tag, vec):
+        if self._vectors is None:
+            self._allocate(vec.shape[0])
+        row = self._rows.get(tag)
+        if row is None:
+            if not self._free:
+                _, row = self._rows.popitem(last=False)  # evict least recently used
+            else:
+                row = self._free.pop()
+        self._vectors[row] = vec
+        self._rows[tag] = row
+        self._rows.move_to_end(tag)
+
+    def _merge_file(self):
+        """Pull in tags another worker (or a previous run) saved; never overwrites what we have."""
+        if self.path is None:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model"]) != SENTENCE_MODEL_NAME:
+                    return
+                tags, vectors = data["tags"], data["vectors"]
+                for tag, vec in zip(tags[-self.maxsize:], vectors[-self.maxsize:]):
+                    tag = str(tag)
+                    if tag not in self._rows:
+                        self._put(tag, vec)
+        except (OSError, KeyError, ValueError):
+            return
+        self._file_mtime = mtime
+
+    def _save(self):
+        if not self._rows or self.path is None:
+            return
+        tags = list(self._rows)  # LRU -> MRU, so a smaller reader keeps the most recent
+        vectors = self._vectors[[self._rows[t] for t in tags]]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # unique temp name: two workers saving at once must not write into the same file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp.npz")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, tags=np.asarray(tags), vectors=vectors, model=np.asarray(SENTENCE_MODEL_NAME))
+                os.replace(tmp, self.path)
+            except OSError:
+                os.unlink(tmp)
+                raise
+            self._file_mtime = os.path.getmtime(self.path)
+        except OSError:
+            pass  # persistence is best-effort
+        self._unsaved = 0
+
+    # ---- public API ----
+    def get_many(self, tags):
+        """
+        Embeddings for a list of normalized tags as an (n, d) float32 array (a copy),
+        encoding every tag that isn't cached in a single model.encode call.
+        """
+        tags = list(tags)
+        if not tags:
+            return np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            if not self._loaded:
+                self._merge_file()
+                self._loaded = True
+            unique = list(dict.fromkeys(tags))
+            if any(t not in self._rows for t in unique):
+                self._merge_file()
+            found = {}
+            for tag in unique:
+                row = self._rows.get(tag)
+                if row is not None:
+                    self._rows.move_to_end(tag)
+                    found[tag] = self._vectors[row].copy()
+        missing = [t for t in unique if t not in found]
+        metrics.inc("cache_requests_total", len(found), cache="tag_embedding", result="hit")
+        metrics.inc("cache_requests_total", len(missing), cache="tag_embedding", result="miss")
+
+        if missing:
+            vecs = encode(missing, caller="tags", normalize_embeddings=True).astype(np.float32)
+            found.update(zip(missing, vecs))
+            with self._lock:
+                for tag, vec in zip(missing, vecs):
+                    self._put(tag, vec)
+                self._unsaved += len(missing)
+                if self._unsaved >= self.save_every:
+                    self._save()
+        return np.stack([found[t] for t in tags])
+
+    def get(self, tag):
+        return self.get_many([tag])[0]
+
+    def flush(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+tag_store = TagEmbeddingStore()
+atexit.register(tag_store.flush)
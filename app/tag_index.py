@@ -0,0 +1,216 @@
+"""
+Normalized review tags.
+
+review_tag (review_id, tag, college_name) is an inverted index over the JSON Review.tags
+column, college_tag_count keeps how many of each college's reviews carry each tag and
+tag_count the same over all colleges, so "reviews tagged X" and "top tags" (at a college or
+overall) are index range scans instead of decoding every row's JSON or summing per request.
+
+Tags go through normalize_tag() (lowercase, no '#', odd punctuation dropped; the tag embedding
+keys use it too), so "#Good Food" and "good food!" are one tag. Every path that sets Review.tags
+calls sync_reviews() in its own transaction; `flask backfill-tags` rebuilds both tables from the
+JSON columns (databases from before this existed, or after editing tags by hand); at startup
+backfill_if_empty() does the same once per database, in whichever worker claims it first.
+"""
+import json
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from .models import Review, ReviewTag, CollegeTagCount, TagCount, PipelineCheckpoint
+
+MAX_TAG_LENGTH = 200  # review_tag.tag column size
+_BACKFILL = "tag-index-backfill"  # pipeline_checkpoint row held while a startup backfill runs ...
+_BACKFILL_DONE = 1  # ... and kept with this last_id afterwards, so it runs once even if every tag normalizes to ''
+
+
+def normalize_tag(tag):
+    """Lowercase, strip leading '#', remove odd punctuation/spaces."""
+    t = (tag or "").strip().lower()
+    if t.startswith("#"):
+        t = t[1:]
+    # keep letters/numbers/spaces/dashes/underscores/slashes
+    t = re.sub(r"[^a-z0-9\-\_/ ]", "", t)
+    # collapse whitespace -> single space
+    t = re.sub(r"\s+", " ", t).strip()
+    return t[:MAX_TAG_LENGTH]
+
+
+def normalize_tags(raw):
+    """Normalized, de-duplicated tags in their original order. Takes a list or its JSON encoding."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw or "[]")
+        except ValueError:
+            return []
+    if not isinstance(raw, list):
+        return []
+    tags = (normalize_tag(t) for t in raw if isinstance(t, str))
+    return list(dict.fromkeys(t for t in tags if t))
+
+
+def _apply_counts(deltas):
+    """
+    `count = count + delta` upserts for {(college, tag): delta} into college_tag_count and the
+    per-tag totals into tag_count; rows that reach zero are dropped.
+    """
+    deltas = {key: d for key, d in deltas.items() if d}
+    if not deltas:
+        return
+    stmt = sqlite_insert(CollegeTagCount)
+    stmt = stmt.on_conflict_do_update(index_elements=["college_name", "tag"],
+                                      set_={"count": CollegeTagCount.count + stmt.excluded["count"]})
+    db.session.execute(stmt, [{"college_name": c, "tag": t, "count": d} for (c, t), d in deltas.items()])
+    shrunk = {c for (c, _), d in deltas.items() if d < 0}
+    if shrunk:
+        db.session.execute(db.delete(CollegeTagCount).where(
+            CollegeTagCount.college_name.in_(shrunk), CollegeTagCount.count <= 0))
+
+    totals = Counter()
+    for (_, tag), d in deltas.items():
+        totals[tag] += d
+    totals = {tag: d for tag, d in totals.items() if d}
+    if not totals:
+        return
+    stmt = sqlite_insert(TagCount)
+    stmt = stmt.on_conflict_do_update(index_elements=["tag"], set_={"count": TagCount.count + stmt.excluded["count"]})
+    db.session.execute(stmt, [{"tag": t, "count": d} for t, d in totals.items()])
+    shrunk = [t for t, d in totals.items() if d < 0]
+    if shrunk:
+        db.session.execute(db.delete(TagCount).where(TagCount.tag.in_(shrunk), TagCount.count <= 0))
+
+
+def sync_reviews(reviews, new=False):
+    """
+    Make review_tag match each review's current tags (anything with .id/.college_name/.tags),
+    touching only what changed, and adjust college_tag_count. `new=True` skips looking up
+    existing rows (freshly inserted reviews have none). Does NOT commit.
+    """
+    reviews = [r for r in reviews if r.id is not None]
+    if not reviews:
+        return
+    current = defaultdict(set)
+    if not new:
+        rows = db.session.query(ReviewTag.review_id, ReviewTag.tag).filter(
+            ReviewTag.review_id.in_([r.id for r in reviews]))
+        for review_id, tag in rows:
+            current[review_id].add(tag)
+
+    added, removed, deltas = [], [], Counter()
+    for r in reviews:
+        wanted = normalize_tags(r.tags)
+        have = current.get(r.id, set())
+        for tag in wanted:
+            if tag not in have:
+                added.append({"review_id": r.id, "tag": tag, "college_name": r.college_name})
+                deltas[(r.college_name, tag)] += 1
+        for tag in have.difference(wanted):
+            removed.append((r.id, tag))
+            deltas[(r.college_name, tag)] -= 1
+
+    if removed:
+        db.session.execute(db.delete(ReviewTag).where(tuple_(ReviewTag.review_id, ReviewTag.tag).in_(removed)))
+    if added:
+        db.session.execute(insert(ReviewTag), added)
+    _apply_counts(deltas)
+
+
+def reset():
+    """Empty the index and both count tables (e.g. before the review table is cleared). Does NOT commit."""
+    TagCount.query.delete()
+    CollegeTagCount.query.delete()
+    ReviewTag.query.delete()
+
+
+def rebuild(chunk_size=1000):
+    """Repopulate review_tag and the tag counts from every review's JSON tags. Returns reviews scanned."""
+    reset()
+    last_id = scanned = 0
+    while True:
+        rows = (db.session.query(Review.id, Review.college_name, Review.tags)
+                .filter(Review.id > last_id).order_by(Review.id).limit(chunk_size).all())
+        if not rows:
+            break
+        batch = [{"review_id": r.id, "tag": tag, "college_name": r.college_name}
+                 for r in rows for tag in normalize_tags(r.tags)]
+        if batch:
+            db.session.execute(insert(ReviewTag), batch)
+        last_id = rows[-1].id
+        scanned += len(rows)
+
+    db.session.execute(insert(CollegeTagCount).from_select(
+        ["college_name", "tag", "count"],
+        select(ReviewTag.college_name, ReviewTag.tag, db.func.count())
+        .group_by(ReviewTag.college_name, ReviewTag.tag)))
+    db.session.execute(insert(TagCount).from_select(
+        ["tag", "count"],
+        select(CollegeTagCount.tag, db.func.sum(CollegeTagCount.count)).group_by(CollegeTagCount.tag)))
+    db.session.commit()
+    return scanned
+
+
+def _needs_backfill():
+    if PipelineCheckpoint.query.filter_by(name=_BACKFILL, last_id=_BACKFILL_DONE).first() is not None:
+        return False
+    if ReviewTag.query.first() is not None and TagCount.query.first() is not None:
+        return False
+    return Review.query.filter(Review.tags.isnot(None), Review.tags.notin_(["", "[]"])).first() is not None
+
+
+def _claim_backfill(now, stale_after):
+    """Insert (or take over a stale) backfill checkpoint row; True if this process got it."""
+    claimed = db.session.execute(sqlite_insert(PipelineCheckpoint).values(name=_BACKFILL, last_id=0, updated_at=now)
+                                 .on_conflict_do_nothing(index_elements=["name"])).rowcount
+    if not claimed:  # a worker that died mid-rebuild leaves its row behind
+        claimed = PipelineCheckpoint.query.filter(
+            PipelineCheckpoint.name == _BACKFILL, PipelineCheckpoint.last_id != _BACKFILL_DONE,
+            PipelineCheckpoint.updated_at < now - stale_after,
+        ).update({"updated_at": now}, synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def backfill_if_empty(stale_after=timedelta(hours=1)):
+    """
+    One-off rebuild for databases with tagged reviews but an empty review_tag (or tag_count)
+    table. Workers starting together race for a pipeline_checkpoint row and only the winner
+    rebuilds; the others keep starting up. The row stays behind as a done marker.
+    """
+    if not _needs_backfill() or not _claim_backfill(datetime.utcnow(), stale_after):
+        return
+    done = False
+    try:
+        if _needs_backfill():  # another worker may have finished between our check and the claim
+            rebuild()
+        done = True
+    finally:
+        db.session.rollback()
+        claim = PipelineCheckpoint.query.filter_by(name=_BACKFILL)
+        if done:
+            claim.update({"last_id": _BACKFILL_DONE, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        else:  # let the next start try again
+            claim.delete()
+        db.session.commit()
+
+
+def tagged_review_ids(tag, college=None, after=None, limit=20):
+    """Ids of reviews carrying `tag`, newest first; `after` is the last id of the previous page."""
+    q = db.session.query(ReviewTag.review_id).filter(ReviewTag.tag == normalize_tag(tag))
+    if college is not None:
+        q = q.filter(ReviewTag.college_name == college)
+    if after is not None:
+        q = q.filter(ReviewTag.review_id < after)
+    return [review_id for (review_id,) in q.order_by(ReviewTag.review_id.desc()).limit(limit)]
+
+
+def top_tags(college=None, n=10):
+    """[(tag, number of reviews)] most common first, for one college or all of them."""
+    if college is not None:
+        q = (db.session.query(CollegeTagCount.tag, CollegeTagCount.count)
+             .filter(CollegeTagCount.college_name == college)
+             .order_by(CollegeTagCount.count.desc(), CollegeTagCount.tag))
+    else:
+        q = db.session.query(TagCount.tag, TagCount.count).order_by(TagCount.count.desc(), TagCount.tag)
+    return [(tag, int(count)) for tag, count in q.limit(n)]
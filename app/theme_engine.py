@@ -0,0 +1,289 @@
+"""
+Review themes from the stored embeddings instead of re-parsing text and training LDA.
+
+Spherical mini-batch k-means runs over the normalized MiniLM vectors that embedding_index
+already holds, once for all reviews and once per college. Each cluster is labelled with the
+tag most characteristic of its members: cached tags from review_tag, scored c-TF-IDF style
+so that tags every review carries don't win everywhere.
+
+New embeddings (any review id not folded in yet) are assigned to their nearest centroid and
+move it with a per-centroid rate of 1/count (Sculley's mini-batch k-means update), so a
+refresh costs milliseconds. A full refit happens once the corpus has grown by `refit_growth`
+since the last fit, or when reviews that were clustered have disappeared.
+
+TRENDING_TOPICS=themes makes trending use these labels where it would use LDA topic terms and
+refresh them on its own background thread. /api/themes only reads: themes() starts a refresh
+on a background thread when the last one is older than THEMES_REFRESH_SECONDS.
+"""
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from app import db
+from .models import ReviewTag, TagCount
+from .embedding_index import embedding_index
+from .metrics import metrics
+
+
+def _normalize_rows(matrix):
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def _init_centroids(x, k, rng):
+    """k-means++ seeding with cosine distance."""
+    centroids = [x[rng.integers(len(x))]]
+    dist = 1.0 - x @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(dist, 0.0, None)
+        total = weights.sum()
+        i = rng.choice(len(x), p=weights / total) if total > 0 else rng.integers(len(x))
+        centroids.append(x[i])
+        dist = np.minimum(dist, 1.0 - x @ x[i])
+    return np.vstack(centroids).astype(np.float32)
+
+
+def _step(centroids, counts, batch):
+    """One mini-batch update in place; returns the batch's assignments."""
+    assign = np.argmax(batch @ centroids.T, axis=1)
+    n = np.bincount(assign, minlength=len(centroids)).astype(np.float64)
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, assign, batch)
+    counts += n
+    hit = n > 0
+    eta = (n[hit] / counts[hit])[:, None]
+    centroids[hit] = (1.0 - eta) * centroids[hit] + eta * (sums[hit] / n[hit][:, None])
+    centroids[hit] = _normalize_rows(centroids[hit])
+    return assign
+
+
+def minibatch_kmeans(x, k, batch_size=1024, iterations=60, seed=42):
+    """(centroids, assignments) for the normalized rows of `x`, k clamped to len(x)."""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(x)))
+    sample = x if len(x) <= 10 * batch_size else x[rng.choice(len(x), 10 * batch_size, replace=False)]
+    centroids = _init_centroids(sample, k, rng)
+    counts = np.zeros(k)
+    for _ in range(iterations):
+        batch = x if len(x) <= batch_size else x[rng.choice(len(x), batch_size, replace=False)]
+        _step(centroids, counts, batch)
+    return centroids, np.argmax(x @ centroids.T, axis=1)
+
+
+class _Clusters:
+    """Centroids of one scope (all reviews or one college) plus their members' tag counts."""
+
+    def __init__(self, centroids, assign, tags):
+        self.centroids = centroids
+        self.counts = np.bincount(assign, minlength=len(centroids)).astype(np.float64)
+        self.tags = [Counter() for _ in range(len(centroids))]
+        for cluster, review_tags in zip(assign, tags):
+            self.tags[cluster].update(review_tags)
+
+    def add(self, vecs, tags):
+        assign = _step(self.centroids, self.counts, vecs)
+        for cluster, review_tags in zip(assign, tags):
+            self.tags[cluster].update(review_tags)
+
+    def themes(self, df, total, terms=3):
+        """[{"label", "size", "tags"}] largest first; clusters whose label repeats a bigger one are merged in."""
+        ranked = []
+        for size, counter in zip(self.counts, self.tags):
+            scored = sorted(((n * math.log(1 + total / df.get(tag, n)), tag) for tag, n in counter.items()),
+                            reverse=True)
+            ranked.append((int(size), [tag for _, tag in scored[:terms]]))
+        themes, by_label = [], {}
+        for size, top in sorted(ranked, key=lambda item: -item[0]):
+            if not size or not top:
+                continue
+            if top[0] in by_label:
+                by_label[top[0]]["size"] += size
+                continue
+            by_label[top[0]] = {"label": top[0], "size": size, "tags": top}
+            themes.append(by_label[top[0]])
+        return themes
+
+
+class ThemeEngine:
+    def __init__(self, k=12, k_per_college=5, min_cluster_size=20, refit_growth=0.5, refresh_seconds=60):
+        self.k = k
+        self.k_per_college = k_per_college
+        self.min_cluster_size = min_cluster_size  # per-college k is capped at n / this
+        self.refit_growth = refit_growth          # refit once the corpus grew by this fraction
+        self.refresh_seconds = refresh_seconds    # reads start a background refresh at most this often
+        self._app = None
+        self._lock = threading.Lock()             # the fitted state; held only to read or swap it
+        self._refresh_lock = threading.Lock()     # one fit/refresh at a time
+        self._refreshing = False
+        self._refreshed_at = None                 # None = never fitted
+        self._generation = 0                      # bumped by reset() so an in-flight fit can't restore old clusters
+        self._clear()
+
+    def init_app(self, app):
+        self._app = app
+        self.k = app.config.get("THEMES_K", self.k)
+        self.k_per_college = app.config.get("THEMES_K_PER_COLLEGE", self.k_per_college)
+        self.refresh_seconds = app.config.get("THEMES_REFRESH_SECONDS", self.refresh_seconds)
+
+    def _clear(self):
+        self._global = None
+        self._colleges = {}
+        self._seen = np.zeros(0, dtype=np.int64)  # sorted ids of every vector folded in so far
+        self._fitted_n = 0
+        self._df = Counter()
+        self._total = 0
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self._generation += 1
+            self._refreshed_at = None
+
+    @staticmethod
+    def _review_tags(ids):
+        """{review_id: [tags]} from the review_tag index (only for `ids`; None = every review)."""
+        q = db.session.query(ReviewTag.review_id, ReviewTag.tag)
+        if ids is not None:
+            q = q.filter(ReviewTag.review_id.in_([int(i) for i in ids]))
+        found = defaultdict(list)
+        for review_id, tag in q:
+            found[review_id].append(tag)
+        return found
+
+    @staticmethod
+    def _load_df():
+        """Tag document frequencies over all reviews, from the tag_count rollup (no review scan)."""
+        return Counter(dict(db.session.query(TagCount.tag, TagCount.count)))
+
+    def _college_k(self, n):
+        return max(1, min(self.k_per_college, n // self.min_cluster_size))
+
+    def fit(self):
+        """Cluster every review vector from scratch (needs an app context). Returns how many."""
+        with self._refresh_lock:
+            return self._fit()
+
+    def _fit(self):
+        with self._lock:
+            generation = self._generation
+        matrix, ids, colleges = embedding_index.snapshot()
+        clusters, per_college = None, {}
+        with metrics.span("themes_fit", items=len(ids)):
+            if len(ids):
+                matrix = np.asarray(matrix, dtype=np.float32)
+                tags_by_id = self._review_tags(None)
+                tags = [tags_by_id.get(int(i), ()) for i in ids]
+
+                centroids, assign = minibatch_kmeans(matrix, self.k)
+                clusters = _Clusters(centroids, assign, tags)
+                for college in np.unique(colleges):
+                    rows = np.flatnonzero(colleges == college)
+                    centroids, assign = minibatch_kmeans(matrix[rows], self._college_k(len(rows)))
+                    per_college[str(college)] = _Clusters(centroids, assign, [tags[i] for i in rows])
+            df = self._load_df()
+
+        # swap in whole objects so readers never see a half-built fit
+        with self._lock:
+            if generation != self._generation:
+                return 0  # reset() while we were fitting
+            self._global, self._colleges = clusters, per_college
+            self._seen = np.sort(np.asarray(ids, dtype=np.int64))
+            self._fitted_n = self._total = len(ids)
+            self._df = df
+            self._refreshed_at = time.monotonic()
+        return len(ids)
+
+    def refresh(self):
+        """Fold vectors not seen yet into the centroids, or refit when due (needs an app context)."""
+        with self._refresh_lock:
+            with self._lock:
+                generation, fitted = self._generation, self._global is not None
+            if not fitted:
+                return self._fit()
+            matrix, ids, colleges = embedding_index.snapshot()
+            ids = np.asarray(ids, dtype=np.int64)
+            if len(ids) >= self._fitted_n * (1 + self.refit_growth):
+                return self._fit()
+            if not np.isin(self._seen, ids, assume_unique=True).all():
+                return self._fit()  # reviews were deleted (e.g. /admin/clear_reviews in another worker)
+            # by id membership, not "ids above the last one": embeddings can land out of order
+            new = np.flatnonzero(~np.isin(ids, self._seen, assume_unique=True))
+            if not new.size:
+                with self._lock:
+                    self._refreshed_at = time.monotonic()
+                return 0
+            with metrics.span("themes_update", items=new.size):
+                vecs = np.asarray(matrix[new], dtype=np.float32)
+                tags_by_id = self._review_tags(ids[new])
+                tags = [tags_by_id.get(int(i), ()) for i in ids[new]]
+                df = self._load_df()
+                rows_of = {str(c): np.flatnonzero(colleges[new] == c) for c in np.unique(colleges[new])}
+                with self._lock:
+                    known = set(self._colleges)
+                # a college seen for the first time gets its own fit, outside the lock readers wait on
+                fitted = {}
+                for college, rows in rows_of.items():
+                    if college not in known:
+                        centroids, assign = minibatch_kmeans(vecs[rows], self._college_k(len(rows)))
+                        fitted[college] = _Clusters(centroids, assign, [tags[i] for i in rows])
+                with self._lock:
+                    if generation != self._generation:
+                        return 0
+                    self._global.add(vecs, tags)
+                    for college, rows in rows_of.items():
+                        if college in fitted:
+                            self._colleges[college] = fitted[college]
+                        else:
+                            self._colleges[college].add(vecs[rows], [tags[i] for i in rows])
+                    self._seen = np.union1d(self._seen, ids[new])
+                    self._total += int(new.size)
+                    self._df = df
+                    self._refreshed_at = time.monotonic()
+            return int(new.size)
+
+    # ---- background refresh ----
+    def _maybe_refresh(self):
+        with self._lock:
+            if self._app is None or self._refreshing:
+                return
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._run_refresh, name="themes-refresh", daemon=True).start()
+
+    def _run_refresh(self):
+        try:
+            with self._app.app_context():
+                self.refresh()
+        except Exception:
+            self._app.logger.exception("Theme refresh failed")
+            with self._lock:
+                self._refreshed_at = time.monotonic()  # retry after refresh_seconds, not on every read
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # ---- reads ----
+    def themes(self, college=None):
+        """
+        [{"label", "size", "tags"}] for all reviews or one college, largest theme first. Never
+        clusters in the caller: a stale or missing fit is refreshed on a background thread
+        (empty until the first fit lands).
+        """
+        self._maybe_refresh()
+        with self._lock:
+            clusters = self._global if college is None else self._colleges.get(college)
+            return clusters.themes(self._df, self._total) if clusters is not None else []
+
+    def hashtags(self, college=None, top_n=5):
+        return [f"#{theme['label']}" for theme in self.themes(college)[:top_n]]
+
+    def topic_terms(self, college=None, num_themes=5, num_words=3):
+        """Drop-in for TopicModel.topic_terms / college_topic_terms: the top themes' leading tags."""
+        terms = []
+        for theme in self.themes(college)[:num_themes]:
+            terms.extend(theme["tags"][:num_words])
+        return terms
+
+
+theme_engine = ThemeEngine()
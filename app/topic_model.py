@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import threading
+import time
+from app import db
+from .models import Review
+from .metrics import metrics
+from .nlp_utils import HAS_GENSIM, nlp_version, review_documents, topic_terms_from_model
+
+
+class TopicModel:
+    """
+    One persistent LDA model over all reviews, for the trending hashtags.
+
+    Instead of training a fresh LdaModel (8 passes over every review) on each trending refresh,
+    refresh() folds only reviews newer than the last one it saw into the model with gensim's
+    online `update()`, after `dictionary.add_documents`. A running per-college sum of topic
+    weights is kept alongside, so per-college topics don't need their own models either.
+
+    An online update can't grow the model's vocabulary, so words first seen after the last
+    full training only count once the model is retrained from scratch. That happens when
+      - there is no saved model yet, the spaCy version changed or reviews were deleted,
+      - the corpus grew by `retrain_ratio` since the last full training,
+      - the dictionary grew by `retrain_vocab_ratio` (too many words the model can't see),
+      - or the last full training is older than `retrain_every` seconds.
+    Full trainings use LdaMulticore when `workers` > 1.
+
+    Files live in instance/topic_model/<generation>/ with a `current.json` pointer that is
+    swapped atomically, so other workers pick up a new model on their next refresh.
+    """
+
+    def __init__(self, path=None, num_topics=5, passes=8, update_passes=1, workers=1,
+                 retrain_ratio=0.5, retrain_vocab_ratio=0.2, retrain_every=24 * 3600, chunk_size=2000):
+        self.path = path
+        self.num_topics = num_topics
+        self.passes = passes
+        self.update_passes = update_passes
+        self.workers = workers
+        self.retrain_ratio = retrain_ratio
+        self.retrain_vocab_ratio = retrain_vocab_ratio
+        self.retrain_every = retrain_every
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self._lda = None
+        self._dictionary = None
+        self._state = None
+        self._pointer_mtime = None
+
+    def init_app(self, app):
+        self.path = app.config.get("TOPIC_MODEL_PATH", os.path.join(app.instance_path, "topic_model"))
+        self.workers = int(app.config.get("TOPIC_MODEL_WORKERS", self.workers))
+        self.retrain_every = int(app.config.get("TOPIC_MODEL_RETRAIN_SECONDS", self.retrain_every))
+
+    @property
+    def available(self):
+        return HAS_GENSIM
+
+    # ---- files ----
+    def _pointer(self):
+        return os.path.join(self.path, "current.json")
+
+    def _load(self):
+        """Pick up a model another worker (or a previous run) saved, if it's newer than ours."""
+        from gensim import corpora
+        from gensim.models import LdaModel
+
+        try:
+            mtime = os.path.getmtime(self._pointer())
+            if mtime == self._pointer_mtime:
+                return
+            with open(self._pointer()) as f:
+                state = json.load(f)
+            model_dir = os.path.join(self.path, state["generation"])
+            lda = LdaModel.load(os.path.join(model_dir, "lda"))
+            dictionary = corpora.Dictionary.load(os.path.join(model_dir, "dictionary"))
+        except (OSError, ValueError, KeyError):
+            return
+        self._lda, self._dictionary, self._state = lda, dictionary, state
+        self._pointer_mtime = mtime
+
+    def _save(self):
+        generation = f"{int(time.time() * 1000)}-{os.getpid()}"
+        model_dir = os.path.join(self.path, generation)
+        try:
+            os.makedirs(model_dir, exist_ok=True)
+            self._lda.save(os.path.join(model_dir, "lda"))
+            self._dictionary.save(os.path.join(model_dir, "dictionary"))
+            self._state["generation"] = generation
+            tmp = self._pointer() + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._state, f)
+            os.replace(tmp, self._pointer())
+            self._pointer_mtime = os.path.getmtime(self._pointer())
+        except OSError:
+            return  # persistence is best-effort; the in-memory model still serves this process
+        for name in os.listdir(self.path):
+            old = os.path.join(self.path, name)
+            if name != generation and os.path.isdir(old):
+                shutil.rmtree(old, ignore_errors=True)
+
+    # ---- corpus ----
+    def _documents(self, after_id=0):
+        """Yield chunks of [(review, tokens)] for reviews with id > after_id, in id order."""
+        last_id = after_id
+        while True:
+            chunk = (Review.query.filter(Review.id > last_id).order_by(Review.id)
+                     .limit(self.chunk_size).all())
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            yield last_id, review_documents(chunk)
+
+    def _college_mass(self, docs):
+        """{college: [weight per topic]} summed over docs' topic distributions."""
+        mass = {}
+        for review, tokens in docs:
+            bow = self._dictionary.doc2bow(tokens)
+            totals = mass.setdefault(review.college_name, [0.0] * self._lda.num_topics)
+            for topic_id, p in self._lda.get_document_topics(bow, minimum_probability=0.0):
+                totals[topic_id] += float(p)
+        return mass
+
+    # ---- training ----
+    def _needs_retrain(self):
+        state = self._state
+        if self._lda is None or state is None:
+            return True
+        if state.get("nlp_version") != nlp_version():
+            return True
+        seen = db.session.query(db.func.count(Review.id)).filter(Review.id <= state["last_id"]).scalar()
+        if seen != state["reviews_seen"]:
+            return True  # reviews were deleted under us
+        if state["docs"] >= state["docs_at_train"] * (1 + self.retrain_ratio):
+            return True
+        if len(self._dictionary) >= state["vocab_at_train"] * (1 + self.retrain_vocab_ratio):
+            return True
+        return time.time() - state["trained_at"] >= self.retrain_every
+
+    def retrain(self):
+        """Train from scratch on every review (needs an app context). Returns the doc count."""
+        with self._lock:
+            return self._retrain()
+
+    def _retrain(self):
+        from gensim import corpora
+        from gensim.models import LdaModel, LdaMulticore
+
+        all_docs, last_id = [], 0
+        for last_id, docs in self._documents():
+            all_docs.extend(docs)
+        if len(all_docs) < 3:
+            self._lda = self._dictionary = self._state = None
+            return len(all_docs)
+
+        dictionary = corpora.Dictionary(tokens for _, tokens in all_docs)
+        corpus = [dictionary.doc2bow(tokens) for _, tokens in all_docs]
+        num_topics = max(1, min(self.num_topics, len(corpus)))
+        with metrics.span("lda_train", items=len(corpus)):
+            if self.workers > 1:
+                lda = LdaMulticore(corpus=corpus, id2word=dictionary, num_topics=num_topics,
+                                   random_state=42, passes=self.passes, workers=self.workers)
+            else:
+                lda = LdaModel(corpus=corpus, id2word=dictionary, num_topics=num_topics,
+                               random_state=42, passes=self.passes)
+
+        self._lda, self._dictionary = lda, dictionary
+        self._state = {
+            "nlp_version": nlp_version(),
+            "last_id": last_id,
+            "reviews_seen": db.session.query(db.func.count(Review.id)).filter(Review.id <= last_id).scalar(),
+            "docs": len(corpus),
+            "docs_at_train": len(corpus),
+            "vocab_at_train": len(dictionary),
+            "trained_at": time.time(),
+            "college_mass": self._college_mass(all_docs),
+        }
+        self._save()
+        return len(corpus)
+
+    def _update(self):
+        """Fold reviews newer than state["last_id"] into the model. Returns how many docs were added."""
+        added = 0
+        for last_id, docs in self._documents(after_id=self._state["last_id"]):
+            if docs:
+                self._dictionary.add_documents([tokens for _, tokens in docs])
+                known = self._lda.num_terms  # ids past this are new words the model has no column for
+                corpus = [[(i, n) for i, n in self._dictionary.doc2bow(tokens) if i < known]
+                          for _, tokens in docs]
+                corpus = [bow for bow in corpus if bow]
+                if corpus:
+                    with metrics.span("lda_update", items=len(corpus)):
+                        self._lda.update(corpus, passes=self.update_passes)
+                for college, totals in self._college_mass(docs).items():
+                    current = self._state["college_mass"].setdefault(college, [0.0] * len(totals))
+                    self._state["college_mass"][college] = [a + b for a, b in zip(current, totals)]
+                added += len(docs)
+            self._state["last_id"] = last_id
+            self._state["reviews_seen"] = (
+                db.session.query(db.func.count(Review.id)).filter(Review.id <= last_id).scalar())
+        self._state["docs"] += added
+        return added
+
+    def refresh(self):
+        """Bring the model up to date: online update with new reviews, or a full retrain if due."""
+        if not self.available:
+            return
+        with self._lock:
+            self._load()
+            if self._needs_retrain():
+                self.retrain()
+                return
+            if self._update():
+                if self._needs_retrain():  # the delta may have pushed us over a threshold
+                    self.retrain()
+                else:
+                    self._save()
+
+    # ---- reads ----
+    def topic_terms(self, num_words=5):
+        """Display terms of every topic (what print_topics gave the old per-refresh model)."""
+        with self._lock:
+            if self._lda is None:
+                return None
+            return topic_terms_from_model(self._lda, range(self._lda.num_topics), num_words)
+
+    def college_topic_terms(self, college, num_topics=3, num_words=4):
+        """Terms of the topics that carry most of a college's reviews."""
+        with self._lock:
+            if self._lda is None:
+                return None
+            mass = self._state["college_mass"].get(college)
+            if not mass:
+                return []
+            top = sorted(range(len(mass)), key=lambda t: mass[t], reverse=True)[:num_topics]
+            return topic_terms_from_model(self._lda, top, num_words)
+
+
+topic_model = TopicModel()
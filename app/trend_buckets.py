@@ -0,0 +1,121 @@
+"""
+Time-bucketed term counts for "Trending Right Now".
+
+Every review's trending terms (the same lemmas + bigrams LDA sees) are counted once into
+term_bucket rows per (hour | day, college, term). Trending is an exponentially decayed sum
+over the buckets of a fixed window: hourly buckets for the last `hourly_days` days, daily
+buckets before that back to `window_days`. A refresh therefore reads a bounded number of
+buckets and folds in only the reviews added since the last one, whatever the corpus size.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from .models import Review, TermBucket, PipelineCheckpoint
+from .nlp_utils import review_documents
+
+_CHECKPOINT = "trend-buckets"
+
+
+def _truncate(ts, granularity):
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def fold_new_reviews(chunk_size=1000, now=None):
+    """
+    Count the terms of reviews added since the last call into term_bucket (commits per chunk).
+    Reviews without a timestamp are skipped; migrate_schema gives the ones from before
+    created_at existed the migration time, so after an upgrade they count as of then.
+    The checkpoint is advanced with a compare-and-set in the same transaction, so two workers
+    refreshing at once can't count the same reviews twice. Returns how many reviews were folded.
+    """
+    now = now or datetime.utcnow()
+    checkpoint = db.session.get(PipelineCheckpoint, _CHECKPOINT)
+    if checkpoint is None:
+        db.session.execute(sqlite_insert(PipelineCheckpoint).values(name=_CHECKPOINT, last_id=0)
+                           .on_conflict_do_nothing(index_elements=["name"]))
+        db.session.commit()
+        checkpoint = db.session.get(PipelineCheckpoint, _CHECKPOINT)
+    last_id = checkpoint.last_id
+
+    folded = 0
+    while True:
+        chunk = Review.query.filter(Review.id > last_id).order_by(Review.id).limit(chunk_size).all()
+        if not chunk:
+            return folded
+
+        counts = Counter()
+        for review, tokens in review_documents([r for r in chunk if r.created_at is not None]):
+            terms = Counter(tokens)
+            for granularity in ("hour", "day"):
+                bucket = _truncate(review.created_at, granularity)
+                for term, n in terms.items():
+                    counts[(granularity, bucket, review.college_name, term[:200])] += n
+
+        claimed = PipelineCheckpoint.query.filter_by(name=_CHECKPOINT, last_id=last_id).update(
+            {"last_id": chunk[-1].id, "updated_at": now}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()  # another worker folded this range first
+            return folded
+        if counts:
+            stmt = sqlite_insert(TermBucket)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["granularity", "bucket_start", "college_name", "term"],
+                set_={"count": TermBucket.count + stmt.excluded.count},
+            )
+            db.session.execute(stmt, [
+                {"granularity": g, "bucket_start": b, "college_name": c, "term": t, "count": n}
+                for (g, b, c, t), n in counts.items()
+            ])
+        db.session.commit()
+        last_id = chunk[-1].id
+        folded += len(chunk)
+
+
+def prune(now=None, hourly_days=2, window_days=30):
+    """Drop buckets that have fallen out of every window (commits)."""
+    now = now or datetime.utcnow()
+    hour_cutoff = _truncate(now - timedelta(days=hourly_days + 1), "day")
+    day_cutoff = _truncate(now - timedelta(days=window_days + 1), "day")
+    TermBucket.query.filter(TermBucket.granularity == "hour", TermBucket.bucket_start < hour_cutoff).delete()
+    TermBucket.query.filter(TermBucket.granularity == "day", TermBucket.bucket_start < day_cutoff).delete()
+    db.session.commit()
+
+
+def reset():
+    """Forget all buckets and start folding from the first review again (does NOT commit)."""
+    TermBucket.query.delete()
+    PipelineCheckpoint.query.filter_by(name=_CHECKPOINT).delete()
+
+
+def decayed_term_scores(now=None, half_life_hours=24.0, hourly_days=2, window_days=30):
+    """
+    {college_name: {term: score}} where each bucket's count is weighted by
+    0.5 ** (age of the bucket's midpoint / half_life). The recent `hourly_days` days come
+    from hourly buckets, older days (up to `window_days`) from daily ones, with no overlap.
+    """
+    now = now or datetime.utcnow()
+    split = _truncate(now - timedelta(days=hourly_days), "day")
+    start = _truncate(now - timedelta(days=window_days), "day")
+    decay = math.log(2) / (half_life_hours * 3600.0)
+
+    rows = TermBucket.query.with_entities(
+        TermBucket.granularity, TermBucket.bucket_start, TermBucket.college_name, TermBucket.term, TermBucket.count,
+    ).filter(db.or_(
+        db.and_(TermBucket.granularity == "hour", TermBucket.bucket_start >= split),
+        db.and_(TermBucket.granularity == "day", TermBucket.bucket_start >= start, TermBucket.bucket_start < split),
+    ))
+
+    scores = defaultdict(Counter)
+    weights = {}
+    for granularity, bucket_start, college_name, term, count in rows:
+        weight = weights.get((granularity, bucket_start))
+        if weight is None:
+            width = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+            age = max(0.0, (now - (bucket_start + width / 2)).total_seconds())
+            weight = weights[(granularity, bucket_start)] = math.exp(-decay * age)
+        scores[college_name][term] += count * weight
+    return scores
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from . import trend_buckets
+from .nlp_utils import rank_hashtags
+from .theme_engine import theme_engine
+from .topic_model import topic_model
+
+
+class TrendingCache:
+    """
+    Keeps the last computed trending hashtags (global + per college) in memory.
+
+    Readers never run spaCy/LDA: get() returns whatever was computed last and, if the
+    result is older than `ttl_seconds` or at least `min_new_reviews` reviews have arrived
+    since, kicks off a refresh on a background thread. Only one refresh runs at a time.
+    A refresh folds the new reviews into the time buckets (see trend_buckets) and ranks terms
+    by their decayed recent counts, so "trending" means recent, not all-time.
+    """
+
+    def __init__(self, ttl_seconds=600, min_new_reviews=5, half_life_hours=24.0, window_days=30, topics="lda"):
+        self.ttl_seconds = ttl_seconds
+        self.min_new_reviews = min_new_reviews
+        self.half_life_hours = half_life_hours  # a term mentioned this long ago counts half
+        self.window_days = window_days          # older buckets are ignored (and pruned)
+        self.topics = topics                    # where topic terms come from: "lda" | "themes"
+        self._app = None
+        self._lock = threading.Lock()
+        self._global = []
+        self._per_college = {}
+        self._refreshed_at = None  # None = never computed
+        self._new_reviews = 0
+        self._refreshing = False
+        self._generation = 0  # bumped by invalidate() so an in-flight refresh can't resurrect old data
+        self._fingerprint = _fingerprint([], {})  # hash of the served hashtags (part of cached page keys)
+
+    def init_app(self, app):
+        self._app = app
+        self.ttl_seconds = app.config.get("TRENDING_TTL_SECONDS", self.ttl_seconds)
+        self.min_new_reviews = app.config.get("TRENDING_MIN_NEW_REVIEWS", self.min_new_reviews)
+        self.half_life_hours = app.config.get("TRENDING_HALF_LIFE_HOURS", self.half_life_hours)
+        self.window_days = app.config.get("TRENDING_WINDOW_DAYS", self.window_days)
+        self.topics = app.config.get("TRENDING_TOPICS", self.topics)
+
+    # ---- reads (O(1)) ----
+    def get_global(self):
+        self._maybe_refresh()
+        return self._global
+
+    def get_college(self, college_key):
+        self._maybe_refresh()
+        return self._per_college.get(college_key, [])
+
+    def fingerprint(self):
+        """
+        Hash of what get_global()/get_college() return. It depends only on the hashtags, so it
+        is the same in every worker (and across restarts) that serves the same trending state.
+        """
+        self._maybe_refresh()
+        return self._fingerprint
+
+    # ---- write-side hooks ----
+    def note_new_review(self, college_key=None):
+        with self._lock:
+            self._new_reviews += 1
+        self._maybe_refresh()
+
+    def invalidate(self):
+        """Forget everything (e.g. after /admin/clear_reviews) and recompute in the background."""
+        with self._lock:
+            self._global = []
+            self._per_college = {}
+            self._refreshed_at = None
+            self._new_reviews = 0
+            self._generation += 1
+            self._fingerprint = _fingerprint([], {})
+        self._maybe_refresh()
+
+    # ---- refresh ----
+    def _is_stale(self):
+        if self._refreshed_at is None:
+            return True
+        if self._new_reviews >= self.min_new_reviews:
+            return True
+        return time.monotonic() - self._refreshed_at >= self.ttl_seconds
+
+    def _maybe_refresh(self):
+        with self._lock:
+            if self._refreshing or not self._is_stale():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._run_refresh, name="trending-refresh", daemon=True).start()
+
+    def _run_refresh(self):
+        try:
+            with self._app.app_context():
+                self.refresh_now()
+        except Exception:
+            # keep serving the last good result; the TTL will trigger another attempt
+            self._app.logger.exception("Trending refresh failed")
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh_now(self):
+        """Recompute synchronously (needs an app context). Used by the worker and the CLI."""
+        with self._lock:
+            seen_new = self._new_reviews
+            generation = self._generation
+
+        now = datetime.utcnow()
+        trend_buckets.fold_new_reviews(now=now)  # only reviews added since the last refresh
+        trend_buckets.prune(now=now, window_days=self.window_days)
+        scores = trend_buckets.decayed_term_scores(
+            now=now, half_life_hours=self.half_life_hours, window_days=self.window_days)
+
+        # topic terms come from the persistent LDA model or the embedding themes, either one
+        # updated with just the new reviews
+        try:
+            (theme_engine if self.topics == "themes" else topic_model).refresh()
+        except Exception:
+            # topics are a nice-to-have: serve frequency + the last good model rather than nothing
+            self._app.logger.exception("Topic model refresh failed")
+
+        if self.topics == "themes":
+            global_terms = theme_engine.topic_terms(num_themes=5, num_words=3)
+            college_terms = lambda key: theme_engine.topic_terms(key, num_themes=3, num_words=3)  # noqa: E731
+        else:
+            global_terms = topic_model.topic_terms(num_words=5)
+            college_terms = lambda key: topic_model.college_topic_terms(key, num_topics=3, num_words=4)  # noqa: E731
+
+        global_scores = Counter()
+        for college_scores in scores.values():
+            global_scores.update(college_scores)
+        global_tags = rank_hashtags(_with_topic_terms(global_scores, global_terms))
+        per_college = {
+            college_key: rank_hashtags(_with_topic_terms(college_scores, college_terms(college_key)), top_n=3)
+            for college_key, college_scores in scores.items()
+        }
+
+        # swap in whole objects so readers never see a half-built result
+        with self._lock:
+            if generation != self._generation:
+                return  # invalidated while we were computing; the next read refreshes again
+            self._global = global_tags
+            self._per_college = per_college
+            self._refreshed_at = time.monotonic()
+            self._fingerprint = _fingerprint(global_tags, per_college)
+            self._new_reviews -= seen_new  # reviews that arrived mid-refresh still count
+
+
+def _fingerprint(global_tags, per_college):
+    payload = json.dumps([global_tags, per_college], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _with_topic_terms(scores, topic_terms):
+    """+1 per topic-term mention (as before), but only for terms that are actually recent."""
+    combined = Counter(scores)
+    for term in topic_terms or []:
+        if term in scores:
+            combined[term] += 1
+    return combined
+
+
+trending = TrendingCache()
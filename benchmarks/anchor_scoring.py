@@ -0,0 +1,88 @@
+"""
+Category-priority scoring: old per-category cos_sim loop vs. the precomputed anchor matrix.
+
+  - loop:     what get_priorities_from_text used to do (one cos_sim + mean per category)
+  - segment:  one (num_anchors x d) @ q matmul + np.add.reduceat segment mean
+  - centroid: one (num_categories x d) @ q matmul
+
+The query is encoded once up front, so this times only the scoring itself.
+Also checks that all three agree, and times a cold anchor load (encode) vs. a warm one (.npz).
+
+Usage (from the repo root):  python benchmarks/anchor_scoring.py [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import recommender_utils as ru  # noqa: E402
+from app.model_registry import get_sentence_model  # noqa: E402
+
+QUERIES = [
+    "I want strong academics and fun people",
+    "good food and a big meal plan",
+    "research internships and networking",
+    "sports teams, clubs and intramurals",
+    "quiet place to study with a chill vibe",
+]
+
+
+def legacy_scores(query_vec, per_category):
+    # same arithmetic as the old loop: mean of cos_sim(query, anchors) per category
+    scores = {}
+    for category, embeddings in per_category.items():
+        sims = (embeddings @ query_vec) / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_vec))
+        scores[category] = float(sims.mean())
+    return scores
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6  # µs per call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    model = get_sentence_model()
+
+    # cold vs warm anchor load
+    path = ru._anchor_cache_path()
+    if os.path.exists(path):
+        os.remove(path)
+    ru._anchor_matrix = None
+    t0 = time.perf_counter(); ru._ensure_anchors(); cold = time.perf_counter() - t0
+    ru._anchor_matrix = None
+    t0 = time.perf_counter(); ru._ensure_anchors(); warm = time.perf_counter() - t0
+    print(f"anchor load: cold (encode) {cold * 1000:.1f} ms, warm (.npz) {warm * 1000:.1f} ms")
+
+    # the old code kept one un-normalized embedding matrix per category
+    per_category = {c: model.encode(words) for c, words in ru.category_anchors.items()}
+    query_vecs = [ru.encode_query(q) for q in QUERIES]
+
+    worst = 0.0
+    for q in query_vecs:
+        ref = legacy_scores(q, per_category)
+        for mode in ("segment", "centroid"):
+            got = ru.anchor_scores(q, mode=mode)
+            worst = max(worst, max(abs(ref[c] - got[c]) for c in ref))
+    print(f"max |score difference| vs loop: {worst:.2e}")
+
+    for name, fn in (
+        ("loop", lambda: [legacy_scores(q, per_category) for q in query_vecs]),
+        ("segment", lambda: [ru.anchor_scores(q, mode="segment") for q in query_vecs]),
+        ("centroid", lambda: [ru.anchor_scores(q, mode="centroid") for q in query_vecs]),
+    ):
+        per_query = timed(fn, args.iterations) / len(query_vecs)
+        print(f"{name:>9}: {per_query:8.2f} µs/query")
+
+
+if __name__ == "__main__":
+    main()
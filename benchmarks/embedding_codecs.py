@@ -0,0 +1,92 @@
+"""
+Embedding storage codecs (f32 / f16 / int8) vs. the float32 baseline:
+
+  - size:    bytes per stored row and for the whole set, plus the size of a bulk .npz export
+  - load:    decoding every row blob (what EmbeddingIndex.rebuild does) vs. loading the .npz
+  - recall@k: overlap of each codec's top-k cosine neighbours with exact float32 search
+
+Vectors are synthetic by default (normalized, clustered like real review embeddings); pass
+--from-db to use the vectors in instance/database.db instead.
+
+Usage (from the repo root):  python benchmarks/embedding_codecs.py [--n 20000] [--k 10] [--from-db]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.embedding_codec import CODECS  # noqa: E402
+
+
+def synthetic_vectors(n, dim, clusters=50, seed=42):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vecs = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim))
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def db_vectors():
+    from app import create_app
+    from app.embedding_index import embedding_index
+    with create_app().app_context():
+        embedding_index.rebuild()
+        return np.asarray(embedding_index._matrix, dtype=np.float32)
+
+
+def top_k(matrix, queries, k):
+    scores = queries @ matrix.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--from-db", action="store_true")
+    args = parser.parse_args()
+
+    base = db_vectors() if args.from_db else synthetic_vectors(args.n, args.dim)
+    n, dim = base.shape
+    rng = np.random.default_rng(0)
+    queries = base[rng.integers(0, n, size=args.queries)] + 0.1 * rng.normal(size=(args.queries, dim))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    k = min(args.k, n)
+    exact = top_k(base, queries, k)
+    print(f"{n} vectors x {dim} dims, {args.queries} queries, recall@{k} vs exact float32\n")
+
+    print(f"{'codec':>5} {'B/row':>6} {'rows MB':>8} {'npz MB':>7} {'encode s':>9} "
+          f"{'decode rows s':>14} {'npz load s':>11} {'recall':>7}")
+    for codec in CODECS.values():
+        t0 = time.perf_counter()
+        blobs = [codec.encode(v) for v in base]
+        encode_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        decoded = np.vstack([codec.decode(b, dim) for b in blobs])
+        decode_s = time.perf_counter() - t0
+
+        buf = io.BytesIO()
+        np.savez(buf, **codec.encode_matrix(base))
+        npz_bytes = buf.tell()
+        buf.seek(0)
+        t0 = time.perf_counter()
+        with np.load(buf) as data:
+            from_npz = codec.decode_matrix(data)
+        npz_s = time.perf_counter() - t0
+        assert np.allclose(from_npz, decoded, atol=1e-6)
+
+        approx = top_k(decoded, queries, k)
+        recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)])
+        row_bytes = len(blobs[0])
+        print(f"{codec.name:>5} {row_bytes:>6} {row_bytes * n / 1e6:>8.2f} {npz_bytes / 1e6:>7.2f} "
+              f"{encode_s:>9.3f} {decode_s:>14.3f} {npz_s:>11.4f} {recall:>7.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Concurrent single-query encodes (what /recommend, /search and /generate_tags do per request),
+direct model.encode calls vs. the micro-batching EncodeBatcher:
+
+  - throughput: encodes/sec across --threads request threads
+  - latency:    p50 / p95 ms per call as seen by the caller (queue wait included)
+  - batches:    how many forward passes the batcher actually ran, and their mean size
+
+Runs MiniLM (or whatever ENCODER_BACKEND selects) by default; --offline uses the stub model
+from offline_models.py, whose cost is per text, so it only shows the batcher's own overhead.
+
+Usage (from the repo root):  python benchmarks/encode_batching.py [--threads 16] [--calls 50] [--max-wait-ms 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import model_registry  # noqa: E402
+from app.encode_service import EncodeBatcher  # noqa: E402
+
+QUERIES = ["good dorms", "cheap housing near campus", "strong engineering program", "quiet study spots",
+           "party school with great sports", "small classes and helpful professors", "good food"]
+
+
+def run(encode, threads, calls):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(i):
+        mine = []
+        barrier.wait()
+        for j in range(calls):
+            t0 = time.perf_counter()
+            encode(f"{QUERIES[(i + j) % len(QUERIES)]} {i} {j}")
+            mine.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {"per_s": len(latencies) / elapsed, "p50": statistics.median(latencies),
+            "p95": latencies[int(0.95 * (len(latencies) - 1))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=50, help="Encodes per thread.")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--offline", action="store_true", help="Use the stub model (no download).")
+    args = parser.parse_args()
+
+    if args.offline:
+        from offline_models import install
+        install()
+    model = model_registry.get_sentence_model()
+    model.encode(["warm up"])
+
+    calls = {"n": 0, "texts": 0}
+
+    def counted(texts, normalize=False):
+        calls["n"] += 1
+        calls["texts"] += len(texts)
+        return model_registry.encode_direct(texts, normalize)
+
+    batcher = EncodeBatcher(counted, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    total = args.threads * args.calls
+    print(f"{args.threads} threads x {args.calls} single-text encodes\n")
+    print(f"{'mode':>8} {'encodes/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'passes':>7} {'mean batch':>11}")
+
+    direct = run(lambda text: model.encode(text, normalize_embeddings=True), args.threads, args.calls)
+    print(f"{'direct':>8} {direct['per_s']:>10.1f} {direct['p50']:>8.2f} {direct['p95']:>8.2f} "
+          f"{total:>7} {1.0:>11.1f}")
+
+    batched = run(lambda text: batcher.encode(text, normalize_embeddings=True), args.threads, args.calls)
+    print(f"{'batched':>8} {batched['per_s']:>10.1f} {batched['p50']:>8.2f} {batched['p95']:>8.2f} "
+          f"{calls['n']:>7} {calls['texts'] / max(calls['n'], 1):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
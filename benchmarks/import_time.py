@@ -0,0 +1,65 @@
+"""
+How long does it take before the app can serve anything?
+
+Each measurement runs in a fresh interpreter so module caches don't leak between runs:
+  - import:      `from app import create_app; create_app()` (no models should load here)
+  - first_encode: the above + the first MiniLM encode (pays the model load)
+  - first_parse:  the above + the first spaCy parse
+Also reports peak RSS of each child.
+
+Usage (from the repo root):  python benchmarks/import_time.py [--repeat 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_SNIPPETS = {
+    "import": "",
+    "first_encode": "from app.model_registry import get_sentence_model; get_sentence_model().encode(['hello'])",
+    "first_parse": "from app.model_registry import get_nlp; get_nlp()('hello world')",
+}
+
+_CHILD = """
+import json, resource, time
+t0 = time.perf_counter()
+from app import create_app
+app = create_app()
+t1 = time.perf_counter()
+with app.app_context():
+    {snippet}
+t2 = time.perf_counter()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"create_app_s": t1 - t0, "total_s": t2 - t0, "peak_rss_mb": rss_kb / 1024}}))
+"""
+
+
+def run_once(name):
+    code = _CHILD.format(snippet=_SNIPPETS[name] or "pass")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    report = {}
+    for name in _SNIPPETS:
+        runs = [run_once(name) for _ in range(args.repeat)]
+        report[name] = {
+            key: round(statistics.median(r[key] for r in runs), 3)
+            for key in ("create_app_s", "total_s", "peak_rss_mb")
+        }
+        print(f"{name:>13}: create_app {report[name]['create_app_s']:.3f}s, "
+              f"total {report[name]['total_s']:.3f}s, peak RSS {report[name]['peak_rss_mb']:.0f} MB")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
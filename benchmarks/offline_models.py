@@ -0,0 +1,92 @@
+"""
+Deterministic stand-ins for MiniLM and spaCy so benchmarks run offline and without the model
+downloads. They are cheap, so timings with them measure the app's own code around the models.
+
+  install()  registers both with app.model_registry (drops any loaded copies)
+
+StubSentenceModel: hashed bag-of-words -> 384-dim normalized vectors (texts sharing words are
+similar, so search/recommend rankings still mean something). StubNLP: regex tokenizer with a
+small stopword list; every non-stopword is a NOUN and consecutive nouns form noun chunks.
+"""
+import hashlib
+import re
+import numpy as np
+
+DIM = 384
+_WORD = re.compile(r"[A-Za-z]+|[^\sA-Za-z]")
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "to", "of", "in", "on",
+    "for", "with", "at", "it", "its", "this", "that", "i", "me", "my", "we", "you", "they", "so",
+    "very", "really", "too", "as", "from", "by", "if", "not", "no", "can", "could", "would", "has",
+    "have", "had", "do", "does", "did", "there", "their", "all", "some", "more", "most", "just",
+}
+
+
+class StubSentenceModel:
+    max_seq_length = 256
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+        self._cache = {}
+
+    def _word_vec(self, word):
+        vec = self._cache.get(word)
+        if vec is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vec = self._cache[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vec
+
+    def _encode_one(self, text):
+        words = [w for w in _WORD.findall((text or "").lower()) if w.isalpha()]
+        vec = np.sum([self._word_vec(w) for w in words], axis=0) if words else np.zeros(self.dim, np.float32)
+        return vec.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **_):
+        single = isinstance(sentences, str)
+        vecs = np.stack([self._encode_one(s) for s in ([sentences] if single else sentences)]) \
+            if (single or len(sentences)) else np.zeros((0, self.dim), np.float32)
+        if normalize_embeddings and len(vecs):
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            vecs = vecs / np.where(norms == 0, 1.0, norms)
+        return vecs[0] if single else vecs
+
+
+class _Token:
+    __slots__ = ("text", "lemma_", "is_alpha", "is_stop", "pos_")
+
+    def __init__(self, text):
+        self.text = text
+        self.lemma_ = text[:-1] if len(text) > 3 and text.endswith("s") and not text.endswith("ss") else text
+        self.is_alpha = text.isalpha()
+        self.is_stop = text.lower() in STOP_WORDS
+        self.pos_ = "NOUN" if self.is_alpha and not self.is_stop else ("PUNCT" if not self.is_alpha else "DET")
+
+
+class _Doc(list):
+    @property
+    def noun_chunks(self):
+        chunk = []
+        for tok in self + [None]:
+            if tok is not None and tok.pos_ == "NOUN":
+                chunk.append(tok)
+                continue
+            if chunk:
+                yield chunk
+            chunk = []
+
+
+class StubNLP:
+    meta = {"name": "offline_stub", "version": "1"}
+
+    def __call__(self, text):
+        return _Doc(_Token(t) for t in _WORD.findall(text or ""))
+
+    def pipe(self, texts, batch_size=None, n_process=1, **_):
+        for text in texts:
+            yield self(text)
+
+
+def install():
+    from app import model_registry
+    model_registry.register_factory("sentence", StubSentenceModel)
+    model_registry.register_factory("spacy", StubNLP)
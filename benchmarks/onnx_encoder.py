@@ -0,0 +1,136 @@
+"""
+Sentence encoder backends (torch / onnx / onnx-int8) on CPU:
+
+  - parity:  cosine of each backend's normalized vectors against torch on the same texts
+             (min and mean; well above 0.99 for onnx, ~0.98+ for int8 is normal)
+  - load:    seconds to import + build the model, and process RSS once loaded
+  - latency: one short query per call (what /search and /recommend do), p50 / p95 ms
+  - batch:   texts/sec encoding review-length texts in batches of --batch-size
+
+Each backend runs in its own subprocess so load time and RSS aren't shared. Needs the export
+first:  flask export-onnx --quantize
+
+Exits 1 if a backend's minimum cosine is below --min-cosine (default 0.99 onnx, 0.98 onnx-int8).
+
+Usage (from the repo root):  python benchmarks/onnx_encoder.py [--backends torch,onnx,onnx-int8] [--n 512]
+                             [--min-cosine 0.99] [--onnx-dir instance/onnx/all-MiniLM-L6-v2]
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from app.model_registry import SENTENCE_MODEL_NAME  # noqa: E402
+from app.onnx_encoder import MIN_COSINE  # noqa: E402
+
+QUERIES = ["good dorms", "cheap housing near campus", "strong engineering program",
+           "party school with great sports", "small classes and helpful professors"]
+WORDS = ("the dorms are old but the people are friendly and professors care about teaching "
+         "parking is expensive dining hall food gets repetitive library open late engineering "
+         "workload heavy internships career fair clubs greek life quiet town bus system").split()
+
+
+def review_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=rng.integers(15, 120))) for _ in range(n)]
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def run_backend(backend, n, batch_size, repeat, out_path, onnx_dir):
+    """Child process: load one backend, time it, save its vectors for the parity check."""
+    from app import model_registry
+    t0 = time.perf_counter()
+    model_registry.configure_encoder(backend, onnx_dir=onnx_dir)
+    model = model_registry.get_sentence_model()
+    model.encode(["warm up"])
+    load_s = time.perf_counter() - t0
+    if backend != "torch" and not hasattr(model, "session"):
+        raise SystemExit(f"{backend}: no export found, run `flask export-onnx --quantize` first")
+
+    latencies = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        model.encode(QUERIES[i % len(QUERIES)], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    texts = review_texts(n)
+    t0 = time.perf_counter()
+    vecs = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    batch_s = time.perf_counter() - t0
+
+    np.save(out_path, np.asarray(vecs, dtype=np.float32))
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend, "load_s": round(load_s, 2), "rss_mb": round(rss_mb(), 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "texts_per_s": round(n / batch_s, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--n", type=int, default=512, help="Review-length texts for parity and throughput.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=200, help="Single-query calls for latency.")
+    parser.add_argument("--min-cosine", type=float, help="Fail below this min cosine vs torch (all backends).")
+    parser.add_argument("--onnx-dir", default=os.path.join(ROOT, "instance", "onnx", SENTENCE_MODEL_NAME),
+                        help="The `flask export-onnx` output (ONNX_MODEL_DIR).")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_backend(args.child, args.n, args.batch_size, args.repeat, args.vectors, args.onnx_dir)
+
+    backends = [b for b in args.backends.split(",") if b]
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for backend in backends:
+            path = os.path.join(tmp, f"{backend}.npy")
+            print(f"... {backend}", file=sys.stderr)
+            proc = subprocess.run([sys.executable, __file__, "--child", backend, "--vectors", path,
+                                   "--n", str(args.n), "--batch-size", str(args.batch_size),
+                                   "--repeat", str(args.repeat), "--onnx-dir", args.onnx_dir],
+                                  cwd=ROOT, capture_output=True, text=True)
+            if proc.returncode:
+                print(f"{backend}: failed\n{proc.stderr.strip()}", file=sys.stderr)
+                continue
+            results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[backend]["vectors"] = np.load(path)
+
+    reference = results.get("torch", {}).get("vectors")
+    print(f"{'backend':>10} {'load s':>7} {'RSS MB':>7} {'p50 ms':>7} {'p95 ms':>7} {'texts/s':>8} "
+          f"{'cos min':>8} {'cos mean':>9}")
+    failed = []
+    for backend, r in results.items():
+        if reference is not None:
+            cos = np.sum(reference * r["vectors"], axis=1)
+            parity = f"{cos.min():>8.4f} {cos.mean():>9.4f}"
+            threshold = MIN_COSINE.get(backend) if args.min_cosine is None else args.min_cosine
+            if threshold is not None and backend != "torch" and cos.min() < threshold:
+                failed.append(f"{backend} (min {cos.min():.4f} < {threshold})")
+        else:
+            parity = f"{'-':>8} {'-':>9}"
+        print(f"{backend:>10} {r['load_s']:>7} {r['rss_mb']:>7} {r['p50_ms']:>7} {r['p95_ms']:>7} "
+              f"{r['texts_per_s']:>8} {parity}")
+    if failed:
+        print(f"\nparity below threshold: {', '.join(failed)}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
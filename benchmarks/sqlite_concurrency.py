@@ -0,0 +1,127 @@
+"""
+Read throughput while a writer is active: default SQLite journaling vs. the tuned engine
+(WAL, synchronous=NORMAL, mmap, busy timeout + the (college_name, id) index).
+
+Each mode gets a fresh temp database seeded with --seed reviews. Then --readers threads
+run the profile-page query (latest 20 reviews of a college) and the aggregate read, while
+one writer thread inserts reviews the way college_profile does (review + aggregate, one commit).
+
+Usage (from the repo root):  python benchmarks/sqlite_concurrency.py [--seconds 5] [--readers 4]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import create_app, db  # noqa: E402
+from app.models import Review  # noqa: E402
+from app.aggregate_utils import apply_reviews, apply_review, get_aggregates  # noqa: E402
+
+COLLEGES = ["uc", "trinity", "victoria", "stmikes", "woods", "innis", "new"]
+
+
+def _review(rng):
+    return Review(
+        college_name=rng.choice(COLLEGES), user="bench", text="synthetic review text " * 5,
+        food=rng.randint(1, 10), social=rng.randint(1, 10), clubs=None,
+        study=rng.randint(1, 10), opportunities=None, tags="[]", rated_categories="[]",
+    )
+
+
+def run_mode(tuned, seed_rows, seconds, readers):
+    tmpdir = tempfile.mkdtemp(prefix="rmc-bench-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+        "SQLITE_TUNING": tuned,
+    })
+    rng = random.Random(0)
+    with app.app_context():
+        if not tuned:
+            db.session.execute(db.text("DROP INDEX IF EXISTS ix_review_college_id"))
+        for start in range(0, seed_rows, 5000):
+            batch = [_review(rng) for _ in range(min(5000, seed_rows - start))]
+            db.session.add_all(batch)
+            db.session.flush()
+            apply_reviews(batch)
+            db.session.commit()
+
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader(i):
+        local_rng = random.Random(i)
+        n = errors = 0
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    (Review.query.filter_by(college_name=local_rng.choice(COLLEGES))
+                     .order_by(Review.id.desc()).limit(20).all())
+                    get_aggregates()
+                    db.session.rollback()  # end the read transaction like a request would
+                    n += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+        with lock:
+            counts["reads"] += n
+            counts["errors"] += errors
+
+    def writer():
+        local_rng = random.Random(99)
+        n = errors = 0
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    review = _review(local_rng)
+                    db.session.add(review)
+                    db.session.flush()
+                    apply_review(review)
+                    db.session.commit()
+                    n += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+        with lock:
+            counts["writes"] += n
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        "reads_per_sec": round(counts["reads"] / seconds, 1),
+        "writes_per_sec": round(counts["writes"] / seconds, 1),
+        "errors": counts["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=20000, help="reviews to preload")
+    args = parser.parse_args()
+
+    report = {}
+    for name, tuned in (("default", False), ("tuned", True)):
+        report[name] = run_mode(tuned, args.seed, args.seconds, args.readers)
+        print(f"{name:>8}: {report[name]['reads_per_sec']} reads/s, "
+              f"{report[name]['writes_per_sec']} writes/s, {report[name]['errors']} errors")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Benchmark suite for the NLP, embedding and recommend hot paths.
+
+For each corpus size (default 1k, 10k, 100k reviews) a fresh temp SQLite database is seeded
+with synthetic reviews, then these are timed:
+
+  get_college_stats, extract_trending_hashtags (the per-call spaCy+LDA path), trending refresh,
+  extract_tags_from_text, get_priorities_from_text, batch_embed_all,
+  POST /recommend, GET / and GET /colleges through the Flask test client
+  (pages with the page cache off, and again with it on)
+
+Each benchmark reports p50/p95/mean latency, throughput and the process's peak RSS as JSON.
+Models are replaced by the deterministic stubs in offline_models.py unless --real-models,
+so the suite runs offline. Compare against a saved run with --baseline (p50 regressions
+beyond --tolerance are flagged, and --fail-on-regression makes them fail the run);
+--save-baseline writes this run's results for next time.
+
+Usage (from the repo root):
+  python benchmarks/suite.py [--sizes 1000 10000 100000] [--out results.json]
+                             [--baseline benchmarks/baseline.json] [--save-baseline PATH]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db  # noqa: E402
+from app.aggregate_utils import RATING_CATEGORIES, apply_reviews  # noqa: E402
+from app.embedding_index import embedding_index  # noqa: E402
+from app.embedding_utils import batch_embed_all  # noqa: E402
+from app.models import Review  # noqa: E402
+from app.nlp_utils import extract_tags_from_text, extract_trending_hashtags  # noqa: E402
+from app.page_cache import page_cache  # noqa: E402
+from app.recommender_engine import recommender  # noqa: E402
+from app.recommender_utils import get_priorities_from_text  # noqa: E402
+from app.routes import get_college_stats  # noqa: E402
+from app.theme_engine import theme_engine  # noqa: E402
+from app.topic_model import topic_model  # noqa: E402
+from app.trending import trending  # noqa: E402
+
+COLLEGES = ["uc", "trinity", "victoria", "stmikes", "woods", "innis", "new"]
+SUBJECTS = [
+    "dining hall food", "library study spaces", "residence community", "clubs fair", "research opportunities",
+    "quiet reading room", "meal plan", "frosh week events", "intramural sports teams", "career centre workshops",
+    "common room", "writing centre", "orientation leaders", "chapel choir", "student council",
+]
+VERDICTS = [
+    "was amazing and affordable", "felt crowded during exam season", "made it easy to meet people",
+    "is overpriced but convenient", "helped me land an internship", "could use better hours",
+    "has a really chill vibe", "is the best part of the college",
+]
+QUERIES = [
+    "I want strong academics and fun people", "good food and a big meal plan", "research internships",
+    "sports teams, clubs and intramurals", "quiet place to study with a chill vibe", "active social life",
+]
+
+
+def make_text(rng):
+    return " ".join(f"The {rng.choice(SUBJECTS)} {rng.choice(VERDICTS)}." for _ in range(rng.randint(1, 4)))
+
+
+def seed_reviews(n, seed=0, chunk_size=5000):
+    """Insert n synthetic reviews (+ aggregates) spread over the last 60 days."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for start in range(0, n, chunk_size):
+        rows = []
+        for _ in range(min(chunk_size, n - start)):
+            rated = rng.sample(RATING_CATEGORIES, rng.randint(3, 5))
+            row = {
+                "college_name": rng.choice(COLLEGES), "user": "bench", "text": make_text(rng),
+                "tags": json.dumps(rng.sample(SUBJECTS, 2)), "rated_categories": json.dumps(rated),
+                "created_at": now - timedelta(seconds=rng.randint(0, 60 * 24 * 3600)),
+            }
+            row.update({c: (rng.randint(1, 10) if c in rated else None) for c in RATING_CATEGORIES})
+            rows.append(row)
+        db.session.execute(Review.__table__.insert(), rows)
+        apply_reviews([SimpleNamespace(**row) for row in rows])
+        db.session.commit()
+
+
+def summarize(latencies, items=1):
+    ms = sorted(t * 1000 for t in latencies)
+    total = sum(latencies)
+    return {
+        "runs": len(ms),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "ops_per_sec": round(len(ms) / total, 2) if total else None,
+        "items_per_sec": round(items * len(ms) / total, 1) if total else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KB on Linux
+
+
+def timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def reset_singletons():
+    """Module-level caches outlive an app; forget whatever the previous corpus left in them."""
+    trending._global, trending._per_college, trending._refreshed_at = [], {}, None
+    trending._generation += 1
+    recommender._snapshot = None
+    embedding_index._loaded = False
+    embedding_index._reset()
+    topic_model._lda = topic_model._dictionary = topic_model._state = topic_model._pointer_mtime = None
+    theme_engine.reset()
+
+
+def run_size(n, repeat, tmpdir, skip):
+    workdir = tempfile.mkdtemp(prefix=f"{n}-", dir=tmpdir)
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "EMBEDDING_INDEX_PATH": os.path.join(workdir, "review_vectors.npy"),
+        "TOPIC_MODEL_PATH": os.path.join(workdir, "topic_model"),
+        # keep the suite's anchor/tag vectors out of instance/ (stub vectors must never be reused by the app)
+        "ANCHOR_CACHE_DIR": os.path.join(tmpdir, "anchor_cache"),
+        "TAG_STORE_PATH": os.path.join(tmpdir, "tag_embeddings.npz"),
+        "POSTPROCESS_ASYNC": False,
+        "TRENDING_TTL_SECONDS": 10 ** 9,   # refreshes only when the suite asks for one
+        "TRENDING_MIN_NEW_REVIEWS": 10 ** 9,
+        "PAGE_CACHE": "memory",
+    })
+    reset_singletons()
+    results = {}
+    heavy = max(1, min(repeat, 3))  # full-corpus trending runs are slow at 100k
+
+    def bench(name, fn, runs, items=1, warmup=1):
+        if name in skip:
+            return
+        results[name] = summarize(timed(fn, runs, warmup=warmup), items=items)
+        r = results[name]
+        print(f"  {name:<34} p50 {r['p50_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms  "
+              f"{r['ops_per_sec'] or 0:>9.1f}/s  rss {r['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        seed_reviews(n)
+        print(f"{n} reviews seeded in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        rng = random.Random(1)
+        sample_texts = [make_text(rng) for _ in range(200)]
+        reviews = Review.query.all()
+
+        bench("get_college_stats", get_college_stats, repeat)
+        bench("extract_trending_hashtags", lambda: extract_trending_hashtags(reviews), heavy)  # warmup parses tokens
+        bench("trending.refresh_now", trending.refresh_now, heavy)
+        texts = iter(sample_texts * (repeat + 2))
+        bench("extract_tags_from_text", lambda: extract_tags_from_text(next(texts)), repeat)
+        queries = iter(QUERIES * (repeat + 2))
+        bench("get_priorities_from_text", lambda: get_priorities_from_text(next(queries)), repeat)
+        bench("batch_embed_all", lambda: batch_embed_all(force=True), 1, items=n, warmup=0)
+        del reviews
+
+    client = app.test_client()
+    queries = iter(QUERIES * (repeat + 2))
+    bench("POST /recommend", lambda: client.post("/recommend", data={
+        "query": next(queries), "priority_categories": ["food", "study"]}), repeat)
+    for cached in (False, True):
+        page_cache.enabled = cached
+        suffix = " (page cache)" if cached else ""
+        bench(f"GET /{suffix}", lambda: client.get("/"), repeat)
+        bench(f"GET /colleges{suffix}", lambda: client.get("/colleges"), repeat)
+    page_cache.enabled = True
+    return results
+
+
+def compare(results, baseline, tolerance, floor_ms=1.0):
+    """[(size, name, base_p50, p50, ratio)] for p50 latencies that got worse than tolerance allows."""
+    regressions = []
+    for size, benches in results.items():
+        for name, r in benches.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            ratio = r["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("inf")
+            if ratio > 1 + tolerance and r["p50_ms"] - base["p50_ms"] > floor_ms:
+                regressions.append((size, name, base["p50_ms"], r["p50_ms"], round(ratio, 2)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark (full-corpus trending ones cap at 3)")
+    parser.add_argument("--skip", nargs="*", default=[], help="benchmark names to leave out")
+    parser.add_argument("--real-models", action="store_true", help="load MiniLM/spaCy instead of the offline stubs")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare p50 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--save-baseline", help="also write this run's results as a baseline file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="rmc-suite-")
+    if not args.real_models:
+        import offline_models
+        offline_models.install()
+
+    results = {}
+    for n in args.sizes:
+        results[str(n)] = run_size(n, args.repeat, tmpdir, set(args.skip))
+
+    report = {
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "models": "real" if args.real_models else "offline stubs",
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("models") != report["meta"]["models"]:
+            print(f"⚠ baseline used {baseline.get('meta', {}).get('models')} models; comparison is apples to oranges",
+                  file=sys.stderr)
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        report["regressions"] = [
+            {"size": s, "benchmark": b, "baseline_p50_ms": old, "p50_ms": new, "ratio": ratio}
+            for s, b, old, new, ratio in regressions
+        ]
+        for s, b, old, new, ratio in regressions:
+            print(f"❌ {b} @ {s}: p50 {old} ms -> {new} ms ({ratio}x)", file=sys.stderr)
+        if not regressions:
+            print(f"✅ no p50 regressions beyond {args.tolerance:.0%} vs {args.baseline}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
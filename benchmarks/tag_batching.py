@@ -0,0 +1,76 @@
+"""
+Tag generation for a bulk import: one extract_tags_from_text call per text (what N
+/generate_tags requests cost) vs. extract_tags_batch (one nlp.pipe pass, duplicates parsed once).
+
+Texts are synthetic review-like comments built from a fixed seed; --duplicates controls what
+fraction of them repeat an earlier text (scraped threads often quote each other).
+Also checks that both paths return the same tags.
+
+Usage (from the repo root):  python benchmarks/tag_batching.py [--texts 1000] [--batch-size 64]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.model_registry import get_nlp  # noqa: E402
+from app.nlp_utils import extract_tags_from_text, extract_tags_batch  # noqa: E402
+
+OPENERS = ["Honestly", "Overall", "As a commuter", "In first year", "Coming from residence", "Tbh"]
+SUBJECTS = [
+    "the dining hall food", "the library study spaces", "the residence community", "the clubs fair",
+    "the research opportunities", "the quiet reading room", "the meal plan", "the frosh week events",
+    "the intramural sports teams", "the career centre workshops",
+]
+VERDICTS = [
+    "was amazing and really affordable", "felt crowded during exam season", "made it easy to meet people",
+    "is overpriced but convenient", "helped me land a summer internship", "could use better hours",
+]
+
+
+def make_texts(n, duplicates, seed=42):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        if texts and rng.random() < duplicates:
+            texts.append(rng.choice(texts))
+            continue
+        sentences = [
+            f"{rng.choice(OPENERS)}, {rng.choice(SUBJECTS)} {rng.choice(VERDICTS)}."
+            for _ in range(rng.randint(1, 4))
+        ]
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Fraction of texts that repeat.")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.duplicates)
+    get_nlp()("warm up")  # don't bill the model load to either side
+
+    t0 = time.perf_counter()
+    single = [extract_tags_from_text(t) for t in texts]
+    per_text = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batched = extract_tags_batch(texts, batch_size=args.batch_size)
+    batch = time.perf_counter() - t0
+
+    mismatches = sum(a != b for a, b in zip(single, batched))
+    print(f"{len(texts)} texts ({len(set(t.lower() for t in texts))} unique), batch_size={args.batch_size}")
+    print(f"mismatched tag lists: {mismatches}")
+    for name, seconds in (("per-text", per_text), ("batched", batch)):
+        print(f"{name:>9}: {seconds:7.2f} s  ({len(texts) / seconds:8.1f} texts/sec)")
+    print(f"  speedup: {per_text / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Embedding themes (app/theme_engine.py) vs. the spaCy + LDA hashtags, on a fixture corpus with
+planted themes (food, study, social, sports, careers, housing; uneven sizes, several colleges):
+
+  - coverage: how many planted themes show up in the top-N output
+  - redundancy: outputs that repeat a theme already covered (lower is better)
+  - purity:   for the k-means clusters, the share of each cluster's reviews from its majority
+              theme (size-weighted)
+  - time:     extract_trending_hashtags (parse + LDA per call), a TopicModel retrain, a full theme
+              fit, and a theme refresh after 1% new reviews land (the incremental path)
+
+Runs on a temp database with the offline stub models unless --real-models.
+
+Usage (from the repo root):  python benchmarks/theme_quality.py [--n 5000] [--top-n 6] [--real-models]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db  # noqa: E402
+from app import tag_index  # noqa: E402
+from app.embedding_index import embedding_index  # noqa: E402
+from app.embedding_utils import batch_embed_all  # noqa: E402
+from app.models import Review  # noqa: E402
+from app.nlp_utils import extract_trending_hashtags  # noqa: E402
+from app.theme_engine import minibatch_kmeans, theme_engine  # noqa: E402
+from app.topic_model import topic_model  # noqa: E402
+
+THEMES = {
+    "food": ["dining hall food", "meal plan", "cafeteria coffee", "late night pizza"],
+    "study": ["library study spaces", "quiet reading room", "writing centre", "exam cram sessions"],
+    "social": ["frosh week events", "common room parties", "student council", "orientation leaders"],
+    "sports": ["intramural sports teams", "varsity hockey games", "gym hours", "rowing club"],
+    "careers": ["career centre workshops", "research opportunities", "coop placements", "alumni mentors"],
+    "housing": ["residence rooms", "dorm laundry", "roommate matching", "housing lottery"],
+}
+WEIGHTS = {"food": 5, "study": 4, "social": 3, "sports": 2, "careers": 2, "housing": 1}
+VERDICTS = ["was amazing", "felt crowded", "made it easy to meet people", "is overpriced",
+            "could use better hours", "has a chill vibe", "is the best part of the year"]
+COLLEGES = ["uc", "trinity", "victoria", "stmikes", "woods"]
+GENERIC = {"college", "campus", "student", "students", "the", "and"}
+
+
+def theme_words():
+    return {theme: {w for phrase in phrases for w in phrase.split()} - GENERIC for theme, phrases in THEMES.items()}
+
+
+def make_review(rng):
+    theme = rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()))[0]
+    subjects = rng.sample(THEMES[theme], rng.randint(1, 3))
+    text = " ".join(f"The {s} {rng.choice(VERDICTS)}." for s in subjects)
+    return theme, text, subjects
+
+
+def seed(n, rng):
+    """Insert n fixture reviews; returns {review_id: planted theme}."""
+    now = datetime.utcnow()
+    planted, rows = [], []
+    for _ in range(n):
+        theme, text, subjects = make_review(rng)
+        planted.append(theme)
+        rows.append({"college_name": rng.choice(COLLEGES), "user": "bench", "text": text,
+                     "tags": json.dumps(subjects), "rated_categories": "[]",
+                     "created_at": now - timedelta(hours=rng.randint(0, 24 * 30))})
+    ids = db.session.scalars(insert(Review).returning(Review.id, sort_by_parameter_order=True), rows).all()
+    tag_index.sync_reviews([SimpleNamespace(id=i, **row) for i, row in zip(ids, rows)], new=True)
+    db.session.commit()
+    return dict(zip(ids, planted))
+
+
+def covered(terms):
+    """(planted themes hit by `terms`, how many terms repeated a theme or hit none)."""
+    words = theme_words()
+    hit, wasted = set(), 0
+    for term in terms:
+        term_words = set(term.lstrip("#").split()) - GENERIC
+        themes = {t for t, vocab in words.items() if term_words & vocab}
+        if not themes or themes <= hit:
+            wasted += 1
+        hit |= themes
+    return hit, wasted
+
+
+def purity(planted_ids, ids, assign):
+    by_cluster = {}
+    for review_id, cluster in zip(ids, assign):
+        by_cluster.setdefault(cluster, Counter())[planted_ids[int(review_id)]] += 1
+    return sum(c.most_common(1)[0][1] for c in by_cluster.values()) / max(1, len(ids))
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=5000)
+    parser.add_argument("--top-n", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true")
+    args = parser.parse_args()
+
+    if not args.real_models:
+        from offline_models import install
+        install()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'themes.db')}",
+            "EMBEDDING_INDEX_PATH": os.path.join(tmp, "review_vectors.npy"),
+            "TOPIC_MODEL_PATH": os.path.join(tmp, "topic_model"),
+            "ANCHOR_CACHE_DIR": tmp,
+            "TAG_STORE_PATH": os.path.join(tmp, "tag_embeddings.npz"),
+            "POSTPROCESS_ASYNC": False,
+        })
+        rng = random.Random(args.seed)
+        with app.app_context():
+            planted = seed(args.n, rng)
+            batch_embed_all()
+            embedding_index.rebuild()
+            reviews = Review.query.all()
+            extract_trending_hashtags(reviews)  # parses and caches tokens, so the timing below is LDA-dominated
+
+            lda_tags, lda_ms = timed(lambda: extract_trending_hashtags(reviews, top_n=args.top_n))
+            retrain_ms = None
+            if topic_model.available:
+                _, retrain_ms = timed(topic_model.retrain)
+            _, fit_ms = timed(theme_engine.fit)
+            theme_tags = theme_engine.hashtags(top_n=args.top_n)
+
+            planted.update(seed(max(1, args.n // 100), rng))
+            batch_embed_all()
+            _, refresh_ms = timed(theme_engine.refresh)
+
+            matrix, ids, _ = embedding_index.snapshot()
+            _, assign = minibatch_kmeans(matrix, theme_engine.k)
+            cluster_purity = purity(planted, ids, assign)
+
+    print(f"{args.n} reviews, {len(THEMES)} planted themes, top {args.top_n}\n")
+    for name, tags in (("spaCy+LDA", lda_tags), ("themes", theme_tags)):
+        hit, wasted = covered(tags)
+        print(f"{name:>10}: coverage {len(hit)}/{len(THEMES)}  redundant/off-theme {wasted}  {' '.join(tags)}")
+    print(f"\n{'k-means purity':>26}: {cluster_purity:.3f} (k={theme_engine.k})")
+    print(f"{'extract_trending_hashtags':>26}: {lda_ms:9.1f} ms")
+    if retrain_ms is not None:
+        print(f"{'TopicModel.retrain':>26}: {retrain_ms:9.1f} ms")
+    print(f"{'ThemeEngine.fit':>26}: {fit_ms:9.1f} ms")
+    print(f"{'ThemeEngine.refresh (+1%)':>26}: {refresh_ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
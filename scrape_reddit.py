@@ -1,3 +1,5 @@
+import argparse
+import json
 import praw
 
 reddit = praw.Reddit(
@@ -12,12 +14,32 @@ search_terms = [
     "St. Mike's UofT", "Victoria College UofT"
 ]
 
+parser = argparse.ArgumentParser(description="Search r/uoft for college threads.")
+parser.add_argument("--out", help="Append one JSON record per submission here (for `flask ingest`).")
+parser.add_argument("--limit", type=int, default=5, help="Submissions per search term.")
+args = parser.parse_args()
+
+out = open(args.out, "a", encoding="utf-8") if args.out else None
 for term in search_terms:
     print(f"🔍 Searching for: {term}")
-    for submission in reddit.subreddit("uoft+UofT").search(term, sort="top", time_filter="year", limit=5):
+    for submission in reddit.subreddit("uoft+UofT").search(term, sort="top", time_filter="year", limit=args.limit):
+        if out:
+            out.write(json.dumps({
+                "id": submission.id,
+                "search_term": term,
+                "title": submission.title,
+                "selftext": submission.selftext,
+                "author": str(submission.author) if submission.author else None,
+                "score": submission.score,
+                "url": submission.url,
+                "created_utc": submission.created_utc,
+            }) + "\n")
+            continue
         print("------------------------------------------------")
         print("Title:", submission.title)
         print("Upvotes:", submission.score)
         print("URL:", submission.url)
         print("Text:", submission.selftext)
         print()
+if out:
+    out.close()